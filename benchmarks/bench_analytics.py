@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+'''
+比较 dict 列表上的纯 Python 统计与 ColumnBatch 上的向量化统计（realtime.analytics）：
+按发送者计数、按小时统计活跃度、对话内的回复间隔。同时比较两种形式占用的内存，
+并检查两种方式的结果一致。
+
+消息为合成数据，字段与 stub 服务返回的一致。
+
+    python benchmarks/bench_analytics.py [--messages 1000000] [--conversations 2000]
+'''
+
+import argparse
+import collections
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from realtime.analytics import counts_by_sender, hourly_activity, response_gaps  # noqa: E402
+from realtime.columnar import ColumnBatch  # noqa: E402
+
+from stub_server import HISTORY_START  # noqa: E402
+
+
+def make_messages(count, conversations, senders, seed=1):
+    rng = random.Random(seed)
+    timestamp = HISTORY_START
+    messages = []
+    for index in range(count):
+        timestamp += rng.randint(1, 5000)
+        convid = '%024x' % rng.randint(0, conversations - 1)
+        messages.append({
+            'timestamp': timestamp,
+            'conv-id': convid,
+            'data': 'x' * rng.randint(1, 200),
+            'from': 'user%d' % rng.randint(0, senders - 1),
+            'from-ip': '127.0.0.1',
+            'msg-id': '%022x' % index,
+            'is-conv': True,
+            'is-room': False,
+            'to': convid,
+            'bin': False,
+        })
+    return messages
+
+
+def dict_counts_by_sender(messages):
+    return collections.Counter(message['from'] for message in messages)
+
+
+def dict_hourly_activity(messages):
+    hours = [0] * 24
+    for message in messages:
+        hours[(message['timestamp'] // 3600000) % 24] += 1
+    return hours
+
+
+def dict_response_gaps(messages):
+    by_conversation = collections.defaultdict(list)
+    for message in messages:
+        by_conversation[message['conv-id']].append((message['timestamp'], message['from']))
+    gaps = {}
+    for convid, entries in by_conversation.items():
+        entries.sort()
+        replies = [later[0] - earlier[0] for earlier, later in zip(entries, entries[1:])
+                   if later[1] != earlier[1]]
+        if replies:
+            gaps[convid] = replies
+    return gaps
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+
+def measure_memory(factory):
+    gc.collect()
+    tracemalloc.start()
+    value = factory()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--conversations', type=int, default=2000)
+    parser.add_argument('--senders', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    messages, dict_bytes = measure_memory(
+        lambda: make_messages(args.messages, args.conversations, args.senders))
+    batch, build_seconds = timed(ColumnBatch.from_messages, messages)
+    _, batch_bytes = measure_memory(lambda: ColumnBatch.from_messages(messages))
+
+    print('%-22s %12s %12s %8s %6s' % ('aggregate', 'dicts s', 'columnar s', 'speedup',
+                                       'match'))
+    cases = [
+        ('counts_by_sender', dict_counts_by_sender, counts_by_sender,
+         lambda a, b: dict(a) == b),
+        ('hourly_activity', dict_hourly_activity, hourly_activity,
+         lambda a, b: list(a) == [int(value) for value in b]),
+        ('response_gaps', dict_response_gaps, response_gaps,
+         lambda a, b: a.keys() == b.keys() and
+         all(list(a[key]) == b[key].tolist() for key in a)),
+    ]
+    for name, baseline, vectorized, same in cases:
+        expected, baseline_seconds = timed(baseline, messages)
+        result, seconds = timed(vectorized, batch)
+        print('%-22s %12.3f %12.3f %8.1f %6s' % (
+            name, baseline_seconds, seconds, baseline_seconds / seconds,
+            'yes' if same(expected, result) else 'NO'))
+
+    print('')
+    print('build ColumnBatch from dicts: %.3f s' % build_seconds)
+    print('memory: dicts %.1f MB, ColumnBatch %.1f MB' % (
+        dict_bytes / 1e6, batch_bytes / 1e6))
+
+
+if __name__ == '__main__':
+    main()
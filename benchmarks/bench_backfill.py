@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+'''
+比较串行翻页（iter_messages）与按时间分片并行回填（backfill_messages）的耗时。
+
+stub 为单个对话生成 --messages 条记录，每个请求增加 --latency 秒延迟；并检查并行回填
+返回的消息与串行翻页完全一致（包括顺序）。
+
+    python benchmarks/bench_backfill.py [--messages 20000] [--latency 0.01] [--workers 1 4 16]
+'''
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from realtime.client import RealtimeAPI, Conversation  # noqa: E402
+
+from stub_server import (StubServer, StubConfig, HISTORY_START,  # noqa: E402
+                         HISTORY_STEP)
+
+CONVID = '58dcd5c31b69e60062aee271'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--page-size', type=int, default=200)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    args = parser.parse_args(argv)
+
+    newest = HISTORY_START + 1000000 * HISTORY_STEP
+    since = newest - (args.messages - 1) * HISTORY_STEP
+    until = newest + 1
+    config = StubConfig(latency=args.latency, history_size=args.messages)
+    with StubServer(config=config) as server:
+        client = RealtimeAPI(app_id='bench', app_key='key', master_key='master',
+                             host=server.host, protocol='http',
+                             pool_maxsize=max(args.workers))
+        conversation = Conversation(client, CONVID)
+
+        start = time.time()
+        expected = [message['msg-id'] for message in conversation.iter_messages(
+            since=since, until=until, page_size=args.page_size)]
+        sequential = time.time() - start
+
+        print('%-24s %8s %10s %8s %8s' % ('mode', 'messages', 'seconds', 'speedup', 'match'))
+        print('%-24s %8d %10.2f %8.1f %8s' % ('iter_messages', len(expected), sequential,
+                                             1.0, 'yes'))
+        for workers in args.workers:
+            backfill = conversation.backfill_messages(since, until, workers=workers,
+                                                      page_size=args.page_size)
+            start = time.time()
+            received = [message['msg-id'] for message in backfill]
+            elapsed = time.time() - start
+            print('%-24s %8d %10.2f %8.1f %8s' % (
+                'backfill workers=%d' % workers, len(received), elapsed,
+                sequential / elapsed, 'yes' if received == expected else 'NO'))
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
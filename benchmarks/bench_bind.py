@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+'''
+bind_method 每次调用在客户端的开销（参数处理、路径、鉴权头与 URL 拼接），不发出网络请求。
+
+    python benchmarks/bench_bind.py [--number 100000]
+    python benchmarks/bench_bind.py --save-baseline bind.json   # 保存基线
+    python benchmarks/bench_bind.py --compare bind.json         # 与基线对比，变慢超过阈值时返回 1
+
+--root 从另一份源码导入 realtime，用于和改动前的版本对比：
+
+    git worktree add /tmp/realtime-before <commit>
+    python benchmarks/bench_bind.py --root /tmp/realtime-before --save-baseline before.json
+    python benchmarks/bench_bind.py --compare before.json
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+import timeit
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CASES = [
+    ('send_message', {'json_body': {'from_peer': 'sys', 'conv_id': '58dcd5c31b69e60062aee271',
+                                    'message': 'hello', 'transient': False}}),
+    ('manage_members', {'convid': '58dcd5c31b69e60062aee271',
+                        'json_body': {'m': {'__op': 'AddUnique', 'objects': ['a', 'b']}}}),
+    ('query_message', {'convid': '58dcd5c31b69e60062aee271', 'limit': 20}),
+    ('query_all_message', {'limit': 1000}),
+    ('delete_message', {'convid': '58dcd5c31b69e60062aee271',
+                        'msgid': 'jQTrEDQHQu+UEAzL4vq6dw', 'timestamp': 1490950859958}),
+]
+
+
+def run_cases(number, repeat):
+    from realtime.client import RealtimeAPI
+
+    api = RealtimeAPI(app_id='bench-app-id', app_key='bench-app-key',
+                      master_key='bench-master-key')
+    results = []
+    for name, kwargs in CASES:
+        method_class = getattr(RealtimeAPI, name).method_class
+
+        def call():
+            return method_class(api, **kwargs).prepare()
+
+        best = min(timeit.repeat(call, number=number, repeat=repeat))
+        results.append({'endpoint': name, 'us_per_call': best / number * 1e6})
+    return results
+
+
+def _change(old, new):
+    return (new - old) * 100.0 / old if old else 0.0
+
+
+def print_results(results, baseline=None):
+    baseline = dict((result['endpoint'], result) for result in baseline or [])
+    header = '%-20s %12s' % ('endpoint', 'us/call')
+    if baseline:
+        header += ' %12s %9s' % ('baseline', 'change')
+    print(header)
+    for result in results:
+        line = '%-20s %12.2f' % (result['endpoint'], result['us_per_call'])
+        previous = baseline.get(result['endpoint'])
+        if previous:
+            line += ' %12.2f %+8.1f%%' % (
+                previous['us_per_call'],
+                _change(previous['us_per_call'], result['us_per_call']))
+        print(line)
+
+
+def regressions(results, baseline, threshold):
+    '''
+    :return: 每次调用耗时增加超过 threshold（百分比）的端点
+    '''
+    baseline = dict((result['endpoint'], result) for result in baseline)
+    return [result['endpoint'] for result in results
+            if result['endpoint'] in baseline and
+            _change(baseline[result['endpoint']]['us_per_call'],
+                    result['us_per_call']) > threshold]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-call overhead of bind_method endpoints.')
+    parser.add_argument('--number', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--root', default=ROOT,
+                        help='source tree to import realtime from (default: this checkout)')
+    parser.add_argument('--save-baseline', metavar='FILE')
+    parser.add_argument('--compare', metavar='FILE')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='regression threshold in percent (default 10)')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.abspath(args.root))
+    results = run_cases(args.number, args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'python': sys.version.split()[0],
+                       'root': os.path.abspath(args.root),
+                       'results': results}, f, indent=2, sort_keys=True)
+    if baseline:
+        found = regressions(results, baseline, args.threshold)
+        if found:
+            print('regressions over %.0f%%: %s' % (args.threshold, ', '.join(found)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
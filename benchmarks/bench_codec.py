@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+'''
+比较各 JSON codec 在聊天记录上的编解码速度，以及 gzip 对响应体大小的影响。
+
+负载为 stub 服务生成的历史记录页（默认 1000 条），另有一份包含中文内容与 _lctype 富媒体
+消息的版本，更接近线上数据；另外测量 update_message / send_message 大小的请求体。
+只测量已安装的 codec。
+
+    python benchmarks/bench_codec.py [--messages 1000] [--number 50]
+'''
+
+import argparse
+import os
+import sys
+import timeit
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from realtime.codec import CODECS, DEFAULT_CODEC, get_codec, gzip_compress  # noqa: E402
+
+from stub_server import StubConfig, history_page  # noqa: E402
+
+
+def rich_page(size):
+    page = history_page(StubConfig(message_size=64), '58dcd5c31b69e60062aee271', limit=size)
+    for index, message in enumerate(page):
+        message['data'] = DEFAULT_CODEC.dumps({
+            '_lctype': -1,
+            '_lctext': u'第 %d 条消息：今天下午三点开会，请准时参加。' % index,
+            '_lcattrs': {'mentions': ['user%d' % (index % 17)], 'seq': index},
+        }).decode('utf-8')
+    return page
+
+
+def send_body():
+    return {'from_peer': 'sys', 'conv_id': '58dcd5c31b69e60062aee271', 'transient': False,
+            'message': u'公告：' + u'系统维护通知 ' * 300, 'push_data': {'alert': 'notice'}}
+
+
+def available_codecs():
+    codecs = [('default(%s)' % DEFAULT_CODEC.name, DEFAULT_CODEC)]
+    for name in sorted(CODECS):
+        try:
+            codecs.append((name, get_codec(name)))
+        except ImportError:
+            continue
+    return codecs
+
+
+def _gunzip(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--number', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    payloads = [
+        ('history(ascii)', history_page(StubConfig(message_size=64), '58dcd5c31b69e60062aee271',
+                                        limit=args.messages)),
+        ('history(rich)', rich_page(args.messages)),
+        ('send_body', send_body()),
+    ]
+    codecs = available_codecs()
+
+    def best(func):
+        return min(timeit.repeat(func, number=args.number, repeat=args.repeat)) / args.number
+
+    print('%-16s %-14s %10s %10s %10s %10s' % (
+        'payload', 'codec', 'bytes', 'dumps ms', 'loads ms', 'loads MB/s'))
+    for label, payload in payloads:
+        for name, codec in codecs:
+            encoded = codec.dumps(payload)
+            dumps = best(lambda: codec.dumps(payload))
+            loads = best(lambda: codec.loads(encoded))
+            print('%-16s %-14s %10d %10.3f %10.3f %10.1f' % (
+                label, name, len(encoded), dumps * 1000, loads * 1000,
+                len(encoded) / loads / 1e6))
+
+    print('')
+    print('%-16s %10s %10s %7s %12s %12s' % (
+        'payload', 'raw', 'gzip', 'ratio', 'gzip ms', 'gunzip ms'))
+    for label, payload in payloads:
+        encoded = DEFAULT_CODEC.dumps(payload)
+        compressed = gzip_compress(encoded)
+        print('%-16s %10d %10d %6.1f%% %12.3f %12.3f' % (
+            label, len(encoded), len(compressed), len(compressed) * 100.0 / len(encoded),
+            best(lambda: gzip_compress(encoded)) * 1000,
+            best(lambda: _gunzip(compressed)) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+'''
+比较直接调用 send_message 与 enqueue_send 时调用方的耗时，以及后台发送的吞吐与
+入队到发送成功的延迟；分别测量不使用 spool、使用 spool、使用 spool 并 fsync 三种情况。
+
+    python benchmarks/bench_dispatch.py [--messages 2000] [--latency 0.02] [--workers 16]
+'''
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from realtime.client import RealtimeAPI  # noqa: E402
+from realtime.fanout import message_body  # noqa: E402
+
+from stub_server import StubServer, StubConfig  # noqa: E402
+
+CONVID = '58dcd5c31b69e60062aee271'
+
+
+def client_for(server, **options):
+    return RealtimeAPI(app_id='bench', app_key='key', master_key='master',
+                       host=server.host, protocol='http', pool_maxsize=64, **options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args(argv)
+
+    body = message_body('sys', 'hello', conv_id=CONVID, transient=False)
+    directory = tempfile.mkdtemp()
+    print('%-16s %14s %12s %10s %10s %10s' % (
+        'mode', 'caller us/msg', 'total s', 'msg/s', 'p50 ms', 'p99 ms'))
+    try:
+        with StubServer(config=StubConfig(latency=args.latency)) as server:
+            client = client_for(server)
+            count = min(args.messages, 200)
+            start = time.time()
+            for _ in range(count):
+                client.send_message(json_body=body)
+            elapsed = time.time() - start
+            print('%-16s %14.0f %12.2f %10.0f %10s %10s' % (
+                'inline', elapsed / count * 1e6, elapsed, count / elapsed, '-', '-'))
+            client.close()
+
+            for mode, options in (('queue', {}),
+                                  ('queue+spool', {'spool': os.path.join(directory, 'a')}),
+                                  ('queue+fsync', {'spool': os.path.join(directory, 'b'),
+                                                   'fsync': True})):
+                options.update(workers=args.workers, maxsize=args.messages)
+                client = client_for(server, send_queue=options)
+                start = time.time()
+                for _ in range(args.messages):
+                    client.enqueue_send(body)
+                enqueued = time.time() - start
+                client.flush_sends()
+                elapsed = time.time() - start
+                stats = client.send_dispatcher.stats()
+                print('%-16s %14.0f %12.2f %10.0f %10.1f %10.1f' % (
+                    mode, enqueued / args.messages * 1e6, elapsed, args.messages / elapsed,
+                    stats['latency']['p50'] * 1000, stats['latency']['p99'] * 1000))
+                client.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
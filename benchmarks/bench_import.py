@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+'''
+测量冷启动时 import realtime.client 的耗时：每次启动一个新的解释器，取中位数。
+
+同时测量 requests 以及 leancloud SDK（如已安装）的导入耗时作为参照，
+realtime.client 与 requests 之差即本 SDK 自身的导入开销。
+
+    python benchmarks/bench_import.py [--runs 20] [--detail]
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CASES = [
+    ('requests', 'import requests'),
+    ('realtime.client', 'import realtime.client'),
+    ('realtime.aio', 'import realtime.aio'),
+    ('leancloud', 'import leancloud'),
+]
+
+TIMER = '''
+import time
+start = time.time()
+%s
+print(time.time() - start)
+'''
+
+
+def measure(statement, runs):
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE='')
+    samples = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', TIMER % statement],
+                                         env=env, stderr=subprocess.STDOUT)
+        samples.append(float(output.decode('utf-8').strip().splitlines()[-1]))
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def detail(statement, top=15):
+    # -X importtime 仅 Python 3.7+ 支持，输出累计耗时最多的模块
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.check_output([sys.executable, '-X', 'importtime', '-c', statement],
+                                     env=env, stderr=subprocess.STDOUT).decode('utf-8')
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        head, cumulative_us, name = line.split('|', 2)
+        rows.append((int(cumulative_us), int(head.split(':')[1]), name.strip()))
+    rows.sort(reverse=True)
+    print('%-40s %12s %12s' % ('module', 'cumul ms', 'self ms'))
+    for cumulative_us, self_us, name in rows[:top]:
+        print('%-40s %12.1f %12.1f' % (name, cumulative_us / 1000.0, self_us / 1000.0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--detail', action='store_true',
+                        help='show the slowest modules imported by realtime.client')
+    args = parser.parse_args(argv)
+
+    print('%-20s %12s' % ('import', 'median ms'))
+    for name, statement in CASES:
+        try:
+            seconds = measure(statement, args.runs)
+        except subprocess.CalledProcessError:
+            print('%-20s %12s' % (name, 'n/a'))
+            continue
+        print('%-20s %12.1f' % (name, seconds * 1000))
+
+    if args.detail and sys.version_info >= (3, 7):
+        print('')
+        detail('import realtime.client')
+
+
+if __name__ == '__main__':
+    main()
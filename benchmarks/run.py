@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+'''
+基于本地 stub 服务的离线压测，按端点与并发数统计吞吐、延迟分位数与内存。
+
+    python benchmarks/run.py                                  # 默认场景
+    python benchmarks/run.py --latency 0.005 --concurrency 1 8 32
+    python benchmarks/run.py --save-baseline baseline.json    # 保存基线
+    python benchmarks/run.py --compare baseline.json          # 与基线对比，退化超过阈值时返回 1
+    python benchmarks/run.py --transport requests h2c --latency 0.02 --concurrency 64 512
+                                                              # 比较 HTTP/1.1 与 HTTP/2 的连接数、内存与吞吐
+'''
+
+import argparse
+import gc
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from realtime.client import RealtimeAPI  # noqa: E402
+
+from stub_server import StubServer, StubConfig  # noqa: E402
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+
+CONVID = '58dcd5c31b69e60062aee271'
+
+ENDPOINTS = {
+    'create_conversation': lambda client: client.create_conversation(
+        json_body={'name': 'bench', 'm': ['a', 'b']}),
+    'manage_members': lambda client: client.manage_members(
+        convid=CONVID, json_body={'m': {'__op': 'AddUnique', 'objects': ['c']}}),
+    'send_message': lambda client: client.send_message(
+        json_body={'from_peer': 'sys', 'conv_id': CONVID, 'message': 'hello',
+                   'transient': False}),
+    'query_message': lambda client: client.query_message(convid=CONVID, limit=20),
+    'query_message_1000': lambda client: client.query_message(convid=CONVID, limit=1000),
+    'query_all_message': lambda client: client.query_all_message(limit=100),
+    'delete_message': lambda client: client.delete_message(
+        convid=CONVID, msgid='jQTrEDQHQu+UEAzL4vq6dw', timestamp=1490950859958),
+    'client_kick': lambda client: client.client_kick(json_body={'client_id': 'bob'}),
+}
+
+MEMORY_SAMPLE_CALLS = 200
+
+DEFAULT_ENDPOINTS = ['send_message', 'query_message', 'query_message_1000',
+                     'delete_message', 'client_kick']
+
+
+def percentile(samples, percent):
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, int(len(samples) * percent / 100.0))
+    return samples[index]
+
+
+def _max_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class _Quiet(object):
+    # 屏蔽请求路径上的调试输出，避免终端 IO 影响结果
+
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def __exit__(self, *args):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+
+def _peak_alloc(func, client, concurrency, calls):
+    # tracemalloc 会显著拖慢请求，因此与计时分开单独跑一轮
+    if tracemalloc is None:
+        return 0
+
+    def _one(_):
+        try:
+            func(client)
+        except Exception:
+            pass
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(_one, range(calls)))
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(client, name, concurrency, calls):
+    func = ENDPOINTS[name]
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def _one(_):
+        start = time.time()
+        try:
+            func(client)
+        except Exception:
+            with lock:
+                errors[0] += 1
+        elapsed = time.time() - start
+        with lock:
+            latencies.append(elapsed)
+
+    with _Quiet():
+        try:
+            func(client)  # 预热连接，开启错误注入时可能失败
+        except Exception:
+            pass
+        gc.collect()
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(_one, range(calls)))
+        duration = time.time() - start
+        peak = _peak_alloc(func, client, concurrency, min(calls, MEMORY_SAMPLE_CALLS))
+
+    latencies.sort()
+    return {
+        'endpoint': name,
+        'concurrency': concurrency,
+        'calls': calls,
+        'errors': errors[0],
+        'calls_per_sec': calls / duration if duration else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'peak_alloc_kb': peak / 1024.0,
+        'max_rss_kb': _max_rss_kb(),
+    }
+
+
+# HTTP/2 的连接可以同时承载多个请求，连接数上限不随并发数增长
+HTTP2_CONNECTIONS = 4
+
+
+def run_suite(endpoints, concurrency_levels, calls, config, client_options=None,
+              transports=('requests',)):
+    results = []
+    with StubServer(config=config) as server:
+        for transport in transports:
+            for level in concurrency_levels:
+                if transport == 'requests':
+                    options = dict(transport=transport, pool_maxsize=max(level, 10))
+                else:
+                    # HTTP/2 最多 HTTP2_CONNECTIONS 个连接，请求复用这些连接
+                    options = dict(transport=transport, pool_maxsize=HTTP2_CONNECTIONS,
+                                   pool_block=True)
+                options.update(client_options or {})
+                client = RealtimeAPI(app_id='bench-app-id', app_key='bench-app-key',
+                                     master_key='bench-master-key',
+                                     host=server.host, protocol='http', **options)
+                with client:
+                    for name in endpoints:
+                        connections = server.connections
+                        result = run_case(client, name, level, calls)
+                        result['connections'] = server.connections - connections
+                        result['transport'] = transport
+                        results.append(result)
+    return results
+
+
+def _key(result):
+    key = '%s@%d' % (result['endpoint'], result['concurrency'])
+    transport = result.get('transport', 'requests')
+    return key if transport == 'requests' else '%s/%s' % (key, transport)
+
+
+def print_results(results, baseline=None):
+    header = '%-9s %-22s %5s %10s %9s %9s %9s %7s %6s %10s' % (
+        'transport', 'endpoint', 'conc', 'calls/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors',
+        'conns', 'peak KB')
+    if baseline:
+        header += ' %9s %9s' % ('d calls/s', 'd p99')
+    print(header)
+    baseline = dict((_key(result), result) for result in baseline or [])
+    for result in results:
+        line = '%-9s %-22s %5d %10.1f %9.2f %9.2f %9.2f %7d %6d %10.1f' % (
+            result.get('transport', 'requests'), result['endpoint'], result['concurrency'],
+            result['calls_per_sec'],
+            result['p50_ms'], result['p95_ms'], result['p99_ms'],
+            result['errors'], result['connections'], result['peak_alloc_kb'])
+        previous = baseline.get(_key(result))
+        if previous:
+            line += ' %+8.1f%% %+8.1f%%' % (
+                _change(previous['calls_per_sec'], result['calls_per_sec']),
+                _change(previous['p99_ms'], result['p99_ms']))
+        print(line)
+
+
+def _change(old, new):
+    return (new - old) * 100.0 / old if old else 0.0
+
+
+def regressions(results, baseline, threshold):
+    '''
+    :return: 吞吐下降或 p99 上升超过 threshold（百分比）的场景
+    '''
+    baseline = dict((_key(result), result) for result in baseline)
+    found = []
+    for result in results:
+        previous = baseline.get(_key(result))
+        if not previous:
+            continue
+        if _change(previous['calls_per_sec'], result['calls_per_sec']) < -threshold or \
+                _change(previous['p99_ms'], result['p99_ms']) > threshold:
+            found.append(_key(result))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline realtime SDK benchmark.')
+    parser.add_argument('--endpoints', nargs='+', default=DEFAULT_ENDPOINTS,
+                        choices=sorted(ENDPOINTS))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32])
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=int)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--garbage-rate', type=float, default=0.0)
+    parser.add_argument('--gzip', action='store_true', help='stub gzips responses')
+    parser.add_argument('--codec', help='default, json, ujson, orjson or auto')
+    parser.add_argument('--compress-threshold', type=int)
+    parser.add_argument('--transport', nargs='+', default=['requests'],
+                        choices=['requests', 'h2c'],
+                        help='h2c uses HTTP/2 over the plain-text stub (needs httpx and h2)')
+    parser.add_argument('--save-baseline', metavar='FILE')
+    parser.add_argument('--compare', metavar='FILE')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='regression threshold in percent (default 10)')
+    args = parser.parse_args(argv)
+
+    config = StubConfig(latency=args.latency, jitter=args.jitter,
+                        rate_limit=args.rate_limit, error_rate=args.error_rate,
+                        garbage_rate=args.garbage_rate, gzip=args.gzip)
+    client_options = {}
+    if args.codec:
+        client_options['codec'] = args.codec
+    if args.compress_threshold is not None:
+        client_options['compress_threshold'] = args.compress_threshold
+    results = run_suite(args.endpoints, args.concurrency, args.calls, config, client_options,
+                        args.transport)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'python': sys.version.split()[0],
+                       'results': results}, f, indent=2, sort_keys=True)
+    if baseline:
+        found = regressions(results, baseline, args.threshold)
+        if found:
+            print('regressions over %.0f%%: %s' % (args.threshold, ', '.join(found)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+'''
+多线程压测 ClientPool：多个线程随机使用不同应用的客户端，检查请求没有串号。
+
+每个应用的对话 id 以 app_id 开头，stub 记录每个请求的 X-LC-Id、X-LC-Key 与 Cookie，
+结束后逐条检查：
+    - 请求中的对话 id 属于 X-LC-Id 对应的应用
+    - X-LC-Key 是该应用自己的 app key 或 master key
+    - 没有请求带上 Cookie（stub 会为每个应用下发不同的 Cookie）
+    - 响应中的对话 id 与请求的一致
+maxsize 小于应用数，压测过程中会不断淘汰、重建客户端。发现串号时返回 1。
+
+    python benchmarks/stress_registry.py [--apps 200] [--maxsize 50] [--threads 32]
+'''
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from realtime.registry import ClientPool  # noqa: E402
+
+from stub_server import StubServer, StubConfig  # noqa: E402
+
+try:
+    from urllib.parse import urlparse, parse_qs
+except ImportError:  # Python 2
+    from urlparse import urlparse, parse_qs
+
+
+def app_credentials(app_id):
+    return {'app_key': 'key-%s' % app_id, 'master_key': 'master-%s' % app_id}
+
+
+def convid_for(app_id, index):
+    return '%sx%d' % (app_id, index)
+
+
+def owner(convid):
+    return convid.rsplit('x', 1)[0]
+
+
+def call(client, app_id, rng):
+    # 返回响应中出现的对话 id，与请求的不一致时调用方记为串号
+    convid = convid_for(app_id, rng.randint(0, 20))
+    operation = rng.randint(0, 3)
+    if operation == 0:
+        return convid, [client.get_conversation(convid=convid)['objectId']]
+    if operation == 1:
+        return convid, [message['conv-id'] for message in
+                        client.query_message(convid=convid, limit=5)]
+    if operation == 2:
+        client.send_message(json_body={'from_peer': 'sys', 'conv_id': convid,
+                                       'message': app_id, 'transient': True})
+        return convid, []
+    client.manage_members(convid=convid,
+                          json_body={'m': {'__op': 'AddUnique', 'objects': [app_id]}})
+    return convid, []
+
+
+def worker(pool, apps, operations, seed, errors, counter):
+    rng = random.Random(seed)
+    for _ in range(operations):
+        app_id = rng.choice(apps)
+        try:
+            if rng.random() < 0.5:
+                convid, seen = call(pool.get(app_id), app_id, rng)
+            else:
+                with pool.lease(app_id) as client:
+                    convid, seen = call(client, app_id, rng)
+        except Exception as e:
+            errors.append('%s: %r' % (app_id, e))
+            continue
+        for returned in seen:
+            if returned != convid:
+                errors.append('%s requested %s, got %s' % (app_id, convid, returned))
+        counter.append(1)
+
+
+def audit_request(entry):
+    # 请求涉及的对话 id：路径、查询参数或 JSON 请求体中
+    url = urlparse(entry['path'])
+    convids = []
+    if url.path.startswith('/1.1/classes/_Conversation/'):
+        convids.append(url.path.rsplit('/', 1)[1])
+    convids.extend(parse_qs(url.query).get('convid', []))
+    if entry['body']:
+        body = json.loads(entry['body'].decode('utf-8'))
+        if 'conv_id' in body:
+            convids.append(body['conv_id'])
+    app_id = entry['app_id']
+    problems = []
+    credentials = app_credentials(app_id)
+    if entry['key'] not in (credentials['app_key'], '%s,master' % credentials['master_key']):
+        problems.append('key %s sent with X-LC-Id %s' % (entry['key'], app_id))
+    if entry['cookie']:
+        problems.append('cookie %s sent with X-LC-Id %s' % (entry['cookie'], app_id))
+    for convid in convids:
+        if owner(convid) != app_id:
+            problems.append('conversation %s requested with X-LC-Id %s' % (convid, app_id))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--apps', type=int, default=200)
+    parser.add_argument('--maxsize', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--operations', type=int, default=200,
+                        help='requests per thread')
+    parser.add_argument('--rate-limit', type=float,
+                        help='per-app rate limit, exercises per-app limiters')
+    parser.add_argument('--latency', type=float, default=0.001)
+    args = parser.parse_args(argv)
+
+    apps = ['app%03d' % index for index in range(args.apps)]
+    options = {}
+    if args.rate_limit:
+        options['rate_limit'] = args.rate_limit
+    config = StubConfig(latency=args.latency, jitter=args.latency, audit=True)
+    errors = []
+    counter = []
+    with StubServer(config=config) as server:
+        pool = ClientPool(app_credentials, maxsize=args.maxsize, pool_maxsize=args.threads,
+                          host=server.host, protocol='http', **options)
+        threads = [threading.Thread(target=worker,
+                                    args=(pool, apps, args.operations, seed, errors, counter))
+                   for seed in range(args.threads)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+        stats = pool.stats()
+        pool.close()
+        audit = list(server.audit)
+        connections = server.connections
+
+    crossed = []
+    for entry in audit:
+        crossed.extend(audit_request(entry))
+    crossed.extend(errors)
+
+    print('requests          %d in %.2fs (%.0f req/s)' % (
+        len(counter), elapsed, len(counter) / elapsed))
+    print('audited requests  %d' % len(audit))
+    print('tcp connections   %d' % connections)
+    print('pool stats        %s' % stats)
+    print('problems          %d' % len(crossed))
+    for problem in crossed[:20]:
+        print('  ' + problem)
+    return 1 if crossed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,447 @@
+# -*- coding: utf-8 -*-
+'''
+本地 LeanCloud stub 服务，实现 client.py 用到的 REST 路径，用于离线压测：
+
+    POST   /1.1/classes/_Conversation
+    GET    /1.1/classes/_Conversation/{convid}
+    PUT    /1.1/classes/_Conversation/{convid}
+    POST   /1.1/rtm/messages
+    GET    /1.1/rtm/messages/history
+    DELETE /1.1/rtm/messages/logs
+    PUT    /1.1/rtm/messages/logs
+    POST   /1.1/rtm/client/kick
+
+支持固定/随机延迟、按速率返回限流错误、按比例注入 5xx 与无法解析的响应，
+接受 gzip 压缩的请求体，开启 gzip 后按 Accept-Encoding 返回 gzip 压缩的响应。
+开启 audit 后记录每个请求的鉴权头与 Cookie，并在响应中下发按应用区分的 Cookie，
+用于检查多应用共享连接时请求是否串号。
+同一个端口也接受明文 HTTP/2（h2c，prior knowledge）连接，需要安装 h2。
+聊天记录按 convid 与序号即时生成，不占用内存。
+
+    python benchmarks/stub_server.py --port 8000 --latency 0.005 --error-rate 0.01
+'''
+
+import argparse
+import json
+import random
+import re
+import socket
+import threading
+import time
+import zlib
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse, parse_qs
+
+
+HISTORY_START = 1490000000000
+HISTORY_STEP = 10
+
+re_conversation = re.compile(r'^/1\.1/classes/_Conversation/(\w+)$')
+
+
+class StubConfig(object):
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit=None, error_rate=0.0,
+                 garbage_rate=0.0, history_size=5000, message_size=64, gzip=False,
+                 audit=False):
+        '''
+        :param latency:      每个请求固定增加的延迟（秒）
+        :param jitter:       在 [0, jitter] 之间随机增加的延迟（秒）
+        :param rate_limit:   每秒允许的请求数，超出时返回 429 / code 529
+        :param error_rate:   返回 500 的比例
+        :param garbage_rate: 返回非 JSON 响应的比例
+        :param history_size: 每个对话的聊天记录条数
+        :param message_size: 每条消息 data 字段的长度
+        :param gzip:         客户端接受 gzip 时是否压缩响应
+        :param audit:        是否记录请求的鉴权头，并下发 Set-Cookie
+        '''
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.garbage_rate = garbage_rate
+        self.history_size = history_size
+        self.message_size = message_size
+        self.gzip = gzip
+        self.audit = audit
+
+
+class _Window(object):
+    # 按秒计数的固定窗口限流
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.second = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def hit(self):
+        with self.lock:
+            now = int(time.time())
+            if now != self.second:
+                self.second, self.count = now, 0
+            self.count += 1
+            return self.count <= self.limit, max(self.limit - self.count, 0)
+
+
+def _message(convid, index, size):
+    timestamp = HISTORY_START + (1000000 - index) * HISTORY_STEP
+    return {
+        'timestamp': timestamp,
+        'conv-id': convid,
+        'data': ('m%d ' % index + 'x' * size)[:size],
+        'from': 'user%d' % (index % 17),
+        'from-ip': '127.0.0.1',
+        'msg-id': '%s-%d' % (convid, index),
+        'is-conv': True,
+        'is-room': False,
+        'to': convid,
+        'bin': False,
+        'ack-at': timestamp + 50,
+    }
+
+
+def history_page(config, convid, max_ts=None, limit=20, sender=None):
+    # 第 i 条消息的时间戳随 i 递减，由 max_ts 直接算出起始序号
+    limit = min(int(limit), 1000)
+    start = 0
+    if max_ts is not None:
+        newest = HISTORY_START + 1000000 * HISTORY_STEP
+        start = max(0, (newest - int(max_ts)) // HISTORY_STEP + 1)
+    end = min(config.history_size, start + limit)
+    messages = [_message(convid, index, config.message_size)
+                for index in range(start, end)]
+    if sender is not None:
+        for message in messages:
+            message['from'] = sender
+    return messages
+
+
+def route(config, command, url, body):
+    query = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+    path = url.path
+    match = re_conversation.match(path)
+    if path == '/1.1/classes/_Conversation' and command == 'POST':
+        return 201, {'objectId': '%024x' % random.getrandbits(96),
+                     'createdAt': '2017-04-01T00:00:00.000Z'}
+    if match and command == 'GET':
+        convid = match.group(1)
+        if convid.startswith('missing'):
+            return 404, {'code': 101, 'error': 'Object not found.'}
+        return 200, {'objectId': convid, 'name': 'stub', 'm': ['a', 'b'], 'c': 'a',
+                     'mu': [], 'createdAt': '2017-04-01T00:00:00.000Z'}
+    if match and command == 'PUT':
+        return 200, {'updatedAt': '2017-04-01T00:00:00.000Z'}
+    if path == '/1.1/rtm/messages' and command == 'POST':
+        return 200, {}
+    if path == '/1.1/rtm/messages/history' and command == 'GET':
+        return 200, history_page(config, query.get('convid', 'all'),
+                                 max_ts=query.get('max_ts'),
+                                 limit=query.get('limit', 20),
+                                 sender=query.get('from'))
+    if path == '/1.1/rtm/messages/logs' and command in ('DELETE', 'PUT'):
+        return 200, {}
+    if path == '/1.1/rtm/client/kick' and command == 'POST':
+        return 200, {}
+    return 404, {'code': 404, 'error': 'No route for %s %s' % (command, path)}
+
+
+def respond(server, command, path, headers, raw):
+    '''
+    HTTP/1.1 与 HTTP/2 共用的请求处理。
+
+    :param headers: 请求头，get 不区分大小写
+    :return: (status, 响应体 bytes, 响应头 dict)
+    '''
+    config = server.config
+    server.count(command, path, len(raw))
+    if headers.get('Content-Encoding') == 'gzip':
+        raw = zlib.decompress(raw, 16 + zlib.MAX_WBITS)
+    if config.audit:
+        server.record(command, path, headers, raw)
+
+    delay = config.latency + (random.random() * config.jitter if config.jitter else 0)
+    if delay:
+        time.sleep(delay)
+
+    response_headers = {}
+    if config.audit:
+        response_headers['Set-Cookie'] = 'lc_app=%s; Path=/' % headers.get('X-LC-Id')
+    status, payload = _outcome(server, command, path, raw, response_headers)
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+    if config.gzip and 'gzip' in (headers.get('Accept-Encoding') or ''):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        body = compressor.compress(body) + compressor.flush()
+        response_headers['Content-Encoding'] = 'gzip'
+    return status, body, response_headers
+
+
+def _outcome(server, command, path, raw, headers):
+    config = server.config
+    if server.window is not None:
+        allowed, remaining = server.window.hit()
+        headers['X-RateLimit-Limit'] = server.window.limit
+        headers['X-RateLimit-Remaining'] = remaining
+        if not allowed:
+            headers['Retry-After'] = 1
+            return 429, {'code': 529, 'error': 'Too many requests.'}
+    roll = random.random()
+    if roll < config.error_rate:
+        return 500, {'code': 1, 'error': 'Injected internal error.'}
+    if roll < config.error_rate + config.garbage_rate:
+        return 502, b'<html>502 Bad Gateway</html>'
+
+    try:
+        body = json.loads(raw.decode('utf-8')) if raw else {}
+    except ValueError:
+        return 400, {'code': 107, 'error': 'Malformed json object.'}
+    return route(config, command, urlparse(path), body)
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'RealtimeStub/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        # 以 HTTP/2 连接前言开头的连接按 h2c（prior knowledge）处理
+        if _is_h2(self.request):
+            return _H2Connection(self.server, self.request).run()
+        return BaseHTTPServer.BaseHTTPRequestHandler.handle(self)
+
+    def _send(self, status, body, headers):
+        lines = ['HTTP/1.1 %d %s' % (status, self.responses.get(status, ('',))[0]),
+                 'Content-Type: application/json',
+                 'Content-Length: %d' % len(body),
+                 'Connection: keep-alive']
+        for key, value in headers.items():
+            lines.append('%s: %s' % (key, value))
+        # 头与正文一次写出，避免 Nagle 算法带来的 40ms 延迟
+        self.wfile.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        self.wfile.flush()
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        self._send(*respond(self.server, self.command, self.path, self.headers, raw))
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+
+H2_PREFACE = b'PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n'
+
+
+def _is_h2(sock):
+    data = b''
+    while len(data) < len(H2_PREFACE):
+        try:
+            data = sock.recv(len(H2_PREFACE), socket.MSG_PEEK)
+        except socket.error:
+            return False
+        if not data or not H2_PREFACE.startswith(data):
+            return False
+        if len(data) < len(H2_PREFACE):
+            time.sleep(0.001)
+    return True
+
+
+class _H2Headers(dict):
+
+    def get(self, key, default=None):
+        return dict.get(self, key.lower(), default)
+
+
+class _H2Connection(object):
+    '''
+    明文 HTTP/2 连接（需要 h2）。每个流在单独的线程中处理，与 HTTP/1.1 一样按 latency
+    延迟；响应按对端的流量控制窗口分块发送，写连接时加锁。
+    '''
+
+    def __init__(self, server, sock):
+        import h2.config
+        import h2.connection
+
+        self.server = server
+        self.sock = sock
+        self.conn = h2.connection.H2Connection(
+            h2.config.H2Configuration(client_side=False, header_encoding='utf-8'))
+        self.lock = threading.Lock()
+        self.streams = {}
+        self.pending = {}
+
+    def _write(self):
+        data = self.conn.data_to_send()
+        if data:
+            self.sock.sendall(data)
+
+    def run(self):
+        import h2.events
+        import h2.exceptions
+
+        with self.lock:
+            self.conn.initiate_connection()
+            self._write()
+        try:
+            while True:
+                data = self.sock.recv(65536)
+                if not data:
+                    return
+                with self.lock:
+                    for event in self.conn.receive_data(data):
+                        if not self._event(event, h2.events):
+                            self._write()
+                            return
+                    self._write()
+        except (socket.error, h2.exceptions.ProtocolError):
+            return
+
+    def _event(self, event, events):
+        if isinstance(event, events.RequestReceived):
+            self.streams[event.stream_id] = (_H2Headers(event.headers), [])
+        elif isinstance(event, events.DataReceived):
+            self.streams[event.stream_id][1].append(event.data)
+            self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+        elif isinstance(event, events.StreamEnded):
+            headers, chunks = self.streams.pop(event.stream_id)
+            thread = threading.Thread(target=self._respond,
+                                      args=(event.stream_id, headers, b''.join(chunks)))
+            thread.daemon = True
+            thread.start()
+        elif isinstance(event, events.WindowUpdated):
+            stream_ids = list(self.pending) if event.stream_id == 0 else [event.stream_id]
+            for stream_id in stream_ids:
+                if stream_id in self.pending:
+                    self._flush(stream_id)
+        elif isinstance(event, events.StreamReset):
+            self.streams.pop(event.stream_id, None)
+            self.pending.pop(event.stream_id, None)
+        elif isinstance(event, events.ConnectionTerminated):
+            return False
+        return True
+
+    def _respond(self, stream_id, headers, raw):
+        import h2.exceptions
+
+        status, body, extra = respond(self.server, headers.get(':method'),
+                                      headers.get(':path'), headers, raw)
+        response_headers = [(':status', str(status)),
+                            ('content-type', 'application/json'),
+                            ('content-length', str(len(body)))]
+        response_headers.extend((key.lower(), str(value)) for key, value in extra.items())
+        with self.lock:
+            try:
+                self.conn.send_headers(stream_id, response_headers)
+                self.pending[stream_id] = body
+                self._flush(stream_id)
+                self._write()
+            except (socket.error, h2.exceptions.H2Error):
+                pass
+
+    def _flush(self, stream_id):
+        data = self.pending[stream_id]
+        while data:
+            size = min(self.conn.local_flow_control_window(stream_id),
+                       self.conn.max_outbound_frame_size, len(data))
+            if size <= 0:
+                break
+            self.conn.send_data(stream_id, data[:size])
+            data = data[size:]
+        if data:
+            self.pending[stream_id] = data
+        else:
+            del self.pending[stream_id]
+            self.conn.end_stream(stream_id)
+
+
+class StubServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, address=('127.0.0.1', 0), config=None):
+        BaseHTTPServer.HTTPServer.__init__(self, address, StubHandler)
+        self.config = config or StubConfig()
+        self.window = _Window(self.config.rate_limit) if self.config.rate_limit else None
+        self.requests = {}
+        self.audit = []
+        self.bytes_received = 0
+        self.connections = 0
+        self._stats_lock = threading.Lock()
+        self._thread = None
+
+    def process_request(self, request, client_address):
+        with self._stats_lock:
+            self.connections += 1
+        return socketserver.ThreadingMixIn.process_request(self, request, client_address)
+
+    def count(self, method, path, size):
+        key = '%s %s' % (method, path.split('?')[0])
+        with self._stats_lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes_received += size
+
+    def record(self, method, path, headers, body):
+        entry = {
+            'method': method,
+            'path': path,
+            'body': body,
+            'app_id': headers.get('X-LC-Id'),
+            'key': headers.get('X-LC-Key'),
+            'sign': headers.get('X-LC-Sign'),
+            'cookie': headers.get('Cookie'),
+        }
+        with self._stats_lock:
+            self.audit.append(entry)
+
+    @property
+    def host(self):
+        return '%s:%d' % self.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='realtime-stub')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local LeanCloud realtime REST stub.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=int)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--garbage-rate', type=float, default=0.0)
+    parser.add_argument('--history-size', type=int, default=5000)
+    parser.add_argument('--gzip', action='store_true')
+    args = parser.parse_args(argv)
+    config = StubConfig(latency=args.latency, jitter=args.jitter,
+                        rate_limit=args.rate_limit, error_rate=args.error_rate,
+                        garbage_rate=args.garbage_rate,
+                        history_size=args.history_size, gzip=args.gzip)
+    server = StubServer((args.host, args.port), config)
+    print('stub listening on http://%s' % server.host)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+'''
+asyncio 版本的 Realtime 客户端。
+
+AsyncRealtimeAPI 的每个端点都由 RealtimeAPI 上 bind_method 的同一份定义生成，
+参数处理、签名与响应解析完全复用同步客户端，只有网络请求部分改为 aiohttp::
+
+    async with AsyncRealtimeAPI(app_id=..., app_key=..., master_key=...) as client:
+        conv = await AsyncConversation.init(client, convid='...')
+        messages = await conv.query_message(limit=20)
+
+端点的 deadline 参数与同步客户端相同；超时或 CancelToken 被取消时，正在进行的请求
+会被直接取消，并抛出 RealtimeTimeoutError 或 RealtimeCancelledError。
+
+bulk_*、follow、iter_*、backfill_*、enqueue_send 等在线程中调用端点的方法只有同步客户端
+提供，在 AsyncRealtimeAPI / AsyncConversation 上调用时抛出 TypeError。
+
+依赖 aiohttp（pip install py-realtime-sdk[async]）。
+'''
+
+import asyncio
+import time
+
+import aiohttp
+
+from .oauth2 import OAuth2Request
+from .bind import (RealtimeAPIError, RealtimeRateLimitError, RealtimeCircuitOpenError,
+                   RealtimeTimeoutError)
+from .client import RealtimeAPI, Conversation
+from .deadline import as_deadline
+from .fanout import SendResult, broadcast_body
+from .instrumentation import RequestInfo
+
+
+class AsyncOAuth2Request(OAuth2Request):
+
+    async def make_request(self, url, method="GET", body=None, json_body=None, headers=None,
+                           info=None):
+        headers = headers or {}
+        headers.update({"User-Agent": "%s Python Client" % self.api.api_name})
+        data = self._request_data(body, json_body, headers)
+        session = self.api.session
+        if info is None:
+            async with session.request(method, url, data=data, headers=headers) as response:
+                content = await response.read()
+                return response.status, response.headers, content
+        info.bytes_sent = len(data or '')
+        async with session.request(method, url, data=data, headers=headers,
+                                   trace_request_ctx=info) as response:
+            info.timings['ttfb'] = time.time() - info.start
+            content = await response.read()
+            info.status_code = response.status
+            info.bytes_received = len(content)
+            return response.status, response.headers, content
+
+
+def _trace_config():
+    # 通过 aiohttp 的 trace 回调记录新建连接的耗时
+    async def on_start(session, context, params):
+        context.connect_start = time.time()
+
+    async def on_end(session, context, params):
+        info = context.trace_request_ctx
+        if info is not None:
+            info.timings['connect'] = time.time() - context.connect_start
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_start.append(on_start)
+    trace_config.on_connection_create_end.append(on_end)
+    return trace_config
+
+
+TRANSPORT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+
+async def _do_api_request(api, method, request, attempt=1, tracker=None):
+    # 与 RealtimeAPIMethod._do_api_request 相同，返回 (解析后的结果, (status_code, 原始响应内容))
+    url, http_method, body, json_body, headers = request
+    limiter = api.rate_limiter
+    if limiter is not None:
+        wait = limiter.reserve(method.name)
+        if wait > 0:
+            await asyncio.sleep(wait)
+    instrumentation = api.instrumentation
+    info = None
+    if instrumentation.enabled:
+        info = RequestInfo(method.name, http_method, url, attempt)
+        instrumentation.before_request(info)
+    try:
+        start = time.time()
+        status_code, response_headers, raw = await AsyncOAuth2Request(api).make_request(
+            url, method=http_method, body=body, json_body=json_body, headers=headers,
+            info=info)
+        if tracker is not None:
+            tracker.add(time.time() - start)
+        method.update_rate_limit(status_code, response_headers)
+        try:
+            content, _ = method.process_response(status_code, raw, info)
+        except RealtimeRateLimitError:
+            if limiter is not None:
+                limiter.on_rate_limited(response_headers)
+            raise
+        return content, (status_code, raw)
+    except Exception as e:
+        if info is not None:
+            info.error = e
+        raise
+    finally:
+        if info is not None:
+            instrumentation.after_request(info)
+
+
+async def _hedged(factory, delay):
+    # 取先成功的结果，落后的请求会被取消
+    first = asyncio.ensure_future(factory())
+    done, _ = await asyncio.wait([first], timeout=delay)
+    if done:
+        return first.result()
+    pending = set([first, asyncio.ensure_future(factory())])
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = error or future.exception()
+        raise error
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def _send(api, method, request, attempt):
+    tracker = api.latency_tracker(method.name) if method.hedge else None
+    if tracker is None:
+        return await _do_api_request(api, method, request, attempt)
+    delay = tracker.percentile(api.hedge_percentile)
+    if delay is None:
+        return await _do_api_request(api, method, request, attempt, tracker)
+    return await _hedged(lambda: _do_api_request(api, method, request, attempt, tracker),
+                         delay)
+
+
+async def _with_deadline(deadline, coroutine):
+    # 剩余时间用完或 token 被取消时取消正在进行的请求
+    if deadline is None:
+        return await coroutine
+    error = deadline.error()
+    if error is not None:
+        # 避免 coroutine was never awaited 警告
+        coroutine.close()
+        raise error
+    loop = asyncio.get_event_loop()
+    task = asyncio.ensure_future(coroutine)
+    token = deadline.token
+
+    def _cancel():
+        loop.call_soon_threadsafe(task.cancel)
+
+    if token is not None:
+        token.add_callback(_cancel)
+    try:
+        return await asyncio.wait_for(task, deadline.remaining())
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        error = deadline.error()
+        if error is not None:
+            raise error
+        raise
+    finally:
+        if token is not None:
+            token.remove_callback(_cancel)
+
+
+async def _backoff(deadline, seconds):
+    if deadline is not None:
+        remaining = deadline.remaining()
+        if remaining is not None and seconds >= remaining:
+            raise RealtimeTimeoutError('Deadline exceeded')
+    await asyncio.sleep(seconds)
+
+
+async def _execute(api, method):
+    # 返回 (解析后的结果, (status_code, 原始响应内容))
+    request = method.prepare()
+    policy = method.retry_policy
+    breaker = api.circuit_breaker(method.name)
+    deadline = method.deadline
+    attempt = 0
+    while True:
+        attempt += 1
+        if breaker is not None and not breaker.allow():
+            raise RealtimeCircuitOpenError(
+                'Circuit open for %s, failing fast' % method.name)
+        try:
+            result = await _with_deadline(deadline, _send(api, method, request, attempt))
+        except Exception as e:
+            retryable = method.is_retryable(e, TRANSPORT_ERRORS)
+            method.record_error(breaker, e, retryable)
+            if (policy is None or not retryable or
+                    not policy.should_retry(method.name, method.idempotent, attempt)):
+                raise
+            api.instrumentation.record_retry(method.name)
+            await _backoff(deadline, policy.backoff_time(attempt))
+            continue
+        except BaseException:
+            # asyncio.CancelledError 不是 Exception 的子类
+            if breaker is not None:
+                breaker.record_cancelled()
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+def bind_async_method(endpoint):
+    '''
+    :param endpoint: bind_method 生成的同步端点
+    :return: 协程函数版本的端点
+    '''
+    method_class = endpoint.method_class
+
+    async def _call(api, *args, **kwargs):
+        method = method_class(api, *args, **kwargs)
+        flight = api.single_flight \
+            if method.single_flight and method.deadline is None else None
+        if flight is None:
+            content, _ = await _execute(api, method)
+            return content
+        task, shared = flight.task(method.name, method.flight_key(),
+                                   lambda: _execute(api, method))
+        content, raw_response = await asyncio.shield(task)
+        if shared:
+            content, _ = method.process_response(*raw_response)
+        return content
+
+    _call.config = endpoint.config
+    _call.method_class = method_class
+    return _call
+
+
+class AsyncRealtimeAPI(RealtimeAPI):
+    '''
+    与 RealtimeAPI 参数相同，所有端点均返回 awaitable。
+    pool_maxsize 对应 aiohttp 每个 host 的连接数上限，pool_connections 对应总连接数上限。
+    '''
+
+    def __init__(self, *args, **kwargs):
+        for option in ('coalesce_members', 'send_queue'):
+            if kwargs.get(option):
+                raise TypeError('%s is not supported by %s' % (option, type(self).__name__))
+        if kwargs.get('transport') not in (None, 'requests'):
+            raise TypeError('transport is not supported by %s, it always uses aiohttp'
+                            % type(self).__name__)
+        super(AsyncRealtimeAPI, self).__init__(*args, **kwargs)
+
+    @property
+    def session(self):
+        # aiohttp.ClientSession 需要在事件循环内创建，这里在第一次请求时惰性创建
+        if self._session is None:
+            timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout,
+                                            sock_read=self.read_timeout)
+            connector = aiohttp.TCPConnector(
+                limit=max(self.pool_connections, self.pool_maxsize),
+                limit_per_host=self.pool_maxsize)
+            trace_configs = [_trace_config()] if self.instrumentation.enabled else None
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=timeout,
+                                                  trace_configs=trace_configs)
+        return self._session
+
+    async def close(self):
+        if not self._owns_session:
+            return
+        session, self._session = self._session, None
+        if session is not None:
+            await session.close()
+
+    async def broadcast(self, conv_ids, from_peer, message, transient=True, no_sync=False,
+                        push_data=None, to_peers=None, workers=16, deadline=None):
+        '''
+        与 RealtimeAPI.broadcast 相同，由 gather_limited 限制并发数。
+        '''
+        deadline = as_deadline(deadline)
+        body = broadcast_body(self.codec, from_peer, message, transient=transient,
+                              no_sync=no_sync, push_data=push_data, to_peers=to_peers)
+        return await _send_all(
+            list(conv_ids),
+            lambda conv_id: self.send_message(body=body(conv_id), deadline=deadline),
+            workers)
+
+    async def send_many(self, bodies, workers=16, deadline=None):
+        '''
+        与 RealtimeAPI.send_many 相同，由 gather_limited 限制并发数。
+        '''
+        deadline = as_deadline(deadline)
+        results = await _send_all(
+            list(bodies), lambda body: self.send_message(json_body=body, deadline=deadline),
+            workers)
+        return [result._replace(target=result.target.get('conv_id')) for result in results]
+
+    def __enter__(self):
+        raise TypeError("Use 'async with' with %s" % type(self).__name__)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+for _name, _endpoint in list(vars(RealtimeAPI).items()):
+    if getattr(_endpoint, 'method_class', None) is not None:
+        setattr(AsyncRealtimeAPI, _name, bind_async_method(_endpoint))
+
+
+def _sync_only(name):
+    # 这些方法在线程中调用端点并直接使用返回值，拿到协程时会静默地什么也不做
+    def _method(self, *args, **kwargs):
+        raise TypeError('%s is not supported by %s, use the synchronous client'
+                        % (name, type(self).__name__))
+    _method.__name__ = name
+    return _method
+
+
+SYNC_ONLY_METHODS = ('bulk_delete_messages', 'bulk_update_messages', 'bulk_kick', 'follow',
+                     'iter_messages_by_from', 'iter_all_messages',
+                     'iter_all_message_batches', 'backfill_all_messages', 'enqueue_send')
+
+for _name in SYNC_ONLY_METHODS:
+    setattr(AsyncRealtimeAPI, _name, _sync_only(_name))
+
+
+class AsyncConversation(Conversation):
+    '''
+    与 Conversation 接口一致，client 须为 AsyncRealtimeAPI，所有请求方法均返回 awaitable。
+    '''
+
+    @classmethod
+    async def init(cls, client, convid=None, name=None, m=None, c=None, mu=None,
+                   deadline=None):
+        instance = cls(client=client, convid=convid)
+        if convid:
+            metadata = instance._cached_metadata(convid)
+            if metadata is None:
+                try:
+                    conversation = await client.get_conversation(convid=convid,
+                                                                 deadline=deadline)
+                except RealtimeAPIError as e:
+                    instance._lookup_failed(convid, e)
+                    raise
+                metadata = instance._store_metadata(convid, conversation)
+            instance.metadata = metadata
+            return instance
+        else:
+            params = {
+                "name": name,
+                "m": m,
+                "mu": mu,
+            }
+            conversation = await client.create_conversation(json_body=params,
+                                                            deadline=deadline)
+            return instance._created(conversation, params)
+
+    async def _manage_members(self, client_ids, op, deadline=None):
+        params = {
+            "m": {
+                "__op": op,
+                "objects": client_ids
+            }
+        }
+        try:
+            result = await self.client.manage_members(convid=self.convid, json_body=params,
+                                                      deadline=deadline)
+        except Exception:
+            if self.client.conversation_cache is not None:
+                self.client.conversation_cache.invalidate(self.convid)
+            raise
+        self._members_changed(client_ids, op)
+        return result
+
+
+async def _send_all(targets, send, workers):
+    # 单个目标失败不影响其他目标；超时或取消后尚未开始的请求在 send 中直接失败
+    async def _send(target):
+        try:
+            return SendResult(target, True, await send(target), None)
+        except Exception as e:
+            return SendResult(target, False, None, e)
+
+    return await gather_limited([_send(target) for target in targets], workers)
+
+
+for _name in ('iter_messages', 'iter_message_batches', 'backfill_messages'):
+    setattr(AsyncConversation, _name, _sync_only(_name))
+
+
+async def gather_limited(aws, limit=100, return_exceptions=False):
+    '''
+    与 asyncio.gather 相同，但同一时间最多只有 limit 个 awaitable 在执行。
+
+    :param aws:               awaitable 列表（协程尚未开始执行）
+    :param limit:             最大并发数
+    :param return_exceptions: 同 asyncio.gather
+    :return: 与 aws 顺序一致的结果列表
+    '''
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _run(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*[_run(aw) for aw in aws],
+                                return_exceptions=return_exceptions)
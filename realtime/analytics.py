@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+'''
+基于 ColumnBatch 的聊天记录统计，全部用 NumPy 的整列运算完成，不逐条遍历消息。
+
+    batch = concat_batches(conversation.iter_message_batches(since=start_ms))
+    counts_by_sender(batch)            # {'alice': 1024, 'bob': 980, ...}
+    hourly_activity(batch, utc_offset=8)
+    response_gaps(batch)               # {convid: 发送者切换时的间隔（毫秒）数组}
+
+跨多个批次统计时先用 concat_batches 合并；计数类统计也可以逐批计算后相加。
+'''
+
+import numpy
+
+from .columnar import ColumnBatch
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+
+
+def _batch(batch):
+    if isinstance(batch, ColumnBatch):
+        return batch
+    return ColumnBatch.from_messages(batch)
+
+
+def _by_code(names, codes, values=None):
+    counts = numpy.bincount(codes, weights=values, minlength=len(names))
+    order = numpy.argsort(-counts, kind='stable')
+    if values is None:
+        return dict((names[code], int(counts[code])) for code in order if counts[code])
+    return dict((names[code], counts[code]) for code in order)
+
+
+def counts_by_sender(batch):
+    '''
+    :return: {发送者: 消息数}，按消息数从多到少
+    '''
+    batch = _batch(batch)
+    return _by_code(batch.senders, batch.sender)
+
+
+def counts_by_conversation(batch):
+    '''
+    :return: {对话 id: 消息数}，按消息数从多到少
+    '''
+    batch = _batch(batch)
+    return _by_code(batch.convids, batch.conv)
+
+
+def bytes_by_sender(batch):
+    '''
+    :return: {发送者: 消息内容总长度}
+    '''
+    batch = _batch(batch)
+    return dict((name, int(total)) for name, total in
+                _by_code(batch.senders, batch.sender, batch.length).items())
+
+
+def hourly_activity(batch, utc_offset=0):
+    '''
+    :param utc_offset: 时区偏移（小时），例如北京时间为 8
+    :return: 长度为 24 的数组，第 i 个元素为 i 点到 i+1 点之间的消息数
+    '''
+    batch = _batch(batch)
+    hours = ((batch.timestamp + int(utc_offset * HOUR_MS)) % DAY_MS) // HOUR_MS
+    return numpy.bincount(hours, minlength=24)
+
+
+def activity_series(batch, bucket=HOUR_MS):
+    '''
+    :param bucket: 时间桶宽度（毫秒）
+    :return: (各时间桶的起始时间戳, 各时间桶的消息数)，只包含有消息的时间桶
+    '''
+    batch = _batch(batch)
+    buckets, counts = numpy.unique(batch.timestamp // bucket, return_counts=True)
+    return buckets * bucket, counts
+
+
+def _conversation_order(batch):
+    # 按对话、时间排序，之后每个对话的消息在一段连续区间内
+    order = numpy.lexsort((batch.timestamp, batch.conv))
+    return batch.conv[order], batch.sender[order], batch.timestamp[order]
+
+
+def response_gaps(batch):
+    '''
+    同一对话中相邻两条消息的发送者不同时，后一条相对前一条的间隔即一次回复耗时。
+
+    :return: {对话 id: 回复间隔数组（毫秒，按时间顺序）}，没有回复的对话不出现
+    '''
+    batch = _batch(batch)
+    if not len(batch):
+        return {}
+    conv, sender, timestamp = _conversation_order(batch)
+    replies = (conv[1:] == conv[:-1]) & (sender[1:] != sender[:-1])
+    gaps = numpy.diff(timestamp)[replies]
+    reply_convs = conv[1:][replies]
+    if not len(gaps):
+        return {}
+    # reply_convs 已排好序，按对话切分
+    boundaries = numpy.flatnonzero(reply_convs[1:] != reply_convs[:-1]) + 1
+    starts = numpy.concatenate(([0], boundaries))
+    return dict((batch.convids[reply_convs[start]], chunk)
+                for start, chunk in zip(starts, numpy.split(gaps, boundaries)))
+
+
+def response_gap_summary(batch, percentiles=(50, 90)):
+    '''
+    :return: {对话 id: {'replies': 次数, 'p50': 毫秒, 'p90': 毫秒}}
+    '''
+    summary = {}
+    for convid, gaps in response_gaps(batch).items():
+        values = numpy.percentile(gaps, percentiles)
+        entry = {'replies': len(gaps)}
+        for percent, value in zip(percentiles, values):
+            entry['p%d' % percent] = float(value)
+        summary[convid] = entry
+    return summary
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+'''
+按时间分片并行回填聊天记录。
+
+历史记录接口只能从 max_ts 开始逐页向前翻，单个游标链只能串行请求。Backfill 把
+[since, until) 切成 shards 个时间片，每个时间片是一条独立的游标链：从时间片的上界开始
+向前翻页，越过下界即停止。最多 workers 个时间片同时翻页，耗时随 workers 增加而下降，
+而不再与记录条数成正比。
+
+结果与 iter_messages 一样按时间倒序逐条返回：时间片按从新到旧的顺序合并，当前时间片
+的页取到就返回，后面的时间片已取到的页在各自的缓冲区中等待，每个缓冲区最多 buffer_pages
+页，缓冲区满时该时间片暂停翻页；最多领先当前时间片 2 * workers 个时间片，因此同时缓冲的
+页数不超过 2 * workers * buffer_pages。落在时间片边界上的消息只返回一次。
+
+    for message in client.backfill_all_messages(since=start_ms, until=end_ms, workers=16):
+        ...
+
+时间片按时间均分，消息分布不均匀时可以增加 shards，让空闲的 worker 去处理后面的时间片。
+'''
+
+import threading
+import time
+
+from six.moves import queue
+
+from .history import iter_pages, get_with_deadline, MAX_PAGE_SIZE
+
+
+_DONE = object()
+
+
+def split_range(since, until, shards):
+    '''
+    :return: 从新到旧的 [(lower, upper)]，lower 包含、upper 不包含，相邻时间片首尾相接
+    '''
+    shards = max(1, min(int(shards), until - since))
+    step = float(until - since) / shards
+    bounds = [until - int(round(step * index)) for index in range(shards)] + [since]
+    return [(bounds[index + 1], bounds[index]) for index in range(shards)]
+
+
+class _Shard(object):
+
+    __slots__ = ('lower', 'upper', 'buffer', 'pages', 'messages', 'elapsed')
+
+    def __init__(self, lower, upper, buffer_pages):
+        self.lower = lower
+        self.upper = upper
+        self.buffer = queue.Queue(maxsize=buffer_pages)
+        self.pages = 0
+        self.messages = 0
+        self.elapsed = None
+
+
+class Backfill(object):
+
+    def __init__(self, fetch_page, since, until=None, shards=None, workers=8,
+                 page_size=MAX_PAGE_SIZE, buffer_pages=4, deadline=None):
+        '''
+        :param fetch_page:   fetch_page(max_ts=..., msgid=..., limit=...) 返回一页消息
+        :param since:        起始时间戳（包含）
+        :param until:        可选  截止时间戳（不包含），默认当前时间
+        :param shards:       可选  时间片个数，默认 workers * 4
+        :param workers:      可选  同时翻页的时间片个数
+        :param page_size:    可选  每页条数，最大 1000
+        :param buffer_pages: 可选  每个时间片最多缓冲的页数
+        :param deadline:     可选  Deadline，超时或取消时停止所有时间片并抛出，
+                                   fetch_page 应把它传给每一页的请求
+        '''
+        if until is None:
+            until = int(time.time() * 1000)
+        self.fetch_page = fetch_page
+        self.since = int(since)
+        self.until = int(until)
+        self.workers = workers
+        self.page_size = min(page_size, MAX_PAGE_SIZE)
+        self.buffer_pages = buffer_pages
+        self.deadline = deadline
+        self._shards = [_Shard(lower, upper, buffer_pages) for lower, upper in
+                        split_range(self.since, self.until, shards or workers * 4)] \
+            if self.until > self.since else []
+        self.duplicates = 0
+        # 正在合并的时间片序号，后面的时间片最多领先 lookahead 个才开始翻页
+        self.lookahead = 2 * workers
+        self._head = 0
+        self._window = threading.Condition()
+        self._stopped = threading.Event()
+
+    def _put(self, shard, item):
+        while not self._stopped.is_set():
+            try:
+                shard.buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _wait_for_window(self, index):
+        with self._window:
+            while index - self._head >= self.lookahead and not self._stopped.is_set():
+                self._window.wait(0.1)
+
+    def _advance(self):
+        with self._window:
+            self._head += 1
+            self._window.notify_all()
+
+    def _walk(self, index):
+        shard = self._shards[index]
+        self._wait_for_window(index)
+        if self._stopped.is_set():
+            return
+        start = time.time()
+        try:
+            for page in iter_pages(self.fetch_page, until=shard.upper, since=shard.lower,
+                                   page_size=self.page_size):
+                # 服务端对 max_ts 的边界处理不同时，只保留属于本时间片的消息
+                page = [message for message in page
+                        if shard.lower <= message.get('timestamp') < shard.upper]
+                if not page:
+                    continue
+                shard.pages += 1
+                shard.messages += len(page)
+                if not self._put(shard, (page, None)):
+                    return
+            self._put(shard, (_DONE, None))
+        except Exception as e:
+            self._put(shard, (_DONE, e))
+        finally:
+            shard.elapsed = time.time() - start
+
+    def iter_pages(self):
+        '''
+        :return: 按时间倒序逐页返回消息列表的生成器
+        '''
+        from concurrent.futures import ThreadPoolExecutor
+
+        # 线程池按提交顺序执行，正在合并的时间片总是已经开始翻页，不会因为后面的
+        # 时间片占满 worker 而卡住
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            for index in range(len(self._shards)):
+                executor.submit(self._walk, index)
+            last_timestamp, last_msgids = None, set()
+            for shard in self._shards:
+                while True:
+                    page, error = get_with_deadline(shard.buffer, self.deadline)
+                    if page is _DONE:
+                        if error is not None:
+                            raise error
+                        break
+                    fresh = []
+                    for message in page:
+                        timestamp = message.get('timestamp')
+                        if timestamp != last_timestamp:
+                            last_timestamp, last_msgids = timestamp, set()
+                        msgid = message.get('msg-id')
+                        if msgid in last_msgids:
+                            self.duplicates += 1
+                            continue
+                        last_msgids.add(msgid)
+                        fresh.append(message)
+                    if fresh:
+                        yield fresh
+                self._advance()
+        finally:
+            self._stopped.set()
+            executor.shutdown(wait=False)
+
+    def __iter__(self):
+        for page in self.iter_pages():
+            for message in page:
+                yield message
+
+    def stats(self):
+        '''
+        :return: {'shards': [{'lower', 'upper', 'pages', 'messages', 'elapsed'}], 'duplicates'}
+        '''
+        return {
+            'shards': [{'lower': shard.lower, 'upper': shard.upper, 'pages': shard.pages,
+                        'messages': shard.messages, 'elapsed': shard.elapsed}
+                       for shard in self._shards],
+            'duplicates': self.duplicates,
+        }
@@ -2,15 +2,22 @@
 
 import re
 import hmac
+import time
 
 import six
 from six.moves.urllib.parse import quote
 
-from .oauth2 import OAuth2Request
-from .json_import import json
+from .oauth2 import OAuth2Request, TRANSPORT_ERRORS
+from .ratelimit import (RATE_LIMIT_CODES, RATE_LIMIT_HEADER,
+                        RATE_LIMIT_REMAINING_HEADER)
+from .retry import hedged_call
+from .instrumentation import RequestInfo, pop_connect_time
 
 
 re_path_template = re.compile('{\w+}')
+re_path_variable = re.compile('{(\w+)}')
+
+RAW_PARAMETERS = frozenset(['body', 'json_body'])
 
 
 def encode_string(value):
@@ -18,6 +25,13 @@ def encode_string(value):
         if isinstance(value, six.text_type) else str(value)
 
 
+def to_text(value):
+    '''
+    encode_string 的结果在 py3 中可能是 bytes 也可能是 str，统一转换为文本后再比较。
+    '''
+    return value.decode('utf-8') if isinstance(value, bytes) else six.text_type(value)
+
+
 class RealtimeClientError(Exception):
     def __init__(self, error_message, status_code=None):
         self.status_code = status_code
@@ -35,20 +49,72 @@ class RealtimeAPIError(Exception):
     def __init__(self, status_code, error_message, *args, **kwargs):
         self.status_code = status_code
         self.error_message = error_message
+        self.http_status = kwargs.get('http_status')
 
     def __str__(self):
         return "(%s) %s" % (self.status_code,
                             self.error_message)
 
 
+def compile_path(path):
+    '''
+    把路径模板拆分为常量与变量名交替的片段，奇数位置为变量名，例如
+    '/classes/_Conversation/{convid}' -> ['/classes/_Conversation/', 'convid', '']
+    '''
+    return tuple(re_path_variable.split(path))
+
+
+class RealtimeRateLimitError(RealtimeAPIError):
+    pass
+
+
+class RealtimeCircuitOpenError(RealtimeClientError):
+    pass
+
+
+class RealtimeTimeoutError(RealtimeClientError):
+    pass
+
+
+class RealtimeCancelledError(RealtimeClientError):
+    pass
+
+
+def is_retryable(error, transport_errors=TRANSPORT_ERRORS):
+    '''
+    限流、5xx、响应无法解析以及网络错误可以重试，其余错误重试也不会成功。
+    超时与取消是调用方的决定，不重试。
+    '''
+    if isinstance(error, (RealtimeTimeoutError, RealtimeCancelledError)):
+        return False
+    if isinstance(error, RealtimeRateLimitError):
+        return True
+    if isinstance(error, RealtimeAPIError):
+        return int(error.http_status or 0) >= 500
+    return isinstance(error, (RealtimeClientError,) + tuple(transport_errors))
+
+
+def name_endpoints(cls):
+    '''
+    类装饰器：把属性名记录为 bind_method 端点的 name，供限流、统计等按端点区分。
+    '''
+    for name, endpoint in list(vars(cls).items()):
+        method_class = getattr(endpoint, 'method_class', None)
+        if method_class is not None and method_class.name is None:
+            method_class.name = name
+    return cls
+
+
 def bind_method(**config):
 
     class RealtimeAPIMethod(object):
 
+        name = config.get('name')
         path = config['path']
         method = config.get('method', 'GET')
         accepts_parameters = config.get("accepts_parameters", [])
         response_type = config.get("response_type", 'entry')
+        root_class = config.get("root_class")
         signature = config.get("signature", False)
         master_key = config.get("master_key", False)
         include_secret = config.get("include_secret", False)
@@ -56,51 +122,79 @@ def bind_method(**config):
         include_signed_request = config.get('include_signed_request', False)
         objectify_response = config.get("objectify_response", True)
         exclude_format = config.get('exclude_format', True)
+        # 默认只有 GET 与 DELETE 视为幂等，可以安全重试
+        idempotent = config.get('idempotent', method in ('GET', 'DELETE'))
+        hedge = config.get('hedge', False)  # 是否允许对冲请求
+        # 是否允许合并相同的并发请求，只适用于 GET
+        single_flight = config.get('single_flight', False) and method == 'GET'
+
+        # 定义端点时预先解析好的部分，每次调用只需填入参数
+        path_segments = compile_path(path)
+        accepted_parameters = frozenset(accepts_parameters)
 
         def __init__(self, api, *args, **kwargs):
             self.api = api
             self.return_json = kwargs.pop('return_json', True)
+            # compact=True 时 list 类型的响应整页转换为 root_class.page_from_list 的结果
+            self.compact = kwargs.pop('compact', False)
+            # 秒数、Deadline 或 CancelToken，重试与所有请求共享同一个截止时间
+            self.deadline = kwargs.pop('deadline', None)
+            if self.deadline is not None:
+                from .deadline import as_deadline
+                self.deadline = as_deadline(self.deadline)
+            # 本次调用使用的 RetryPolicy，默认为客户端的设置，False 表示不重试
+            retry_policy = kwargs.pop('retry_policy', None)
+            self.retry_policy = api.retry_policy if retry_policy is None else retry_policy or None
+            if self.root_class is None and (self.compact or not self.return_json):
+                raise RealtimeClientError(
+                    "%s does not support return_json=False or compact" % self.name)
             self.parameters = {}
             self._build_parameters(args, kwargs)
             self._build_path()
 
         def _build_parameters(self, args, kwargs):
+            parameters = self.parameters
             for index, value in enumerate(args):
                 if value is None:
                     continue
 
                 try:
-                    self.parameters[self.accepts_parameters[index]] = encode_string(value)
+                    parameters[self.accepts_parameters[index]] = encode_string(value)
                 except IndexError:
                     raise RealtimeClientError("Too many arguments supplied")
 
-            for key, value in six.iteritems(kwargs):
-                if value is None or key not in self.accepts_parameters:
+            accepted = self.accepted_parameters
+            for key, value in kwargs.items():
+                if value is None or key not in accepted:
                     continue
-                if key in self.parameters:
+                if key in parameters:
                     raise RealtimeClientError("Parameter %s already supplied" % key)
-                if key not in ['body', 'json_body']:
-                    self.parameters[key] = encode_string(value)
+                if key in RAW_PARAMETERS:
+                    parameters[key] = value
                 else:
-                    self.parameters[key] = value
+                    parameters[key] = encode_string(value)
 
         def _build_path(self):
-            for variable in re_path_template.findall(self.path):
-                name = variable.strip('{}')
-
-                try:
-                    value = quote(self.parameters[name])
-                except KeyError:
-                    raise Exception('No parameter value found for path variable: %s' % name)
-                del self.parameters[name]
-
-                self.path = self.path.replace(variable, value)
-
-            if self.api.format and not self.exclude_format:
+            segments = self.path_segments
+            if len(segments) > 1:
+                segments = list(segments)
+                for index in range(1, len(segments), 2):
+                    name = segments[index]
+                    try:
+                        segments[index] = quote(self.parameters.pop(name))
+                    except KeyError:
+                        raise Exception('No parameter value found for path variable: %s' % name)
+                self.path = ''.join(segments)
+
+            if not self.exclude_format and self.api.format:
                 self.path = self.path + '.%s' % self.api.format
 
         def _do_api_request(self, url, method='GET', body=None,
-                            json_body=None, headers=None):
+                            json_body=None, headers=None, attempt=1, tracker=None):
+            '''
+            :return: (解析后的结果, (status_code, 原始响应内容))。对冲请求与主请求并发执行，
+                     每次请求的状态都只保存在局部变量中
+            '''
             headers = headers or {}
             if (self.signature and
                     self.api.client_ips is not None and
@@ -109,13 +203,78 @@ def bind_method(**config):
                 ips = self.api.client_ips
                 signature = hmac.new(secret, ips, sha256).hexdigest()
 
-            response = OAuth2Request(self.api).make_request(
-                url, method=method, body=body, json_body=json_body, headers=headers)
-            content = response.content
-            status_code = response.status_code
+            deadline = self.deadline
+            timeout = None
+            limiter = self.api.rate_limiter
+            if limiter is not None:
+                wait = limiter.reserve(self.name)
+                if wait > 0:
+                    self._sleep(wait)
+            if deadline is not None:
+                timeout = deadline.request_timeout(self.api.connect_timeout,
+                                                   self.api.read_timeout)
+            instrumentation = self.api.instrumentation
+            info = None
+            if instrumentation.enabled:
+                info = RequestInfo(self.name, method, url, attempt)
+                instrumentation.before_request(info)
+                pop_connect_time()
+            try:
+                start = time.time()
+                response = OAuth2Request(self.api).make_request(
+                    url, method=method, body=body, json_body=json_body, headers=headers,
+                    timeout=timeout)
+                if tracker is not None:
+                    # 只记录网络耗时，不包括限流等待
+                    tracker.add(time.time() - start)
+                if info is not None:
+                    connect = pop_connect_time()
+                    if connect is not None:
+                        info.timings['connect'] = connect
+                    info.timings['ttfb'] = response.elapsed.total_seconds()
+                    info.status_code = response.status_code
+                    info.bytes_received = len(response.content)
+                    if response.request is not None:
+                        info.bytes_sent = len(response.request.body or '')
+                self.update_rate_limit(response.status_code, response.headers)
+                try:
+                    content, _ = self.process_response(response.status_code,
+                                                       response.content, info)
+                    return content, (response.status_code, response.content)
+                except RealtimeRateLimitError:
+                    if limiter is not None:
+                        limiter.on_rate_limited(response.headers)
+                    raise
+            except Exception as e:
+                if info is not None:
+                    info.error = e
+                raise
+            finally:
+                if info is not None:
+                    instrumentation.after_request(info)
+
+        def update_rate_limit(self, status_code, headers):
+            limit = headers.get(RATE_LIMIT_HEADER)
+            if limit is not None:
+                self.api.x_ratelimit = limit
+            remaining = headers.get(RATE_LIMIT_REMAINING_HEADER)
+            if remaining is not None:
+                self.api.x_ratelimit_remaining = remaining
+            if self.api.rate_limiter is not None and 200 <= int(status_code) < 300:
+                self.api.rate_limiter.on_response(headers)
+
+        def process_response(self, status_code, content, info=None):
             try:
-                content_obj = json.loads(content)
+                if info is None:
+                    content_obj = self.api.codec.loads(content)
+                else:
+                    start = time.time()
+                    content_obj = self.api.codec.loads(content)
+                    info.timings['decode'] = time.time() - start
             except ValueError:
+                if int(status_code) == 429:
+                    raise RealtimeRateLimitError(status_code, "Rate limited",
+                                                 http_status=status_code)
                 raise RealtimeClientError(
                     'Unable to parse response, not valid JSON.',
                     status_code=status_code)
@@ -126,12 +285,12 @@ def bind_method(**config):
                 if not self.objectify_response:
                     return content_obj, None
                 if self.response_type == 'list':
-                    for entry in content_obj:
-                        if self.return_json:
-                            api_responses.append(entry)
-                        else:
-                            obj = self.root_class.object_from_dictionary(entry)
-                            api_responses.append(obj)
+                    if self.compact:
+                        api_responses = self.root_class.page_from_list(content_obj)
+                    elif self.return_json:
+                        api_responses = content_obj
+                    else:
+                        api_responses = self.root_class.list_from_dictionaries(content_obj)
                 elif self.response_type == 'entry':
                     data = content_obj
                     if self.return_json:
@@ -140,34 +299,129 @@ def bind_method(**config):
                         api_responses = self.root_class.object_from_dictionary(data)
                 elif self.response_type == 'empty':
                     pass
-                for response in api_responses:
-                    print response
                 return api_responses, None
             else:
                 code = content_obj.get('code')
                 error = content_obj.get('error')
 
-                if code in ['529', '430', '431']:
-                    raise RealtimeAPIError(
-                        response.status_code, "Rate limited",
-                    "Your client is making too many request per second")
+                if int(status_code) == 429 or str(code) in RATE_LIMIT_CODES:
+                    raise RealtimeRateLimitError(
+                        status_code, "Rate limited",
+                    "Your client is making too many request per second",
+                        http_status=status_code)
 
                 if code and error:
-                    raise RealtimeAPIError(code, error)
+                    raise RealtimeAPIError(code, error, http_status=status_code)
+                raise RealtimeAPIError(status_code, content_obj,
+                                       http_status=status_code)
+
+        def is_retryable(self, error, transport_errors=TRANSPORT_ERRORS):
+            return is_retryable(error, transport_errors)
+
+        def _sleep(self, seconds):
+            if self.deadline is None:
+                time.sleep(seconds)
+            else:
+                self.deadline.sleep(seconds)
+
+        def prepare(self):
+            return OAuth2Request(self.api).prepare_request(
+                self.method,
+                self.path,
+                self.parameters,
+                include_secret=self.include_secret,
+                include_signed=self.include_signed,
+                include_secret_request=self.include_signed_request)
+
+        def record_error(self, breaker, error, retryable):
+            if breaker is None:
+                return
+            # 限流与 4xx 说明服务端仍然可用，不计入熔断
+            if retryable and not isinstance(error, RealtimeRateLimitError):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+        def _send(self, request, attempt):
+            tracker = self.api.latency_tracker(self.name) if self.hedge else None
+            if tracker is None:
+                return self._do_api_request(*request, attempt=attempt)
+            delay = tracker.percentile(self.api.hedge_percentile)
+            if delay is None:
+                return self._do_api_request(*request, attempt=attempt, tracker=tracker)
+            return hedged_call(self.api.hedge_executor,
+                               lambda: self._do_api_request(*request, attempt=attempt,
+                                                            tracker=tracker),
+                               delay)
+
+        def flight_key(self):
+            # 路径变量已经填入 path，参数统一转换为文本，limit=5 与 limit='5' 是同一个请求，
+            # 与参数顺序无关；SingleFlight 可能被多个应用的客户端共享，应用与鉴权方式不同的
+            # 请求不能合并
+            api = self.api
+            credential = api.master_key if self.include_secret else api.app_key
+            parameters = tuple(sorted((to_text(key), to_text(value))
+                                      for key, value in self.parameters.items()))
+            return (api.host, api.app_id, self.include_secret, self.include_signed, credential,
+                    self.path, parameters)
 
         def execute(self):
-            url, method, body, json_body, headers = OAuth2Request(
-                self.api).prepare_request(self.method,
-                                          self.path,
-                                          self.parameters,
-                                          include_secret=self.include_secret,
-                                          include_signed=self.include_signed,
-                                          include_secret_request=self.include_signed_request)
-            content, _ = self._do_api_request(url, method, body, json_body, headers)
+            # 带截止时间的请求不与其他调用方合并，避免受别人的截止时间影响
+            flight = self.api.single_flight \
+                if self.single_flight and self.deadline is None else None
+            if flight is None:
+                content, _ = self._execute()
+                return content
+            # 合并的调用方各自解析一份原始响应，不共享返回的对象
+            (content, raw_response), shared = flight.do(self.name, self.flight_key(),
+                                                        self._execute)
+            if shared:
+                content, _ = self.process_response(*raw_response)
             return content
 
+        def _execute(self):
+            '''
+            :return: (解析后的结果, (status_code, 原始响应内容))
+            '''
+            request = self.prepare()
+            policy = self.retry_policy
+            breaker = self.api.circuit_breaker(self.name)
+            deadline = self.deadline
+            attempt = 0
+            while True:
+                attempt += 1
+                if deadline is not None:
+                    deadline.check()
+                if breaker is not None and not breaker.allow():
+                    raise RealtimeCircuitOpenError(
+                        'Circuit open for %s, failing fast' % self.name)
+                try:
+                    result = self._send(request, attempt)
+                except Exception as e:
+                    retryable = self.is_retryable(e)
+                    self.record_error(breaker, e, retryable)
+                    if retryable and deadline is not None:
+                        # 因剩余时间不足而超时的请求报告为 RealtimeTimeoutError
+                        deadline.check()
+                    if (policy is None or not retryable or
+                            not policy.should_retry(self.name, self.idempotent, attempt)):
+                        raise
+                    self.api.instrumentation.record_retry(self.name)
+                    self._sleep(policy.backoff_time(attempt))
+                    continue
+                except BaseException:
+                    if breaker is not None:
+                        breaker.record_cancelled()
+                    raise
+                if breaker is not None:
+                    breaker.record_success()
+                return result
+
     def _call(api, *args, **kwargs):
         method = RealtimeAPIMethod(api, *args, **kwargs)
         return method.execute()
 
+    # 保留端点定义，供异步客户端等根据同一份配置生成对应的方法
+    _call.config = config
+    _call.method_class = RealtimeAPIMethod
     return _call
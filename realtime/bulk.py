@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+'''
+批量管理操作：删除聊天记录、修改聊天记录、踢下线。
+
+条目按需从可迭代对象中读取，最多 workers 个请求同时进行，单个条目失败只记录在结果中，
+不会中断整批任务。所有请求经过 bind_method，因此受客户端的限流器与重试策略约束；
+rate 参数可以再为这一批任务单独限速，避免影响同一个应用的线上请求。
+
+传入 checkpoint 路径时，每个成功的条目都会追加记录，中断后用同样的参数重新执行会跳过
+已完成的条目，失败的条目会被重试。
+
+deadline（秒数、Deadline 或 CancelToken）限制整批任务的时间：超时或取消后不再读取新的
+条目，正在进行的条目记为失败，统计结果中 interrupted 为对应的错误信息，配合 checkpoint
+下次执行时从中断处继续。
+
+    stats = client.bulk_delete_messages(client.iter_messages_by_from('spammer'),
+                                        rate=20, checkpoint='cleanup.ckpt')
+'''
+
+import time
+
+from .checkpoint import Checkpoint
+from .deadline import as_deadline
+from .fanout import bounded_map
+from .ratelimit import TokenBucket
+
+
+def message_key(item):
+    '''
+    :param item: (convid, msgid, timestamp) 元组，或历史记录接口返回的消息
+    :return: (convid, msgid, timestamp)
+    '''
+    if isinstance(item, (tuple, list)):
+        convid, msgid, timestamp = item
+    else:
+        convid, msgid, timestamp = item.get('conv-id'), item.get('msg-id'), item.get('timestamp')
+    return convid, msgid, int(timestamp)
+
+
+class BulkJob(object):
+
+    def __init__(self, func, key, workers=8, rate=None, checkpoint=None, dry_run=False,
+                 progress=None, progress_every=1000, deadline=None):
+        '''
+        :param func:           func(item)，发出一个请求
+        :param key:            key(item)，返回条目在断点与结果中的标识（字符串）
+        :param workers:        可选  最大并发请求数
+        :param rate:           可选  这批任务每秒最多发出的请求数
+        :param checkpoint:     可选  断点文件路径
+        :param dry_run:        可选  只统计将要处理的条目，不发出请求
+        :param progress:       可选  progress(stats)，每处理 progress_every 个条目及结束时调用
+        :param progress_every: 可选  调用 progress 的间隔条目数
+        :param deadline:       可选  Deadline，func 应把它传给每个请求
+        '''
+        self.func = func
+        self.key = key
+        self.workers = workers
+        self.bucket = TokenBucket(rate) if rate else None
+        self.checkpoint = Checkpoint(checkpoint) if checkpoint else None
+        self.dry_run = dry_run
+        self.progress = progress
+        self.progress_every = progress_every
+        self.deadline = deadline
+        self.stats = {
+            'total': 0,
+            'succeeded': 0,
+            'skipped': 0,
+            'failed': {},
+            'dry_run': dry_run,
+            'elapsed': 0.0,
+            'interrupted': None,
+        }
+
+    def _pending(self, items):
+        # 跳过断点中已完成的条目，条目本身由 bounded_map 按需读取
+        for item in items:
+            self.stats['total'] += 1
+            try:
+                key = self.key(item)
+            except (KeyError, TypeError, ValueError) as e:
+                self.stats['failed'][repr(item)] = 'Invalid item: %s' % e
+                continue
+            if self.checkpoint is not None and self.checkpoint.is_done(key):
+                self.stats['skipped'] += 1
+                continue
+            yield key, item
+
+    def _call(self, pair):
+        if self.bucket is not None:
+            wait = self.bucket.reserve()
+            if wait > 0:
+                if self.deadline is None:
+                    time.sleep(wait)
+                else:
+                    self.deadline.sleep(wait)
+        return self.func(pair[1])
+
+    def run(self, items):
+        '''
+        :return: {'total', 'succeeded', 'skipped', 'failed': {key: error}, 'dry_run', 'elapsed',
+                  'interrupted'}
+        '''
+        stats = self.stats
+        start = time.time()
+        processed = 0
+        try:
+            if self.dry_run:
+                outcomes = ((pair, None, None) for pair in self._pending(items))
+            else:
+                outcomes = bounded_map(self._call, self._pending(items), self.workers,
+                                       self.deadline)
+            for (key, _), _, error in outcomes:
+                if error is None:
+                    stats['succeeded'] += 1
+                    if self.checkpoint is not None and not self.dry_run:
+                        self.checkpoint.mark_done(key)
+                else:
+                    stats['failed'][key] = str(error)
+                processed += 1
+                if self.progress is not None and processed % self.progress_every == 0:
+                    stats['elapsed'] = time.time() - start
+                    self.progress(stats)
+        finally:
+            stats['elapsed'] = time.time() - start
+            error = self.deadline.error() if self.deadline is not None else None
+            if error is not None:
+                stats['interrupted'] = str(error)
+            if self.checkpoint is not None:
+                self.checkpoint.close()
+        if self.progress is not None:
+            self.progress(stats)
+        return stats
+
+
+def bulk_delete_messages(client, items, **options):
+    '''
+    批量删除聊天记录。
+
+    :param client:  RealtimeAPI
+    :param items:   (convid, msgid, timestamp) 元组或历史记录接口返回的消息
+    :param options: BulkJob 的参数：workers、rate、checkpoint、dry_run、progress、deadline
+    :return: 统计结果，key 为 'convid:msgid:timestamp'
+    '''
+    deadline = options['deadline'] = as_deadline(options.get('deadline'))
+
+    def _delete(item):
+        convid, msgid, timestamp = message_key(item)
+        return client.delete_message(convid=convid, msgid=msgid, timestamp=timestamp,
+                                     deadline=deadline)
+
+    return BulkJob(_delete, lambda item: '%s:%s:%d' % message_key(item), **options).run(items)
+
+
+def bulk_update_messages(client, bodies, **options):
+    '''
+    批量修改聊天记录。
+
+    :param client:  RealtimeAPI
+    :param bodies:  update_message 的 json_body，须包含 conv_id、msgid、timestamp
+    :param options: BulkJob 的参数
+    :return: 统计结果，key 为 'convid:msgid:timestamp'
+    '''
+    deadline = options['deadline'] = as_deadline(options.get('deadline'))
+
+    def _key(body):
+        return '%s:%s:%d' % (body['conv_id'], body['msgid'], int(body['timestamp']))
+
+    def _update(body):
+        return client.update_message(json_body=body, deadline=deadline)
+
+    return BulkJob(_update, _key, **options).run(bodies)
+
+
+def bulk_kick(client, client_ids, reason=None, **options):
+    '''
+    批量踢下线。
+
+    :param client:     RealtimeAPI
+    :param client_ids: client id 的可迭代对象
+    :param reason:     可选  踢下线的原因，会下发给客户端
+    :param options:    BulkJob 的参数
+    :return: 统计结果，key 为 client id
+    '''
+    deadline = options['deadline'] = as_deadline(options.get('deadline'))
+
+    def _kick(client_id):
+        body = {'client_id': client_id}
+        if reason is not None:
+            body['reason'] = reason
+        return client.client_kick(json_body=body, deadline=deadline)
+
+    return BulkJob(_kick, lambda client_id: client_id, **options).run(client_ids)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+'''
+对话元数据缓存。
+
+Conversation.init(client, convid=...) 需要先确认对话存在，开启缓存后同一个对话在 ttl 内
+只查询一次。缓存按 LRU 淘汰，容量有上限；add_members / remove_members 成功后会就地更新
+缓存中的成员列表。可选的负缓存会在 negative_ttl 内记住不存在的对话，避免重复查询。
+
+    client = RealtimeAPI(..., conversation_cache=True)
+    client = RealtimeAPI(..., conversation_cache={'maxsize': 10000, 'ttl': 300,
+                                                  'negative_ttl': 30})
+'''
+
+import collections
+import threading
+import time
+
+
+METADATA_FIELDS = ('objectId', 'name', 'm', 'mu', 'c', 'tr', 'sys', 'unique',
+                   'createdAt', 'updatedAt')
+
+MISSING = object()
+
+
+def conversation_metadata(conversation):
+    '''
+    :param conversation: get_conversation 返回的 dict
+    :return: 只包含 METADATA_FIELDS 的 dict
+    '''
+    return dict((field, conversation[field]) for field in METADATA_FIELDS
+                if conversation.get(field) is not None)
+
+
+class ConversationCache(object):
+
+    def __init__(self, maxsize=1024, ttl=60.0, negative_ttl=None, clock=time.time):
+        '''
+        :param maxsize:      最多缓存多少个对话，超出后淘汰最久未使用的
+        :param ttl:          元数据的有效期（秒）
+        :param negative_ttl: 可选  不存在的对话的有效期（秒），None 表示不做负缓存
+        '''
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = collections.OrderedDict()
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, convid):
+        '''
+        :return: 元数据 dict；负缓存命中时返回 MISSING；未命中返回 None
+        '''
+        with self._lock:
+            entry = self._entries.get(convid)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, value = entry
+            if expires <= self._clock():
+                del self._entries[convid]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._touch(convid, entry)
+            if value is MISSING:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, convid, metadata):
+        with self._lock:
+            self._store(convid, metadata, self.ttl)
+
+    def set_missing(self, convid):
+        if self.negative_ttl is None:
+            return
+        with self._lock:
+            self._store(convid, MISSING, self.negative_ttl)
+
+    def update_members(self, convid, add=(), remove=()):
+        '''
+        在缓存的成员列表上应用一次成员变更，对话不在缓存中时不做任何事。
+        '''
+        with self._lock:
+            entry = self._entries.get(convid)
+            if entry is None or entry[1] is MISSING:
+                return
+            metadata = dict(entry[1])
+            removed = set(remove)
+            members = [member for member in metadata.get('m') or []
+                       if member not in removed]
+            for member in add:
+                if member not in members:
+                    members.append(member)
+            metadata['m'] = members
+            self._entries[convid] = (entry[0], metadata)
+
+    def invalidate(self, convid):
+        with self._lock:
+            self._entries.pop(convid, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': (self.hits + self.negative_hits) / float(lookups)
+                if lookups else 0.0,
+            }
+
+    def _touch(self, convid, entry):
+        # OrderedDict.move_to_end 在 Python 2 中不存在
+        del self._entries[convid]
+        self._entries[convid] = entry
+
+    def _store(self, convid, value, ttl):
+        self._entries.pop(convid, None)
+        self._entries[convid] = (self._clock() + ttl, value)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+'''
+追加写入的断点记录。
+
+每次更新追加一行 JSON，加载时按顺序回放，同一个 key 以最后一行为准。
+追加写避免了大批量任务每次更新都重写整个文件。加载时截掉进程中断时没有写完的最后一行，
+否则之后追加的记录会接在这半行后面一起丢失。
+
+追加的行数达到 compact_lines 与上次压缩时的 key 数中较大的一个时压缩文件：每个 key 只保留最终状态，
+状态相同的 key（如批量任务中的 {"done": true}）合并为一行 {"keys": [...], ...}。
+'''
+
+import io
+import os
+import threading
+
+from .json_import import json
+
+
+class Checkpoint(object):
+
+    # 压缩时每行最多合并的 key 数
+    GROUP_SIZE = 1000
+
+    def __init__(self, path=None, compact_lines=10000):
+        '''
+        :param path:          断点文件路径，为 None 时只保存在内存中
+        :param compact_lines: 追加至少这么多行后才压缩
+        '''
+        self.path = path
+        self.compact_lines = compact_lines
+        self._states = {}
+        self._lock = threading.Lock()
+        self._file = None
+        # 上次压缩之后追加的行数，与上次压缩时的 key 数
+        self._appended = 0
+        self._compacted = 0
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with io.open(self.path, 'rb') as f:
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            # 进程中断时最后一行可能没有写完整
+            with io.open(self.path, 'r+b') as f:
+                f.truncate(end)
+        for line in data[:end].decode('utf-8').splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            self._appended += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict):
+                continue
+            if isinstance(record.get('keys'), list):
+                keys = record.pop('keys')
+            elif 'key' in record:
+                keys = [record.pop('key')]
+            else:
+                # 没有 key 的记录与无法解析的行一样跳过，不影响之后的恢复
+                continue
+            for key in keys:
+                self._states.setdefault(key, {}).update(record)
+        if self._should_compact():
+            self._compact()
+
+    def _should_compact(self):
+        # 每次压缩写出所有 key，间隔随 key 数增长，平摊到每次更新是常数
+        return self._appended >= max(self.compact_lines, self._compacted)
+
+    @staticmethod
+    def _line(record):
+        line = json.dumps(record)
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        return line + u'\n'
+
+    def _compact(self):
+        # 先写临时文件再替换，替换前崩溃时原文件仍然完整
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        groups = {}
+        temp = self.path + '.tmp'
+        with io.open(temp, 'w', encoding='utf-8') as f:
+            for key, state in self._states.items():
+                try:
+                    groups.setdefault(tuple(sorted(state.items())), []).append(key)
+                except TypeError:
+                    f.write(self._line(dict(state, key=key)))
+            for state, keys in groups.items():
+                for start in range(0, len(keys), self.GROUP_SIZE):
+                    f.write(self._line(dict(state, keys=keys[start:start + self.GROUP_SIZE])))
+            f.flush()
+            os.fsync(f.fileno())
+        if os.name == 'nt' and os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(temp, self.path)
+        self._appended = 0
+        self._compacted = len(self._states)
+
+    def get(self, key, default=None):
+        with self._lock:
+            state = self._states.get(key)
+            return dict(state) if state is not None else default
+
+    def is_done(self, key):
+        state = self.get(key)
+        return bool(state and state.get('done'))
+
+    def update(self, key, **state):
+        with self._lock:
+            self._states.setdefault(key, {}).update(state)
+            if self.path is None:
+                return
+            if self._file is None:
+                self._file = io.open(self.path, 'a', encoding='utf-8')
+            self._file.write(self._line(dict(state, key=key)))
+            self._file.flush()
+            self._appended += 1
+            if self._should_compact():
+                self._compact()
+
+    def mark_done(self, key, **state):
+        self.update(key, done=True, **state)
+
+    def keys(self):
+        with self._lock:
+            return list(self._states)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
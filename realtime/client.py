@@ -1,18 +1,27 @@
 # -*-coding: utf-8 -*-
 
 import time
-
-import leancloud
-from leancloud.errors import LeanCloudError
+import threading
 
 from .oauth2 import OAuth2API
-from .bind import bind_method, RealtimeAPIError
+from .bind import bind_method, name_endpoints, RealtimeAPIError
 from .helper import md5_constructor as md5
+from .history import iter_messages, MAX_PAGE_SIZE
+from .ratelimit import get_rate_limiter
+from .fanout import broadcast, send_many, message_body, text_message
+from .retry import CircuitBreaker, LatencyTracker
+from .cache import ConversationCache, conversation_metadata, MISSING
+from .deadline import as_deadline
+from .message import Message
 
 
 SUPPORTED_FORMATS = ['json']
 
+# LeanCloud 的 Object not found 错误码
+NOT_FOUND_CODE = 101
+
 
+@name_endpoints
 class RealtimeAPI(OAuth2API):
 
     host = 'api.leancloud.cn'
@@ -22,15 +31,233 @@ class RealtimeAPI(OAuth2API):
     api_name = 'Realtime'
     x_ratelimit_remaining  = None
     x_ratelimit = None
+    rate_limiter = None
+    retry_policy = None
+    circuit_breaker_options = None
+    hedge_percentile = None
+    conversation_cache = None
+    member_coalescer = None
+    single_flight = None
+    send_dispatcher = None
 
     def __init__(self, *args, **kwargs):
-        format = kwargs.get('format', 'json')
-        self.json_body = kwargs.get('json_body', None)
+        '''
+        除 OAuth2API 的参数外还支持：
+
+        :param rate_limit:      可选  每秒请求数上限，同一 app_id 的客户端共享一个限流器，
+                                      rate_limit 与 endpoint_limits 须与已有的限流器一致
+        :param endpoint_limits: 可选  端点级别的限制，如 {'send_message': 50}
+        :param rate_limiter:    可选  直接指定 RateLimiter 实例
+        :param retry_policy:    可选  RetryPolicy，不传则失败后不重试；端点也接受 retry_policy
+                                      参数，覆盖单次调用的设置，False 表示不重试
+        :param circuit_breaker: 可选  True 或 CircuitBreaker 的参数 dict，为每个端点启用熔断
+        :param hedge_percentile: 可选  查询类请求耗时超过该分位数（如 95）后发出对冲请求
+        :param conversation_cache: 可选  True、ConversationCache 的参数 dict 或实例，
+                                         缓存 Conversation.init 查询到的对话元数据
+        :param coalesce_members:   可选  True 或 MembershipCoalescer 的参数 dict，合并
+                                         add_members / remove_members 请求，二者改为返回 Future
+        :param single_flight:      可选  True 或 SingleFlight 实例，相同的并发查询只发出一次
+                                         请求，共享同一个响应
+        :param send_queue:         可选  True、SendDispatcher 的参数 dict 或实例，供
+                                         enqueue_send 在后台发送消息，可指定磁盘 spool
+        :param transport:          可选  'requests'（默认）、'http2'、'h2c' 或 transport 实例，
+                                         见 realtime.transport
+        '''
+        format = kwargs.pop('format', 'json')
+        self.json_body = kwargs.pop('json_body', None)
+        rate_limiter = kwargs.pop('rate_limiter', None)
+        rate_limit = kwargs.pop('rate_limit', None)
+        endpoint_limits = kwargs.pop('endpoint_limits', None)
+        self.retry_policy = kwargs.pop('retry_policy', None)
+        circuit_breaker = kwargs.pop('circuit_breaker', None)
+        if circuit_breaker:
+            self.circuit_breaker_options = \
+                circuit_breaker if isinstance(circuit_breaker, dict) else {}
+        self.hedge_percentile = kwargs.pop('hedge_percentile', None)
+        conversation_cache = kwargs.pop('conversation_cache', None)
+        if conversation_cache is True:
+            conversation_cache = ConversationCache()
+        elif isinstance(conversation_cache, dict):
+            conversation_cache = ConversationCache(**conversation_cache)
+        self.conversation_cache = conversation_cache
+        coalesce_members = kwargs.pop('coalesce_members', None)
+        single_flight = kwargs.pop('single_flight', None)
+        send_queue = kwargs.pop('send_queue', None)
+        self._circuit_breakers = {}
+        self._latency_trackers = {}
+        self._hedge_executor = None
+        self._resilience_lock = threading.Lock()
         if format in SUPPORTED_FORMATS:
             self.format = format
         else:
             raise Exception("Unsupported format")
         super(RealtimeAPI, self).__init__(**kwargs)
+        if rate_limiter is None and rate_limit is not None:
+            rate_limiter = get_rate_limiter(self.app_id, rate_limit,
+                                            endpoint_limits=endpoint_limits)
+        self.rate_limiter = rate_limiter
+        if single_flight is True:
+            from .singleflight import SingleFlight
+            single_flight = SingleFlight(self.instrumentation)
+        self.single_flight = single_flight or None
+        if send_queue is True:
+            send_queue = {}
+        if isinstance(send_queue, dict):
+            from .dispatch import SendDispatcher
+            send_queue = SendDispatcher(self, **send_queue)
+        self.send_dispatcher = send_queue or None
+        if coalesce_members:
+            from .coalesce import MembershipCoalescer
+            self.member_coalescer = MembershipCoalescer(
+                self, **(coalesce_members if isinstance(coalesce_members, dict) else {}))
+
+    def broadcast(self, conv_ids, from_peer, message, transient=True, no_sync=False,
+                  push_data=None, to_peers=None, workers=16, deadline=None):
+        '''
+        向多个对话并发发送同一条消息，消息只序列化一次，单个对话失败不影响其他对话。
+
+        :param conv_ids:  必填  对话 id 列表
+        :param from_peer: 必填  消息的发件人 client Id
+        :param message:   必填  消息内容
+        :param workers:   可选  最大并发请求数
+        :param deadline:  可选  秒数、Deadline 或 CancelToken，超时或取消后返回已完成的部分，
+                                其余对话的 error 为 RealtimeTimeoutError 或 RealtimeCancelledError
+        :return: [SendResult(target, ok, result, error)]，与 conv_ids 顺序一致
+        '''
+        return broadcast(self, conv_ids, from_peer, message, transient=transient,
+                         no_sync=no_sync, push_data=push_data, to_peers=to_peers,
+                         workers=workers, deadline=deadline)
+
+    def send_many(self, bodies, workers=16, deadline=None):
+        '''
+        并发发送多条消息。
+
+        :param bodies:   必填  send_message 的 json_body 列表
+        :param workers:  可选  最大并发请求数
+        :param deadline: 可选  同 broadcast
+        :return: [SendResult(target, ok, result, error)]，与 bodies 顺序一致
+        '''
+        return send_many(self, bodies, workers=workers, deadline=deadline)
+
+    def bulk_delete_messages(self, items, **options):
+        '''
+        批量删除聊天记录，单条失败不中断，支持限速、断点续传与 dry run。
+
+        :param items:   必填  (convid, msgid, timestamp) 元组，或 iter_messages 等返回的消息
+        :param options: 可选  workers、rate、checkpoint、dry_run、progress、progress_every、
+                        deadline
+        :return: {'total', 'succeeded', 'skipped', 'failed': {key: error}, ...}
+        '''
+        from .bulk import bulk_delete_messages
+        return bulk_delete_messages(self, items, **options)
+
+    def bulk_update_messages(self, bodies, **options):
+        '''
+        批量修改聊天记录，参数同 bulk_delete_messages。
+
+        :param bodies: 必填  update_message 的 json_body，须包含 conv_id、msgid、timestamp
+        '''
+        from .bulk import bulk_update_messages
+        return bulk_update_messages(self, bodies, **options)
+
+    def bulk_kick(self, client_ids, reason=None, **options):
+        '''
+        批量踢下线，参数同 bulk_delete_messages。
+
+        :param client_ids: 必填  client id 列表
+        :param reason:     可选  踢下线的原因
+        '''
+        from .bulk import bulk_kick
+        return bulk_kick(self, client_ids, reason=reason, **options)
+
+    def follow(self, conv_ids, callback, **options):
+        '''
+        持续轮询多个对话的新消息，活跃对话轮询更频繁，空闲对话逐渐拉长间隔。
+
+        :param conv_ids: 必填  对话 id 列表
+        :param callback: 必填  callback(convid, messages)，messages 按时间正序
+        :param options:  可选  Follower 的其他参数，如 min_interval、max_interval、workers
+        :return: 已启动的 Follower，调用 stop() 停止
+        '''
+        from .follow import Follower
+        return Follower(self, conv_ids, callback, **options).start()
+
+    def circuit_breaker(self, endpoint):
+        if self.circuit_breaker_options is None:
+            return None
+        with self._resilience_lock:
+            breaker = self._circuit_breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._circuit_breakers[endpoint] = \
+                    CircuitBreaker(**self.circuit_breaker_options)
+            return breaker
+
+    def latency_tracker(self, endpoint):
+        if self.hedge_percentile is None:
+            return None
+        with self._resilience_lock:
+            tracker = self._latency_trackers.get(endpoint)
+            if tracker is None:
+                tracker = self._latency_trackers[endpoint] = LatencyTracker()
+            return tracker
+
+    @property
+    def hedge_executor(self):
+        with self._resilience_lock:
+            if self._hedge_executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=self.pool_maxsize * 2)
+            return self._hedge_executor
+
+    def enqueue_send(self, json_body, block=True, timeout=None, deadline=None):
+        '''
+        把消息放入后台发送队列后立即返回，未开启 send_queue 时按默认参数创建队列。
+
+        :param json_body: 必填  send_message 的 json_body，可用 message_body 生成
+        :param block:     可选  队列已满时是否等待
+        :param timeout:   可选  队列已满时最多等待的秒数，超时抛出 SendQueueFullError
+        :param deadline:  可选  秒数、Deadline 或 CancelToken，超时或取消后消息不再发送
+        :return: Future，结果为 send_message 的返回值
+        '''
+        if self.send_dispatcher is None:
+            with self._resilience_lock:
+                if self.send_dispatcher is None:
+                    from .dispatch import SendDispatcher
+                    self.send_dispatcher = SendDispatcher(self)
+        return self.send_dispatcher.submit(json_body, block=block, timeout=timeout,
+                                           deadline=deadline)
+
+    def flush_sends(self, timeout=None):
+        '''
+        等待后台发送队列中的消息全部发送完成。
+
+        :return: 是否在 timeout 内全部完成
+        '''
+        if self.send_dispatcher is None:
+            return True
+        return self.send_dispatcher.flush(timeout)
+
+    def flush_members(self, timeout=None):
+        '''
+        立即发送所有合并中的成员变更并等待完成，未开启 coalesce_members 时不做任何事。
+
+        :return: 是否在 timeout 内全部完成
+        '''
+        if self.member_coalescer is None:
+            return True
+        return self.member_coalescer.flush(timeout)
+
+    def close(self):
+        if self.send_dispatcher is not None:
+            self.send_dispatcher.close(timeout=self.send_dispatcher.drain_timeout)
+        if self.member_coalescer is not None:
+            self.member_coalescer.close()
+        with self._resilience_lock:
+            executor, self._hedge_executor = self._hedge_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        super(RealtimeAPI, self).close()
 
     create_conversation = bind_method(
         method="POST",
@@ -39,6 +266,14 @@ class RealtimeAPI(OAuth2API):
         accepts_parameters=['json_body'],
     )
 
+    get_conversation = bind_method(
+        method="GET",
+        path='/classes/_Conversation/{convid}',
+        signature=False,
+        single_flight=True,
+        accepts_parameters=['convid'],
+    )
+
     # https://leancloud.cn/docs/realtime_rest_api.html#增删普通对话成员
     manage_members = bind_method(
         method="PUT",
@@ -53,6 +288,10 @@ class RealtimeAPI(OAuth2API):
         path="/rtm/messages/history",
         signature=False,
         include_secret=True,
+        hedge=True,
+        single_flight=True,
+        response_type='list',
+        root_class=Message,
         accepts_parameters=['convid', 'max_ts', 'msgid', 'limit',
                             'reversed', 'peerid', 'nonce',
                             'signature_ts', 'signature'],
@@ -64,6 +303,10 @@ class RealtimeAPI(OAuth2API):
         path="/rtm/messages/history",
         signature=False,
         include_secret=True,
+        hedge=True,
+        single_flight=True,
+        response_type='list',
+        root_class=Message,
         include_signed=True,
         accepts_parameters=['from', 'max_ts', 'msgid', 'limit']
     )
@@ -74,6 +317,10 @@ class RealtimeAPI(OAuth2API):
         path="/rtm/messages/history",
         signature=False,
         include_secret=True,
+        hedge=True,
+        single_flight=True,
+        response_type='list',
+        root_class=Message,
         include_signed=True,
         accepts_parameters=['max_ts', 'msgid', 'limit']
     )
@@ -83,7 +330,7 @@ class RealtimeAPI(OAuth2API):
         method='POST',
         path="/rtm/messages",
         include_secret=True,
-        accepts_parameters=['json_body']
+        accepts_parameters=['json_body', 'body']
     )
 
     # https://leancloud.cn/docs/realtime_rest_api.html#删除聊天记录
@@ -109,34 +356,142 @@ class RealtimeAPI(OAuth2API):
         accepts_parameters=['json_body'],
     )
 
+    def iter_messages_by_from(self, from_peer, since=None, until=None,
+                              page_size=MAX_PAGE_SIZE, prefetch=True, compact=False,
+                              deadline=None):
+        '''
+        按时间倒序遍历某个用户发送的全部聊天记录，自动翻页。
+
+        :param from_peer: 必填  发送者 client id
+        :param since:     可选  截止时间戳（包含）
+        :param until:     可选  起始时间戳（不包含），默认当前时间
+        :param page_size: 可选  每页条数，最大 1000
+        :param prefetch:  可选  是否在后台预取下一页
+        :param compact:   可选  按 MessagePage 保存每一页，逐条返回 Message
+        :param deadline:  可选  秒数、Deadline 或 CancelToken，从调用时开始计时，所有页共享；
+                                超时或取消时在已返回的消息之后抛出异常
+        :return: message generator
+        '''
+        deadline = as_deadline(deadline)
+
+        def fetch_page(max_ts, msgid, limit):
+            return self.query_message_by_from(**{'from': from_peer, 'max_ts': max_ts,
+                                                 'msgid': msgid, 'limit': limit,
+                                                 'compact': compact, 'deadline': deadline})
+        return iter_messages(fetch_page, until=until, since=since,
+                             page_size=page_size, prefetch=prefetch, deadline=deadline)
+
+    def iter_all_messages(self, since=None, until=None,
+                          page_size=MAX_PAGE_SIZE, prefetch=True, compact=False,
+                          deadline=None):
+        '''
+        按时间倒序遍历应用的全部聊天记录，参数同 iter_messages_by_from。
+        '''
+        deadline = as_deadline(deadline)
+
+        def fetch_page(max_ts, msgid, limit):
+            return self.query_all_message(max_ts=max_ts, msgid=msgid, limit=limit,
+                                          compact=compact, deadline=deadline)
+        return iter_messages(fetch_page, until=until, since=since,
+                             page_size=page_size, prefetch=prefetch, deadline=deadline)
+
+    def iter_all_message_batches(self, since=None, until=None, page_size=MAX_PAGE_SIZE,
+                                 batch_size=100000, prefetch=True, deadline=None):
+        '''
+        按时间倒序遍历应用的全部聊天记录，逐批返回按列保存的 ColumnBatch（需要 numpy）。
+
+        :param batch_size: 可选  每个批次的消息数
+        :return: ColumnBatch generator，其余参数同 iter_all_messages
+        '''
+        from .columnar import iter_history_batches
+        deadline = as_deadline(deadline)
+
+        def fetch_page(max_ts, msgid, limit):
+            return self.query_all_message(max_ts=max_ts, msgid=msgid, limit=limit,
+                                          compact=True, deadline=deadline)
+        return iter_history_batches(fetch_page, since=since, until=until,
+                                    page_size=page_size, batch_size=batch_size,
+                                    prefetch=prefetch, deadline=deadline)
+
+    def backfill_all_messages(self, since, until=None, **options):
+        '''
+        把 [since, until) 切成多个时间片并行翻页，按时间倒序逐条返回应用的全部聊天记录。
+
+        :param since:   必填  起始时间戳（包含）
+        :param until:   可选  截止时间戳（不包含），默认当前时间
+        :param options: 可选  Backfill 的参数：workers、shards、page_size、buffer_pages、deadline
+        :return: Backfill，可迭代，stats() 返回各时间片的统计
+        '''
+        from .backfill import Backfill
+        deadline = options['deadline'] = as_deadline(options.get('deadline'))
+
+        def fetch_page(max_ts, msgid, limit):
+            return self.query_all_message(max_ts=max_ts, msgid=msgid, limit=limit,
+                                          deadline=deadline)
+        return Backfill(fetch_page, since, until, **options)
 
 
 class Conversation(object):
 
-    def __init__(self, client, convid):
+    def __init__(self, client, convid, metadata=None):
         '''
-        :param client:  realtime client
-        :param convid: conversation id
+        :param client:   realtime client
+        :param convid:   conversation id
+        :param metadata: 可选  对话元数据（name、m、mu、c 等）
         '''
         self.client = client
         self.convid = convid
+        self.metadata = metadata
+
+    def _get_conversation_by_id(self, id, deadline=None):
+        return self.client.get_conversation(convid=id, deadline=deadline)
 
-    def _get_conversation_by_id(self, id):
-        leancloud.init(self.client.app_id, self.client.app_key)
-        _Conversation = leancloud.Object.extend('_Conversation')
-        # query = leancloud.Query('_Conversation')
-        # 也可以获取 Todo 的 query 属性
-        query = _Conversation.query
+    def _cached_metadata(self, convid):
+        cache = self.client.conversation_cache
+        if cache is None:
+            return None
+        metadata = cache.get(convid)
+        if metadata is MISSING:
+            raise RealtimeAPIError(NOT_FOUND_CODE, 'Object not found.')
+        return metadata
 
-        # 这里填入需要查询的 objectId
+    def _lookup_failed(self, convid, error):
+        cache = self.client.conversation_cache
+        if cache is not None and str(error.status_code) == str(NOT_FOUND_CODE):
+            cache.set_missing(convid)
+
+    def _store_metadata(self, convid, conversation):
+        if not conversation:
+            self._lookup_failed(convid, RealtimeAPIError(NOT_FOUND_CODE, 'Object not found.'))
+            raise RealtimeAPIError('404', 'Conversation not found')
+        metadata = conversation_metadata(conversation)
+        cache = self.client.conversation_cache
+        if cache is not None:
+            cache.set(convid, metadata)
+        return metadata
+
+    def _load_metadata(self, convid, deadline=None):
+        metadata = self._cached_metadata(convid)
+        if metadata is not None:
+            return metadata
         try:
-            conversation = query.get(id)
-        except LeanCloudError as e:
-            raise RealtimeAPIError(e.code, e.error)
-        return conversation
+            conversation = self._get_conversation_by_id(convid, deadline)
+        except RealtimeAPIError as e:
+            self._lookup_failed(convid, e)
+            raise
+        return self._store_metadata(convid, conversation)
+
+    def _created(self, conversation, params):
+        convid = conversation.get('objectId')
+        metadata = dict((key, value) for key, value in params.items() if value is not None)
+        metadata.update(conversation)
+        cache = self.client.conversation_cache
+        if cache is not None and convid:
+            cache.set(convid, metadata)
+        return type(self)(client=self.client, convid=convid, metadata=metadata)
 
     @classmethod
-    def init(cls, client, convid=None, name=None, m=None, c=None, mu=None):
+    def init(cls, client, convid=None, name=None, m=None, c=None, mu=None, deadline=None):
         '''
         :param client:  realtime client
         :param convid: conversation id
@@ -144,42 +499,62 @@ class Conversation(object):
         :param m:       conversation members
         :param c:       conversation creator clientid
         :param mu:      对话中设置了静音的成员，仅针对 iOS 以及 Windows Phone 用户有效。
+        :param deadline: 可选  秒数、Deadline 或 CancelToken
         '''
         instance = cls(client=client, convid=convid)
         if convid:
-            conversation = instance._get_conversation_by_id(convid)
-            if not conversation:
-                raise RealtimeAPIError('404', 'Conversation not found')
-            return cls(client=client, convid=convid)
+            instance.metadata = instance._load_metadata(convid, deadline)
+            return instance
         else:
             params = {
                 "name": name,
                 "m": m,
                 "mu": mu,
             }
-            conversation = self.client.create_conversation(json_body=params)
-            return cls(client=client, convid=conversation.get('objectId'))
+            conversation = client.create_conversation(json_body=params, deadline=deadline)
+            return instance._created(conversation, params)
 
-    def add_members(self, client_ids=None):
-        params = {
-            "m": {
-                "__op": "AddUnique",
-                "objects": client_ids
-            }
-        }
-        return self.client.manage_members(convid=self.convid, json_body=params)
+    def _members_changed(self, client_ids, op):
+        cache = self.client.conversation_cache
+        if cache is None:
+            return
+        if op == 'AddUnique':
+            cache.update_members(self.convid, add=client_ids or ())
+        else:
+            cache.update_members(self.convid, remove=client_ids or ())
 
-    def remove_members(self, client_ids=None):
+    def _manage_members(self, client_ids, op, deadline=None):
+        if self.client.member_coalescer is not None and deadline is None:
+            return self.client.member_coalescer.submit(self.convid, client_ids, op)
         params = {
             "m": {
-                "__op": "Remove",
+                "__op": op,
                 "objects": client_ids
             }
         }
-        return self.client.manage_members(convid=self.convid, json_body=params)
+        try:
+            result = self.client.manage_members(convid=self.convid, json_body=params,
+                                                deadline=deadline)
+        except Exception:
+            # 请求失败时服务端状态未知，直接丢弃缓存
+            if self.client.conversation_cache is not None:
+                self.client.conversation_cache.invalidate(self.convid)
+            raise
+        self._members_changed(client_ids, op)
+        return result
+
+    def add_members(self, client_ids=None, deadline=None):
+        '''
+        :param deadline: 可选  秒数、Deadline 或 CancelToken，指定时不参与 coalesce_members 合并
+        '''
+        return self._manage_members(client_ids, "AddUnique", deadline)
+
+    def remove_members(self, client_ids=None, deadline=None):
+        return self._manage_members(client_ids, "Remove", deadline)
 
     def query_message(self, max_ts=None, msgid=None, limit=20, reversed=False,
-                      peerid=None, nonce=None, signature_ts=None):
+                      peerid=None, nonce=None, signature_ts=None, return_json=True,
+                      compact=False, deadline=None):
         '''
         :param max_ts:       可选  查询起始的时间戳，返回小于这个时间(不包含)的记录。默认是当前时间。
         :param msgid:        可选  起始的消息 id，使用时必须加上对应消息的时间戳 max_ts 参数，一起作为查询的起点。
@@ -189,9 +564,13 @@ class Conversation(object):
         :param nonce:        可选  签名随机字符串（签名参数）
         :param signature_ts: 可选  签名时间戳（签名参数）
         :param signature:    可选  签名
+        :param return_json:  可选  为 False 时返回 Message 列表
+        :param compact:      可选  为 True 时返回按列保存的 MessagePage
+        :param deadline:     可选  秒数、Deadline 或 CancelToken，包括重试在内的总时间
         :return: message list
         '''
         params = dict(
+            convid=self.convid,
             max_ts=max_ts,
             msgid=msgid,
             limit=limit,
@@ -199,6 +578,9 @@ class Conversation(object):
             peerid=peerid,
             nonce=nonce,
             signature_ts=signature_ts,
+            return_json=return_json,
+            compact=compact,
+            deadline=deadline,
         )
         if peerid:
             timestamp = signature_ts or '%d' % (time.time() * 1000)
@@ -210,7 +592,7 @@ class Conversation(object):
                 nonce=nonce,
                 sign_ts=timestamp
             )
-            signature = md5(sign_str).hexdigest()
+            signature = md5(sign_str.encode('utf-8')).hexdigest()
             params.update({
                 'nonce': nonce,
                 'signature_ts': timestamp,
@@ -219,7 +601,67 @@ class Conversation(object):
         messages = self.client.query_message(**params)
         return messages
 
-    def send(self, from_peer, message, transient=True, no_sync=False, push_data={}):
+    def iter_messages(self, since=None, until=None, page_size=MAX_PAGE_SIZE,
+                      prefetch=True, peerid=None, compact=False, deadline=None):
+        '''
+        按时间倒序遍历对话的聊天记录，自动翻页。
+
+        :param since:     可选  截止时间戳（包含），早于它的消息不再返回
+        :param until:     可选  起始时间戳（不包含），默认当前时间
+        :param page_size: 可选  每页条数，最大 1000
+        :param prefetch:  可选  是否在处理当前页时后台预取下一页
+        :param peerid:    可选  查看者 id（签名参数）
+        :param compact:   可选  按 MessagePage 保存每一页，逐条返回 Message
+        :param deadline:  可选  秒数、Deadline 或 CancelToken，从调用时开始计时，所有页共享；
+                                超时或取消时在已返回的消息之后抛出异常
+        :return: message generator
+        '''
+        deadline = as_deadline(deadline)
+
+        def fetch_page(max_ts, msgid, limit):
+            return self.query_message(max_ts=max_ts, msgid=msgid, limit=limit,
+                                      peerid=peerid, compact=compact, deadline=deadline)
+        return iter_messages(fetch_page, until=until, since=since,
+                             page_size=page_size, prefetch=prefetch, deadline=deadline)
+
+    def iter_message_batches(self, since=None, until=None, page_size=MAX_PAGE_SIZE,
+                             batch_size=100000, prefetch=True, peerid=None, deadline=None):
+        '''
+        按时间倒序遍历对话的聊天记录，逐批返回按列保存的 ColumnBatch（需要 numpy）。
+
+        :param batch_size: 可选  每个批次的消息数
+        :return: ColumnBatch generator，其余参数同 iter_messages
+        '''
+        from .columnar import iter_history_batches
+        deadline = as_deadline(deadline)
+
+        def fetch_page(max_ts, msgid, limit):
+            return self.query_message(max_ts=max_ts, msgid=msgid, limit=limit,
+                                      peerid=peerid, compact=True, deadline=deadline)
+        return iter_history_batches(fetch_page, since=since, until=until,
+                                    page_size=page_size, batch_size=batch_size,
+                                    prefetch=prefetch, deadline=deadline)
+
+    def backfill_messages(self, since, until=None, peerid=None, **options):
+        '''
+        把 [since, until) 切成多个时间片并行翻页，按时间倒序逐条返回对话的聊天记录。
+
+        :param since:   必填  起始时间戳（包含）
+        :param until:   可选  截止时间戳（不包含），默认当前时间
+        :param peerid:  可选  查看者 id（签名参数）
+        :param options: 可选  Backfill 的参数：workers、shards、page_size、buffer_pages、deadline
+        :return: Backfill，可迭代，stats() 返回各时间片的统计
+        '''
+        from .backfill import Backfill
+        deadline = options['deadline'] = as_deadline(options.get('deadline'))
+
+        def fetch_page(max_ts, msgid, limit):
+            return self.query_message(max_ts=max_ts, msgid=msgid, limit=limit, peerid=peerid,
+                                      deadline=deadline)
+        return Backfill(fetch_page, since, until, **options)
+
+    def send(self, from_peer, message, transient=True, no_sync=False, push_data={},
+             deadline=None):
         '''
         :param from_peer: 必填  消息的发件人 client Id
         :param message:   必填	消息内容（这里的消息内容的本质是字符串，但是我们对字符串内部的格式没有做限定，
@@ -228,10 +670,18 @@ class Conversation(object):
         :param no_sync:   可选	默认情况下消息会被同步给在线的 from_peer 用户的客户端，设置为 true 禁用此功能。
         :param push_data: 可选	以消息附件方式设置本条消息的离线推送通知内容。
                                 如果目标接收者使用的是 iOS 设备并且当前不在线，我们会按照该参数填写的内容来发离线推送。
+        :param deadline:  可选	秒数、Deadline 或 CancelToken，包括重试在内的总时间
         :return:  {}
         '''
-        pass
+        params = message_body(from_peer, message, conv_id=self.convid,
+                              transient=transient, no_sync=no_sync,
+                              push_data=push_data)
+        return self.client.send_message(json_body=params, deadline=deadline)
 
-
-    def send_text(self, from_peer, message, transient=True, no_sync=False, push_data={}):
-        pass
+    def send_text(self, from_peer, message, transient=True, no_sync=False, push_data={},
+                  deadline=None):
+        '''
+        发送文本消息（_lctype 为 -1），客户端 SDK 可以直接解析为 TextMessage，参数同 send。
+        '''
+        return self.send(from_peer, text_message(message), transient=transient,
+                         no_sync=no_sync, push_data=push_data, deadline=deadline)
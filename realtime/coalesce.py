@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+'''
+合并对话成员变更。
+
+开启后 Conversation.add_members / remove_members 不再立即发请求，而是按 convid 缓冲
+window 秒（或缓冲的 client id 达到 max_batch 个），然后合并成最少的 manage_members 请求：
+每个对话最多一个 AddUnique 和一个 Remove。同一个 client id 先加后删（或先删后加）只保留
+最后一次操作，结果与逐个请求一致。
+
+每次调用返回一个 concurrent.futures.Future，结果是携带该变更的那次请求的返回值或异常。
+进程正常退出时会发出所有尚未发送的变更。
+
+    client = RealtimeAPI(..., coalesce_members={'window': 0.2, 'max_batch': 500})
+    futures = [conv.add_members([cid]) for cid in client_ids]
+    client.flush_members()
+'''
+
+import atexit
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+
+ADD = 'AddUnique'
+REMOVE = 'Remove'
+
+_coalescers = weakref.WeakSet()
+
+
+class _Pending(object):
+
+    __slots__ = ('deadline', 'ops', 'waiters')
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        # client id -> 最后一次操作
+        self.ops = {}
+        # client id -> 等待该 client id 结果的 _Waiter
+        self.waiters = {}
+
+
+class _Waiter(object):
+    # 一次调用涉及的多个 client id 可能落在不同请求里，全部完成后才设置结果
+
+    __slots__ = ('future', 'remaining')
+
+    def __init__(self, future, remaining):
+        self.future = future
+        self.remaining = remaining
+
+    def resolve(self, result, error):
+        # 同一个对话的请求只在一个发送线程里依次处理，无需加锁
+        if self.future.done():
+            return
+        if error is not None:
+            self.future.set_exception(error)
+            return
+        self.remaining -= 1
+        if self.remaining <= 0:
+            self.future.set_result(result)
+
+
+class MembershipCoalescer(object):
+
+    def __init__(self, client, window=0.05, max_batch=500, workers=4):
+        '''
+        :param client:    RealtimeAPI
+        :param window:    变更最多缓冲多少秒
+        :param max_batch: 单个对话缓冲的 client id 达到该数量时立即发送，同时也是单个请求
+                          objects 的上限
+        :param workers:   同时发送请求的线程数
+        '''
+        self.client = client
+        self.window = window
+        self.max_batch = max_batch
+        self.requests = 0
+        self.changes = 0
+        self._pending = {}
+        self._in_flight = set()
+        self._closed = False
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._thread = threading.Thread(target=self._run, name='realtime-coalesce')
+        self._thread.daemon = True
+        self._thread.start()
+        _coalescers.add(self)
+
+    def add(self, convid, client_ids):
+        return self.submit(convid, client_ids, ADD)
+
+    def remove(self, convid, client_ids):
+        return self.submit(convid, client_ids, REMOVE)
+
+    def submit(self, convid, client_ids, op):
+        '''
+        :return: Future，对应请求完成后得到 manage_members 的返回值
+        '''
+        future = Future()
+        client_ids = list(set(client_ids or []))
+        if not client_ids:
+            future.set_result({})
+            return future
+        waiter = _Waiter(future, len(client_ids))
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('MembershipCoalescer is closed')
+            pending = self._pending.get(convid)
+            if pending is None:
+                pending = self._pending[convid] = _Pending(time.time() + self.window)
+            for client_id in client_ids:
+                pending.ops[client_id] = op
+                pending.waiters.setdefault(client_id, []).append(waiter)
+            self.changes += len(client_ids)
+            if len(pending.ops) >= self.max_batch:
+                pending.deadline = 0
+            self._condition.notify()
+        return future
+
+    def flush(self, timeout=None):
+        '''
+        立即发送所有缓冲的变更，并等待请求完成。
+        '''
+        with self._condition:
+            for pending in self._pending.values():
+                pending.deadline = 0
+            self._condition.notify()
+            end = None if timeout is None else time.time() + timeout
+            while self._pending or self._in_flight:
+                remaining = None if end is None else end - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        with self._condition:
+            if self._closed:
+                return
+        self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._executor.shutdown(wait=True)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._closed and not self._pending:
+                        return
+                    now = time.time()
+                    # 同一个对话上一批还没发送完时先不处理，保证变更按顺序生效
+                    ready = [(convid, pending) for convid, pending in self._pending.items()
+                             if convid not in self._in_flight]
+                    due = [convid for convid, pending in ready if pending.deadline <= now]
+                    if due:
+                        break
+                    deadlines = [pending.deadline for _, pending in ready]
+                    self._condition.wait(min(deadlines) - now if deadlines else None)
+                batches = []
+                for convid in due:
+                    pending = self._pending.pop(convid)
+                    self._in_flight.add(convid)
+                    batches.append((convid, pending))
+            for convid, pending in batches:
+                try:
+                    self._executor.submit(self._send, convid, pending)
+                except RuntimeError:
+                    # 解释器退出时 concurrent.futures 已不再接受新任务，在当前线程发送
+                    self._send(convid, pending)
+
+    def _send(self, convid, pending):
+        try:
+            for op in (ADD, REMOVE):
+                client_ids = [client_id for client_id, last in pending.ops.items()
+                              if last == op]
+                for start in range(0, len(client_ids), self.max_batch):
+                    self._send_chunk(convid, op, client_ids[start:start + self.max_batch],
+                                     pending)
+        finally:
+            with self._condition:
+                self._in_flight.discard(convid)
+                self._condition.notify_all()
+
+    def _send_chunk(self, convid, op, client_ids, pending):
+        params = {
+            "m": {
+                "__op": op,
+                "objects": client_ids
+            }
+        }
+        result = error = None
+        try:
+            result = self.client.manage_members(convid=convid, json_body=params)
+        except Exception as e:
+            error = e
+        with self._condition:
+            self.requests += 1
+        cache = self.client.conversation_cache
+        if cache is not None:
+            if error is not None:
+                cache.invalidate(convid)
+            elif op == ADD:
+                cache.update_members(convid, add=client_ids)
+            else:
+                cache.update_members(convid, remove=client_ids)
+        for client_id in client_ids:
+            for waiter in pending.waiters.pop(client_id, ()):
+                waiter.resolve(result, error)
+
+
+@atexit.register
+def _flush_all():
+    for coalescer in list(_coalescers):
+        coalescer.close()
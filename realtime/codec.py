@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+'''
+JSON 编解码与请求体压缩。
+
+RealtimeAPI(codec=...) 选择请求与响应使用的 JSON 库，所有 codec 都是 bytes 进 bytes 出：
+dumps 直接得到可以发送的请求体，loads 直接解析响应的原始字节，中间不再生成 str。
+
+    'default'  json_import 选出的库（ujson > simplejson > json），与之前的行为一致
+    'json'     标准库
+    'ujson'    需要安装 ujson
+    'orjson'   需要安装 orjson，仅支持 Python 3
+    'auto'     已安装的库中最快的一个：orjson > ujson > json
+
+响应的 gzip 由 requests / aiohttp 处理：默认发送 Accept-Encoding: gzip, deflate，
+读取响应时按块流式解压。请求体默认不压缩，RealtimeAPI(compress_threshold=n) 会把
+不小于 n 字节的请求体 gzip 后发送，并带上 Content-Encoding: gzip。
+'''
+
+import zlib
+
+import six
+
+from . import json_import
+
+
+class StdlibCodec(object):
+
+    name = 'json'
+
+    def __init__(self):
+        import json
+        self.module = json
+
+    def dumps(self, obj):
+        data = self.module.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+        return data.encode('utf-8') if isinstance(data, six.text_type) else data
+
+    def loads(self, data):
+        if isinstance(data, bytes) and not six.PY2:
+            data = data.decode('utf-8')
+        return self.module.loads(data)
+
+
+class ModuleCodec(object):
+    # json_import 选出的库，或其他 dumps 返回 str 的 json 兼容库
+
+    def __init__(self, module, name=None):
+        self.module = module
+        self.name = name or module.__name__
+
+    def dumps(self, obj):
+        data = self.module.dumps(obj)
+        return data.encode('utf-8') if isinstance(data, six.text_type) else data
+
+    def loads(self, data):
+        return self.module.loads(data)
+
+
+class UJSONCodec(ModuleCodec):
+
+    def __init__(self):
+        import ujson
+        super(UJSONCodec, self).__init__(ujson, 'ujson')
+
+    def dumps(self, obj):
+        data = self.module.dumps(obj, ensure_ascii=False)
+        return data.encode('utf-8') if isinstance(data, six.text_type) else data
+
+
+class OrjsonCodec(object):
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.module = orjson
+
+    def dumps(self, obj):
+        return self.module.dumps(obj)
+
+    def loads(self, data):
+        return self.module.loads(data)
+
+
+DEFAULT_CODEC = ModuleCodec(json_import.json)
+
+CODECS = {
+    'json': StdlibCodec,
+    'ujson': UJSONCodec,
+    'orjson': OrjsonCodec,
+}
+
+
+def get_codec(codec):
+    '''
+    :param codec: codec 名称、codec 实例或 None（默认 codec）
+    :return: 具有 dumps / loads 方法的 codec
+    '''
+    if codec is None or codec == 'default':
+        return DEFAULT_CODEC
+    if not isinstance(codec, six.string_types):
+        return codec
+    if codec == 'auto':
+        for name in ('orjson', 'ujson'):
+            try:
+                return CODECS[name]()
+            except ImportError:
+                continue
+        return StdlibCodec()
+    try:
+        factory = CODECS[codec]
+    except KeyError:
+        raise ValueError('Unsupported codec: %s' % codec)
+    return factory()
+
+
+def gzip_compress(data, level=6):
+    '''
+    :return: gzip 格式的数据（Python 2 没有 gzip.compress）
+    '''
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+'''
+按列保存的聊天记录批次。
+
+分析类任务只需要每条消息的少数几个字段，ColumnBatch 把多页消息合并为 NumPy 数组：
+
+    timestamp  int64   毫秒时间戳
+    conv       int32   对话编号，对应 batch.convids[conv]
+    sender     int32   发送者编号，对应 batch.senders[sender]
+    msgid      object  消息 id
+    length     int32   消息内容 data 的长度
+
+对话 id 与发送者按批次做字典编码，分组统计直接在整数编号上进行（见 realtime.analytics）。
+ColumnBatch 可以转换为 NumPy 结构化数组、pyarrow.Table，或通过 write_parquet 写入
+Parquet 文件。依赖 numpy，Arrow / Parquet 另需 pyarrow。
+
+    for batch in conversation.iter_message_batches(since=start_ms, batch_size=100000):
+        ...
+    write_parquet(client.iter_all_message_batches(since=start_ms), 'history.parquet')
+'''
+
+import numpy
+
+from .history import iter_pages, prefetch_pages, MAX_PAGE_SIZE
+
+
+DEFAULT_BATCH_SIZE = 100000
+
+
+class ColumnBatch(object):
+
+    __slots__ = ('timestamp', 'conv', 'sender', 'msgid', 'length', 'convids', 'senders')
+
+    def __init__(self, timestamp, conv, sender, msgid, length, convids, senders):
+        self.timestamp = timestamp
+        self.conv = conv
+        self.sender = sender
+        self.msgid = msgid
+        self.length = length
+        self.convids = convids
+        self.senders = senders
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __repr__(self):
+        return '<ColumnBatch %d messages, %d conversations, %d senders>' % (
+            len(self), len(self.convids), len(self.senders))
+
+    @classmethod
+    def from_messages(cls, messages):
+        '''
+        :param messages: dict、Message 或 MessagePage 的序列
+        '''
+        builder = BatchBuilder()
+        builder.extend(messages)
+        return builder.build()
+
+    def to_structured(self):
+        '''
+        :return: NumPy 结构化数组，字段为 timestamp、convid、from、msgid、length
+        '''
+        convids = numpy.array(self.convids or [''], dtype=numpy.str_)
+        senders = numpy.array(self.senders or [''], dtype=numpy.str_)
+        msgids = numpy.array(self.msgid, dtype=numpy.str_) if len(self) else \
+            numpy.array([], dtype='U1')
+        dtype = [('timestamp', 'i8'), ('convid', convids.dtype), ('from', senders.dtype),
+                 ('msgid', msgids.dtype), ('length', 'i4')]
+        records = numpy.empty(len(self), dtype=dtype)
+        records['timestamp'] = self.timestamp
+        records['convid'] = convids[self.conv]
+        records['from'] = senders[self.sender]
+        records['msgid'] = msgids
+        records['length'] = self.length
+        return records
+
+    def to_arrow(self):
+        '''
+        :return: pyarrow.Table，convid 与 from 为字典编码列
+        '''
+        pa = _pyarrow()
+        return pa.Table.from_arrays([
+            pa.array(self.timestamp, type=pa.int64()),
+            pa.DictionaryArray.from_arrays(pa.array(self.conv, type=pa.int32()),
+                                           pa.array(self.convids, type=pa.string())),
+            pa.DictionaryArray.from_arrays(pa.array(self.sender, type=pa.int32()),
+                                           pa.array(self.senders, type=pa.string())),
+            pa.array(self.msgid, type=pa.string()),
+            pa.array(self.length, type=pa.int32()),
+        ], names=['timestamp', 'convid', 'from', 'msgid', 'length'])
+
+
+class BatchBuilder(object):
+    '''
+    逐页追加消息，build 时一次性转换为数组。
+    '''
+
+    def __init__(self):
+        self._timestamps = []
+        self._convs = []
+        self._senders = []
+        self._msgids = []
+        self._lengths = []
+        self._conv_codes = {}
+        self._sender_codes = {}
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    @staticmethod
+    def _encode(values, codes):
+        # 字典编码：同一批次内相同的字符串对应同一个编号
+        return [codes.setdefault(value, len(codes)) for value in values]
+
+    def extend(self, messages):
+        if hasattr(messages, 'column'):
+            # MessagePage 已经按列保存，直接取整列
+            timestamps = messages.column('timestamp')
+            convids = messages.column('conv-id')
+            senders = messages.column('from')
+            msgids = messages.column('msg-id')
+            payloads = messages.column('data')
+        else:
+            messages = list(messages)
+            timestamps = [message.get('timestamp') for message in messages]
+            convids = [message.get('conv-id') for message in messages]
+            senders = [message.get('from') for message in messages]
+            msgids = [message.get('msg-id') for message in messages]
+            payloads = [message.get('data') for message in messages]
+        self._timestamps.extend(timestamps)
+        self._convs.extend(self._encode(convids, self._conv_codes))
+        self._senders.extend(self._encode(senders, self._sender_codes))
+        self._msgids.extend(msgids)
+        self._lengths.extend(len(data) if data is not None else 0 for data in payloads)
+
+    def build(self):
+        def _names(codes):
+            names = [None] * len(codes)
+            for value, code in codes.items():
+                names[code] = value if value is not None else ''
+            return names
+
+        return ColumnBatch(
+            timestamp=numpy.array(self._timestamps, dtype=numpy.int64),
+            conv=numpy.array(self._convs, dtype=numpy.int32),
+            sender=numpy.array(self._senders, dtype=numpy.int32),
+            msgid=numpy.array(self._msgids, dtype=object),
+            length=numpy.array(self._lengths, dtype=numpy.int32),
+            convids=_names(self._conv_codes),
+            senders=_names(self._sender_codes))
+
+
+def iter_batches(pages, batch_size=DEFAULT_BATCH_SIZE):
+    '''
+    :param pages:      页的可迭代对象，如 iter_pages、Backfill.iter_pages 的返回值
+    :param batch_size: 每个批次的消息数（按整页累积，可能略多）
+    :return: ColumnBatch 生成器
+    '''
+    builder = BatchBuilder()
+    for page in pages:
+        builder.extend(page)
+        if len(builder) >= batch_size:
+            yield builder.build()
+            builder = BatchBuilder()
+    if len(builder):
+        yield builder.build()
+
+
+def iter_history_batches(fetch_page, since=None, until=None, page_size=MAX_PAGE_SIZE,
+                         batch_size=DEFAULT_BATCH_SIZE, prefetch=True, deadline=None):
+    '''
+    按时间倒序翻页，逐批返回 ColumnBatch。fetch_page 返回 MessagePage 时不会构造 dict。
+    '''
+    pages = iter_pages(fetch_page, until=until, since=since, page_size=page_size)
+    if prefetch:
+        pages = prefetch_pages(pages, deadline=deadline)
+    return iter_batches(pages, batch_size)
+
+
+def concat_batches(batches):
+    '''
+    合并多个批次，对话与发送者重新编号。
+    '''
+    batches = list(batches)
+    conv_codes, sender_codes = {}, {}
+    convs, senders = [], []
+    for batch in batches:
+        # 每个批次的编号表映射到合并后的编号表，再整列查表
+        conv_map = numpy.array([conv_codes.setdefault(name, len(conv_codes))
+                                for name in batch.convids] or [0], dtype=numpy.int32)
+        sender_map = numpy.array([sender_codes.setdefault(name, len(sender_codes))
+                                  for name in batch.senders] or [0], dtype=numpy.int32)
+        convs.append(conv_map[batch.conv])
+        senders.append(sender_map[batch.sender])
+
+    def _names(codes):
+        names = [None] * len(codes)
+        for value, code in codes.items():
+            names[code] = value
+        return names
+
+    def _concat(arrays, dtype):
+        return numpy.concatenate(arrays) if arrays else numpy.array([], dtype=dtype)
+
+    return ColumnBatch(
+        timestamp=_concat([batch.timestamp for batch in batches], numpy.int64),
+        conv=_concat(convs, numpy.int32),
+        sender=_concat(senders, numpy.int32),
+        msgid=_concat([batch.msgid for batch in batches], object),
+        length=_concat([batch.length for batch in batches], numpy.int32),
+        convids=_names(conv_codes),
+        senders=_names(sender_codes))
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('Arrow and Parquet output require the pyarrow package')
+    return pyarrow
+
+
+def write_parquet(batches, path, compression='snappy'):
+    '''
+    把 ColumnBatch 逐批写入一个 Parquet 文件，每个批次一个 row group。
+
+    :return: 写入的消息数
+    '''
+    pa = _pyarrow()
+    import pyarrow.parquet as pq
+
+    writer = None
+    rows = 0
+    try:
+        for batch in batches:
+            table = batch.to_arrow()
+            if writer is None:
+                # 各批次的字典不同，写入时统一为普通字符串列
+                schema = pa.schema([
+                    ('timestamp', pa.int64()), ('convid', pa.string()), ('from', pa.string()),
+                    ('msgid', pa.string()), ('length', pa.int32())])
+                writer = pq.ParquetWriter(path, schema, compression=compression)
+            writer.write_table(table.cast(writer.schema))
+            rows += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
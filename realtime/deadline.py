@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+'''
+截止时间与取消。
+
+所有 bind_method 端点以及 Conversation、分页、回填、批量发送等方法都接受 deadline 参数，
+可以是秒数、Deadline 或 CancelToken。一次调用中的所有请求（翻页、重试、并发发送）共享
+同一个 Deadline：每个请求的 socket 超时不超过剩余时间，重试的等待时间超过剩余时间时
+直接失败，剩余时间用完后抛出 RealtimeTimeoutError。
+
+CancelToken 可以在任意线程中取消：正在等待的重试、翻页与并发请求立即停止并抛出
+RealtimeCancelledError，已经发出的同步请求在其 socket 超时内结束后丢弃结果；
+asyncio 客户端会直接取消正在进行的请求。批量操作（broadcast、send_many、bulk_*）
+返回已完成的部分，未完成的条目记为超时或取消::
+
+    token = CancelToken()
+    deadline = Deadline(30, token)
+    for message in conversation.iter_messages(since=start_ms, deadline=deadline):
+        ...
+    results = client.broadcast(conv_ids, 'sys', 'hello', deadline=5)
+    token.cancel()        # 在其他线程中调用
+'''
+
+import threading
+import time
+
+from .bind import RealtimeTimeoutError, RealtimeCancelledError
+
+# 不受系统时间调整影响
+clock = getattr(time, 'monotonic', time.time)
+
+
+class CancelToken(object):
+
+    def __init__(self):
+        self.reason = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason=None):
+        '''
+        取消所有使用该 token 的操作，重复调用没有效果。
+
+        :param reason: 可选  写入 RealtimeCancelledError 的说明
+        '''
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def add_callback(self, callback):
+        '''
+        :param callback: callback()，取消时在调用 cancel 的线程中执行；已经取消时立即执行
+        '''
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            try:
+                self._callbacks.remove(callback)
+            except ValueError:
+                pass
+
+    def wait(self, timeout=None):
+        '''
+        :return: 是否在 timeout 内被取消
+        '''
+        return self._event.wait(timeout)
+
+    def error(self):
+        if not self._event.is_set():
+            return None
+        return RealtimeCancelledError(self.reason or 'Operation cancelled')
+
+
+class Deadline(object):
+
+    def __init__(self, timeout=None, token=None):
+        '''
+        :param timeout: 可选  从现在开始的秒数，None 表示不限时间
+        :param token:   可选  CancelToken
+        '''
+        self.expires_at = None if timeout is None else clock() + timeout
+        self.token = token
+
+    def __repr__(self):
+        return '<Deadline remaining=%r cancelled=%r>' % (self.remaining(), self.cancelled)
+
+    def remaining(self):
+        '''
+        :return: 剩余秒数，不限时间时为 None
+        '''
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - clock())
+
+    @property
+    def expired(self):
+        return self.expires_at is not None and clock() >= self.expires_at
+
+    @property
+    def cancelled(self):
+        return self.token is not None and self.token.cancelled
+
+    def error(self):
+        '''
+        :return: 已取消或超时时对应的异常，否则为 None
+        '''
+        if self.token is not None and self.token.cancelled:
+            return self.token.error()
+        if self.expired:
+            return RealtimeTimeoutError('Deadline exceeded')
+        return None
+
+    def check(self):
+        error = self.error()
+        if error is not None:
+            raise error
+
+    def sleep(self, seconds):
+        '''
+        等待 seconds 秒，期间被取消时立即抛出；等待时间超过剩余时间时不再等待，直接抛出超时。
+        '''
+        self.check()
+        remaining = self.remaining()
+        if remaining is not None and seconds >= remaining:
+            raise RealtimeTimeoutError('Deadline exceeded')
+        if self.token is not None:
+            self.token.wait(seconds)
+        else:
+            time.sleep(seconds)
+        self.check()
+
+    def request_timeout(self, connect_timeout=None, read_timeout=None):
+        '''
+        :return: requests 的 (connect, read) 超时，均不超过剩余时间
+        '''
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            if connect_timeout is None and read_timeout is None:
+                return None
+            return connect_timeout, read_timeout
+        return (remaining if connect_timeout is None else min(connect_timeout, remaining),
+                remaining if read_timeout is None else min(read_timeout, remaining))
+
+    def child(self, timeout):
+        '''
+        :return: 共享同一个 CancelToken、截止时间不晚于当前 Deadline 的新 Deadline
+        '''
+        deadline = Deadline(timeout, self.token)
+        if self.expires_at is not None and \
+                (deadline.expires_at is None or self.expires_at < deadline.expires_at):
+            deadline.expires_at = self.expires_at
+        return deadline
+
+
+def as_deadline(value):
+    '''
+    :param value: None、秒数、Deadline 或 CancelToken
+    :return: Deadline 或 None
+    '''
+    if value is None or isinstance(value, Deadline):
+        return value
+    if isinstance(value, CancelToken):
+        return Deadline(token=value)
+    return Deadline(float(value))
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+'''
+后台发送消息。
+
+client.enqueue_send(json_body) 把消息放入有界队列后立即返回，由后台线程调用 send_message，
+请求处理不再等待 LeanCloud 的响应。队列（包括正在发送的消息）达到 maxsize 时，
+enqueue_send 阻塞到有空位为止，或在 timeout 后抛出 SendQueueFullError。
+
+指定 spool 路径后，每条消息入队前先追加写入磁盘，发送成功后再追加一条确认记录。
+进程崩溃或被杀掉后，用同一个 spool 重新创建客户端时会先重新发送没有确认的消息，
+因此每条消息至少发送一次（可能重复）。spool 打开时，以及文件超过 compact_size 时
+（持续有消息在发送也一样）会重写为只包含未确认的消息，关闭时没有未确认的消息则清空。
+
+    client = RealtimeAPI(..., send_queue={'workers': 8, 'spool': '/var/lib/app/send.spool'})
+    future = client.enqueue_send(message_body('sys', 'hello', conv_id=convid))
+    client.flush_sends()     # 等待队列发送完毕
+    client.close()           # 默认先发送完队列中的消息
+
+发送失败时按 SendDispatcher 的 retry_policy 重试（默认最多 5 次），客户端的 retry_policy
+不再作用于队列中的消息，尝试次数不会叠加；服务端明确拒绝（4xx）的消息不再保留，
+重试耗尽的消息留在 spool 中，下次启动时重新发送。
+stats() 返回队列长度、发送数、失败数以及从入队到发送成功的延迟分位数。
+
+enqueue_send 可以为每条消息指定 deadline（秒数、Deadline 或 CancelToken）：排队等待、
+发送与重试共用这个截止时间，超时或取消后消息不再发送，Future 收到对应的异常，
+spool 中的记录随之确认。
+'''
+
+import atexit
+import io
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future
+
+from .bind import RealtimeClientError, is_retryable
+from .deadline import as_deadline
+from .json_import import json
+from .retry import LatencyTracker, RetryPolicy
+
+_dispatchers = weakref.WeakSet()
+
+
+class SendQueueFullError(RealtimeClientError):
+    pass
+
+
+class Spool(object):
+    '''
+    追加写入的发送记录，每行一个 JSON：{"id": n, "body": {...}} 或 {"ack": n}。
+    '''
+
+    def __init__(self, path, fsync=False, compact_size=1 << 20):
+        '''
+        :param path:         spool 文件路径
+        :param fsync:        每条消息写入后是否 fsync，默认只 flush 到操作系统
+        :param compact_size: 文件超过该字节数时重写为只包含未确认的消息
+        '''
+        self.path = path
+        self.fsync = fsync
+        self.compact_size = compact_size
+        self._lock = threading.Lock()
+        # 未确认的消息 {id: body}，压缩时重写这些消息
+        self._live = {}
+        self._next_id = 1
+        self.recovered = self._load() if os.path.exists(path) else []
+        self._rewrite(self.recovered)
+        self._file = io.open(path, 'a', encoding='utf-8')
+
+    def _load(self):
+        pending = {}
+        with io.open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 进程中断时最后一行可能没有写完整
+                    continue
+                if 'ack' in record:
+                    pending.pop(record['ack'], None)
+                else:
+                    pending[record['id']] = record['body']
+                    self._next_id = max(self._next_id, record['id'] + 1)
+        return sorted(pending.items())
+
+    def _rewrite(self, records):
+        # 先写临时文件再替换，替换前崩溃时原文件仍然完整
+        temp = self.path + '.tmp'
+        with io.open(temp, 'w', encoding='utf-8') as f:
+            for spool_id, body in records:
+                f.write(self._line({'id': spool_id, 'body': body}))
+            f.flush()
+            os.fsync(f.fileno())
+        if os.name == 'nt' and os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(temp, self.path)
+        self._live = dict(records)
+        # 未确认的消息本身超过 compact_size 时，文件再增长一倍才重写，避免每次确认都重写
+        self._compact_at = max(self.compact_size, 2 * os.path.getsize(self.path))
+
+    @staticmethod
+    def _line(record):
+        line = json.dumps(record)
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        return line + u'\n'
+
+    def _write(self, line, sync):
+        self._file.write(line)
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def append(self, body):
+        '''
+        :return: 消息在 spool 中的 id
+        '''
+        with self._lock:
+            spool_id = self._next_id
+            self._next_id += 1
+            self._write(self._line({'id': spool_id, 'body': body}), self.fsync)
+            self._live[spool_id] = body
+            return spool_id
+
+    def ack(self, spool_id):
+        with self._lock:
+            self._live.pop(spool_id, None)
+            if self._file.tell() >= self._compact_at:
+                self._file.close()
+                try:
+                    self._rewrite(sorted(self._live.items()))
+                finally:
+                    self._file = io.open(self.path, 'a', encoding='utf-8')
+                return
+            # 确认记录丢失只会导致重复发送，不需要 fsync
+            self._write(self._line({'ack': spool_id}), False)
+
+    def __len__(self):
+        return len(self._live)
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            if not self._live:
+                self._file.seek(0)
+                self._file.truncate()
+            self._file.close()
+
+
+class _Entry(object):
+
+    __slots__ = ('body', 'spool_id', 'enqueued_at', 'future', 'deadline')
+
+    def __init__(self, body, spool_id, future, deadline=None):
+        self.body = body
+        self.spool_id = spool_id
+        self.enqueued_at = time.time()
+        self.future = future
+        self.deadline = deadline
+
+
+class SendDispatcher(object):
+
+    def __init__(self, client, maxsize=10000, workers=4, spool=None, fsync=False,
+                 retry_policy=None, on_error=None, drain_timeout=10.0):
+        '''
+        :param client:        RealtimeAPI
+        :param maxsize:       队列中（包括正在发送的）消息数上限
+        :param workers:       发送线程数
+        :param spool:         可选  spool 文件路径，或 Spool 实例
+        :param fsync:         可选  每条消息写入 spool 后是否 fsync
+        :param retry_policy:  可选  RetryPolicy，默认最多尝试 5 次；发送时不再使用客户端的
+                                    retry_policy
+        :param on_error:      可选  on_error(json_body, error)，消息最终发送失败时调用
+        :param drain_timeout: 可选  进程退出时最多等待多少秒发送队列中的消息
+        '''
+        self.client = client
+        self.maxsize = maxsize
+        self.retry_policy = retry_policy or RetryPolicy(
+            max_attempts=5, unsafe_endpoints=('send_message',))
+        self.on_error = on_error
+        self.drain_timeout = drain_timeout
+        if spool is not None and not isinstance(spool, Spool):
+            spool = Spool(spool, fsync=fsync)
+        self.spool = spool
+        self.enqueued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.replayed = 0
+        self.latency = LatencyTracker(size=1000, min_samples=1)
+        self._items = deque()
+        # 队列中与正在发送的消息数
+        self._unfinished = 0
+        self._closed = False
+        self._stopping = False
+        self._condition = threading.Condition()
+        if spool is not None:
+            for spool_id, body in spool.recovered:
+                self._items.append(_Entry(body, spool_id, None))
+            self._unfinished = self.replayed = len(spool.recovered)
+        self._threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=self._run, name='realtime-send-%d' % index)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        _dispatchers.add(self)
+
+    def submit(self, json_body, block=True, timeout=None, deadline=None):
+        '''
+        :param json_body: send_message 的 json_body
+        :param block:     队列已满时是否等待
+        :param timeout:   最多等待的秒数
+        :param deadline:  可选  秒数、Deadline 或 CancelToken，排队与发送共用
+        :return: Future，结果为 send_message 的返回值
+        '''
+        body = dict(json_body)
+        deadline = as_deadline(deadline)
+        end = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError('SendDispatcher is closed')
+                if deadline is not None:
+                    deadline.check()
+                if self._unfinished < self.maxsize:
+                    break
+                remaining = None if end is None else end - time.time()
+                if not block or (remaining is not None and remaining <= 0):
+                    raise SendQueueFullError('Send queue is full (%d messages)' % self.maxsize)
+                if deadline is not None:
+                    # 定期醒来检查是否已超时或取消
+                    remaining = 0.1 if remaining is None else min(remaining, 0.1)
+                self._condition.wait(remaining)
+            # 先占住位置再写 spool，避免写入后因队列已满而丢弃
+            self._unfinished += 1
+        try:
+            spool_id = self.spool.append(body) if self.spool is not None else None
+        except Exception:
+            with self._condition:
+                self._unfinished -= 1
+                self._condition.notify_all()
+            raise
+        future = Future()
+        with self._condition:
+            self._items.append(_Entry(body, spool_id, future, deadline))
+            self.enqueued += 1
+            self._condition.notify_all()
+        return future
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._items and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                entry = self._items.popleft()
+            try:
+                self._deliver(entry)
+            finally:
+                with self._condition:
+                    self._unfinished -= 1
+                    self._condition.notify_all()
+
+    def _deliver(self, entry):
+        attempt = 0
+        deadline = entry.deadline
+        while True:
+            attempt += 1
+            try:
+                if deadline is not None:
+                    deadline.check()
+                # 重试只在这一层进行，客户端的 retry_policy 会让尝试次数成倍增加
+                result = self.client.send_message(json_body=entry.body, deadline=deadline,
+                                                  retry_policy=False)
+            except Exception as e:
+                retryable = is_retryable(e)
+                if retryable and not self._stopping and \
+                        self.retry_policy.should_retry('send_message', False, attempt):
+                    with self._condition:
+                        self.retries += 1
+                    try:
+                        self._backoff(deadline, attempt)
+                    except RealtimeClientError as error:
+                        self._failed(entry, error, False)
+                        return
+                    continue
+                self._failed(entry, e, retryable)
+                return
+            if self.spool is not None:
+                self.spool.ack(entry.spool_id)
+            self.latency.add(time.time() - entry.enqueued_at)
+            with self._condition:
+                self.delivered += 1
+            if entry.future is not None:
+                entry.future.set_result(result)
+            return
+
+    def _backoff(self, deadline, attempt):
+        seconds = self.retry_policy.backoff_time(attempt)
+        if deadline is None:
+            time.sleep(seconds)
+        else:
+            deadline.sleep(seconds)
+
+    def _failed(self, entry, error, retryable):
+        # 服务端拒绝的消息重发也不会成功；其余的留在 spool 中，下次启动时重新发送
+        if self.spool is not None and not retryable:
+            self.spool.ack(entry.spool_id)
+        with self._condition:
+            self.failed += 1
+        if entry.future is not None:
+            entry.future.set_exception(error)
+        if self.on_error is not None:
+            try:
+                self.on_error(entry.body, error)
+            except Exception:
+                pass
+
+    def flush(self, timeout=None):
+        '''
+        等待队列中的消息全部发送完成（成功或最终失败）。
+
+        :return: 是否在 timeout 内全部完成
+        '''
+        end = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._unfinished:
+                remaining = None if end is None else end - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, drain=True, timeout=None):
+        '''
+        :param drain:   是否先发送完队列中的消息，为 False 时未发送的消息留在 spool 中
+        :param timeout: 最多等待的秒数，超时后未发送的消息留在 spool 中
+        :return: 是否所有消息都已发送
+        '''
+        with self._condition:
+            if self._closed:
+                return not self._unfinished
+            self._closed = True
+        # 排空队列与等待线程退出共用同一个 timeout
+        end = None if timeout is None else time.time() + timeout
+        drained = self.flush(timeout) if drain else not self._unfinished
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(None if end is None else max(0, end - time.time()))
+        with self._condition:
+            remaining, self._items = list(self._items), deque()
+        for entry in remaining:
+            if entry.future is not None:
+                entry.future.set_exception(RealtimeClientError(
+                    'SendDispatcher closed before the message was sent'))
+        if self.spool is not None:
+            self.spool.close()
+        return drained
+
+    def stats(self):
+        '''
+        :return: 队列长度、正在发送数、各类计数，以及入队到发送成功的延迟分位数（秒）
+        '''
+        with self._condition:
+            stats = {
+                'depth': len(self._items),
+                'in_flight': self._unfinished - len(self._items),
+                'enqueued': self.enqueued,
+                'replayed': self.replayed,
+                'delivered': self.delivered,
+                'failed': self.failed,
+                'retries': self.retries,
+            }
+        stats['spooled'] = len(self.spool) if self.spool is not None else None
+        stats['latency'] = dict(('p%d' % percent, self.latency.percentile(percent))
+                                for percent in (50, 90, 99))
+        return stats
+
+
+@atexit.register
+def _drain_all():
+    for dispatcher in list(_dispatchers):
+        dispatcher.close(timeout=dispatcher.drain_timeout)
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+'''
+批量导出聊天记录为 newline-delimited JSON。
+
+多个对话由线程池并发拉取，拉到的每一页交给写线程立即写出，不在内存中累积。
+每写完一页就在断点文件中记录该对话的游标与输出文件的长度，中断后重新执行同样的命令
+会先把输出截断到最后一次记录的长度，再从断点继续。压缩时每页是一个独立的 gzip member
+或 zstd frame，因此截断后的文件总是可以完整解压，不会重复导出。
+
+命令行用法::
+
+    python -m realtime.export --app-id ID --app-key KEY --master-key MASTER \\
+        --convids convids.txt --output history.ndjson.gz --checkpoint export.ckpt
+'''
+
+import argparse
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from six.moves import queue
+
+from .json_import import json
+from .checkpoint import Checkpoint
+from .codec import gzip_compress
+from .client import RealtimeAPI, Conversation
+from .history import iter_pages, MAX_PAGE_SIZE
+
+
+ALL_MESSAGES = '*'
+
+COMPRESSIONS = (None, 'gzip', 'zstd')
+
+_DONE = object()
+
+
+class Output(object):
+    '''
+    以追加模式写出的输出文件。每次 write 写出一个完整的 gzip member 或 zstd frame
+    （两种格式都支持多段首尾相接），返回写出后的文件长度。
+
+    断点中记录的是这个长度：续传时先把文件截断到断点记录的长度，丢掉中断时写了一半、
+    没有结束标记的数据，否则之后追加的内容会接在损坏的压缩流后面，整个文件都无法解压。
+    '''
+
+    def __init__(self, path, compression=None, offset=None):
+        '''
+        :param path:        输出路径，'-' 表示标准输出
+        :param compression: None, 'gzip' 或 'zstd'
+        :param offset:      可选  续传时文件应有的长度，之后的内容会被截掉
+        '''
+        if compression not in COMPRESSIONS:
+            raise ValueError('Unsupported compression: %s' % compression)
+        self.path = path
+        self._compress = None
+        if compression == 'gzip':
+            self._compress = gzip_compress
+        elif compression == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError('zstd compression requires the zstandard package')
+            # compress 每次返回一个完整的 frame
+            self._compress = zstandard.ZstdCompressor().compress
+        if path == '-':
+            self.stream = getattr(sys.stdout, 'buffer', sys.stdout)
+            return
+        self.stream = open(path, 'ab')
+        if offset is not None:
+            size = os.path.getsize(path)
+            if size < offset:
+                self.stream.close()
+                raise ValueError('%s has %d bytes but the checkpoint expects at least %d'
+                                 % (path, size, offset))
+            self.stream.truncate(offset)
+
+    def write(self, data):
+        '''
+        :return: 写出并 flush 后的文件长度，标准输出返回 None
+        '''
+        if self._compress is not None:
+            data = self._compress(data)
+        self.stream.write(data)
+        self.stream.flush()
+        if self.path == '-':
+            return None
+        return self.stream.tell()
+
+    def close(self):
+        if self.path == '-':
+            self.stream.flush()
+        else:
+            self.stream.close()
+
+
+def open_output(path, compression=None, offset=None):
+    '''
+    :return: Output，参数同 Output
+    '''
+    return Output(path, compression, offset)
+
+
+def _encode_line(message):
+    line = json.dumps(message)
+    if not isinstance(line, bytes):
+        line = line.encode('utf-8')
+    return line + b'\n'
+
+
+class Exporter(object):
+
+    def __init__(self, client, output, compression=None, checkpoint=None,
+                 workers=8, page_size=MAX_PAGE_SIZE, since=None, until=None):
+        '''
+        :param client:      RealtimeAPI
+        :param output:      输出文件路径，'-' 表示标准输出
+        :param compression: 可选  None, 'gzip' 或 'zstd'
+        :param checkpoint:  可选  断点文件路径，不传则不支持续传
+        :param workers:     可选  并发拉取的对话数
+        :param page_size:   可选  每页条数，最大 1000
+        :param since:       可选  只导出不早于该时间戳的消息
+        :param until:       可选  只导出早于该时间戳的消息
+        '''
+        self.client = client
+        self.output = output
+        self.compression = compression
+        self.checkpoint = Checkpoint(checkpoint)
+        self.workers = workers
+        self.page_size = page_size
+        self.since = since
+        self.until = until
+
+    def _committed_offset(self):
+        # 每次更新都写入当时的文件长度，最大的一个即最后一次落盘的位置
+        if self.checkpoint.path is None or self.output == '-':
+            return None
+        offsets = [state.get('offset') for state in
+                   (self.checkpoint.get(key) for key in self.checkpoint.keys())]
+        offsets = [offset for offset in offsets if offset is not None]
+        return max(offsets) if offsets else None
+
+    def _fetcher(self, convid):
+        if convid == ALL_MESSAGES:
+            return self.client.query_all_message
+        conversation = Conversation(self.client, convid)
+
+        def fetch_page(max_ts, msgid, limit):
+            return conversation.query_message(max_ts=max_ts, msgid=msgid, limit=limit)
+        return fetch_page
+
+    def _export_one(self, convid, pages, stopped):
+        def _put(item):
+            while not stopped.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        if stopped.is_set():
+            return
+        state = self.checkpoint.get(convid) or {}
+        until = state.get('max_ts', self.until)
+        msgid = state.get('msgid')
+        try:
+            for page in iter_pages(self._fetcher(convid), until=until,
+                                   since=self.since, msgid=msgid,
+                                   page_size=self.page_size):
+                if not _put((convid, page, None)):
+                    return
+            _put((convid, _DONE, None))
+        except Exception as e:
+            _put((convid, _DONE, e))
+
+    def export(self, convids=None):
+        '''
+        :param convids: 对话 id 列表，为 None 时通过 query_all_message 导出整个应用的聊天记录
+        :return: {'conversations': 完成的对话数, 'messages': 写出的消息数, 'failed': {convid: error}}
+        '''
+        if convids is None:
+            convids = [ALL_MESSAGES]
+        convids = [convid for convid in convids
+                   if not self.checkpoint.is_done(convid)]
+        stats = {'conversations': 0, 'messages': 0, 'failed': {}}
+        if not convids:
+            return stats
+
+        pages = queue.Queue(maxsize=self.workers * 2)
+        stopped = threading.Event()
+        output = open_output(self.output, self.compression, self._committed_offset())
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            for convid in convids:
+                executor.submit(self._export_one, convid, pages, stopped)
+            pending = len(convids)
+            while pending:
+                convid, page, error = pages.get()
+                if page is _DONE:
+                    pending -= 1
+                    if error is not None:
+                        stats['failed'][convid] = str(error)
+                    else:
+                        self.checkpoint.mark_done(convid)
+                        stats['conversations'] += 1
+                    continue
+                offset = output.write(b''.join(_encode_line(message) for message in page))
+                max_ts, msgid = page[-1].get('timestamp'), page[-1].get('msg-id')
+                # 游标与输出长度写在同一条记录中，续传时二者一致
+                self.checkpoint.update(convid, max_ts=max_ts, msgid=msgid, offset=offset)
+                stats['messages'] += len(page)
+        finally:
+            stopped.set()
+            executor.shutdown(wait=False)
+            output.close()
+            self.checkpoint.close()
+        return stats
+
+
+def export(client, output, convids=None, **kwargs):
+    '''
+    Exporter(client, output, **kwargs).export(convids) 的简写。
+    '''
+    return Exporter(client, output, **kwargs).export(convids)
+
+
+def _read_convids(path):
+    stream = sys.stdin if path == '-' else open(path)
+    try:
+        return [line.strip() for line in stream if line.strip()]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m realtime.export',
+        description='Export LeanCloud realtime message history as NDJSON.')
+    parser.add_argument('--app-id', default=os.environ.get('LEANCLOUD_APP_ID'))
+    parser.add_argument('--app-key', default=os.environ.get('LEANCLOUD_APP_KEY'))
+    parser.add_argument('--master-key', default=os.environ.get('LEANCLOUD_APP_MASTER_KEY'))
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--convids', metavar='FILE',
+                        help="file with one conversation id per line, '-' for stdin")
+    source.add_argument('--all', action='store_true',
+                        help='export the whole app history via query_all_message')
+    parser.add_argument('--output', '-o', default='-')
+    parser.add_argument('--compression', choices=['gzip', 'zstd'])
+    parser.add_argument('--checkpoint', help='checkpoint file used to resume an interrupted run')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--page-size', type=int, default=MAX_PAGE_SIZE)
+    parser.add_argument('--since', type=int, help='oldest timestamp to export (ms, inclusive)')
+    parser.add_argument('--until', type=int, help='newest timestamp to export (ms, exclusive)')
+    args = parser.parse_args(argv)
+
+    convids = None if args.all else _read_convids(args.convids)
+    client = RealtimeAPI(app_id=args.app_id, app_key=args.app_key,
+                         master_key=args.master_key,
+                         pool_maxsize=args.workers)
+    with client:
+        stats = export(client, args.output, convids=convids,
+                       compression=args.compression,
+                       checkpoint=args.checkpoint,
+                       workers=args.workers,
+                       page_size=args.page_size,
+                       since=args.since,
+                       until=args.until)
+    sys.stderr.write('exported %(messages)d messages from %(conversations)d conversations\n' % stats)
+    for convid, error in sorted(stats['failed'].items()):
+        sys.stderr.write('failed %s: %s\n' % (convid, error))
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
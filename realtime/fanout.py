@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+'''
+批量发送消息。
+
+broadcast 把同一条消息发到大量对话：公共部分只用客户端的 codec 序列化一次，每个对话只拼接 conv_id。
+所有请求经过 bind_method，因此同样受限流器与重试策略约束；并发数由 workers 限制，
+单个对话失败不会中断整批发送，结果按输入顺序逐个返回。
+'''
+
+import collections
+
+import six
+
+from .deadline import as_deadline
+from .json_import import json
+
+
+TEXT_MESSAGE_TYPE = -1
+
+SendResult = collections.namedtuple('SendResult', ['target', 'ok', 'result', 'error'])
+
+
+def text_message(text):
+    '''
+    :param text: 文本内容
+    :return: 与客户端 SDK 兼容的文本消息（_lctype = -1）
+    '''
+    return json.dumps({'_lctype': TEXT_MESSAGE_TYPE, '_lctext': text})
+
+
+def message_body(from_peer, message, conv_id=None, transient=True, no_sync=False,
+                 push_data=None, to_peers=None):
+    '''
+    :return: send_message 的 json_body
+    '''
+    if not isinstance(message, six.string_types):
+        message = json.dumps(message)
+    body = {
+        'from_peer': from_peer,
+        'message': message,
+        'transient': transient,
+        'no_sync': no_sync,
+    }
+    if conv_id is not None:
+        body['conv_id'] = conv_id
+    if push_data:
+        body['push_data'] = push_data
+    if to_peers:
+        body['to_peers'] = to_peers
+    return body
+
+
+def broadcast_body(codec, from_peer, message, transient=True, no_sync=False,
+                   push_data=None, to_peers=None):
+    '''
+    :return: body(conv_id)，返回发往该对话的 send_message 请求体（bytes）
+    '''
+    shared = codec.dumps(message_body(from_peer, message, transient=transient,
+                                      no_sync=no_sync, push_data=push_data,
+                                      to_peers=to_peers))
+    # shared 形如 b'{"from_peer": ...}'，每个对话只需在开头插入 conv_id
+    shared = shared[1:]
+
+    def body(conv_id):
+        return b'{"conv_id":' + codec.dumps(conv_id) + b',' + shared
+    return body
+
+
+def bounded_map(func, items, workers=16, deadline=None):
+    '''
+    并发执行 func(item)，同一时间最多 workers 个在执行，items 按需读取，不会一次性提交。
+
+    :param deadline: 可选  Deadline，超时或取消后不再读取 items，正在执行的条目不再等待，
+                           以超时或取消的异常产出，之后生成器正常结束
+    :return: 按完成顺序产出 (item, result, error) 的生成器
+    '''
+    from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    in_flight = {}
+    wakeup = None
+    if deadline is not None and deadline.token is not None:
+        # 取消时唤醒等待中的 wait
+        wakeup = Future()
+
+        def _wake():
+            wakeup.set_result(None)
+        deadline.token.add_callback(_wake)
+
+    def _outcome(future):
+        item = in_flight.pop(future)
+        error = future.exception()
+        return item, (None if error else future.result()), error
+
+    def _wait():
+        if deadline is None:
+            return wait(list(in_flight), return_when=FIRST_COMPLETED)[0]
+        futures = list(in_flight) + ([wakeup] if wakeup is not None else [])
+        done, _ = wait(futures, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+        done.discard(wakeup)
+        return done
+
+    try:
+        for item in items:
+            if len(in_flight) >= workers:
+                for future in _wait():
+                    yield _outcome(future)
+            error = deadline.error() if deadline is not None else None
+            if error is not None:
+                yield item, None, error
+                break
+            in_flight[executor.submit(func, item)] = item
+        while in_flight:
+            if deadline is not None and deadline.error() is not None:
+                break
+            for future in _wait():
+                yield _outcome(future)
+        if in_flight:
+            error = deadline.error()
+            for future in list(in_flight):
+                future.cancel()
+                yield in_flight.pop(future), None, error
+    finally:
+        for future in in_flight:
+            future.cancel()
+        executor.shutdown(wait=False)
+        if wakeup is not None:
+            deadline.token.remove_callback(_wake)
+
+
+def _collect(outcomes, targets, deadline=None):
+    results = {}
+    for (index, target), result, error in outcomes:
+        results[index] = SendResult(target, error is None, result, error)
+    if len(results) < len(targets):
+        # 超时或取消后没有发出的条目
+        error = deadline.error()
+        return [results.get(index) or SendResult(target, False, None, error)
+                for index, target in enumerate(targets)]
+    return [results[index] for index in range(len(targets))]
+
+
+def broadcast(client, conv_ids, from_peer, message, transient=True, no_sync=False,
+              push_data=None, to_peers=None, workers=16, deadline=None):
+    '''
+    向多个对话发送同一条消息。
+
+    :param client:    RealtimeAPI
+    :param conv_ids:  对话 id 的可迭代对象
+    :param from_peer: 消息的发件人 client id
+    :param message:   消息内容，非字符串时按 JSON 序列化
+    :param workers:   最大并发请求数
+    :param deadline:  可选  秒数、Deadline 或 CancelToken，整批共享；超时或取消后
+                            未完成的对话 ok 为 False，error 为对应的异常
+    :return: [SendResult]，与 conv_ids 顺序一致
+    '''
+    conv_ids = list(conv_ids)
+    deadline = as_deadline(deadline)
+    body = broadcast_body(client.codec, from_peer, message, transient=transient,
+                          no_sync=no_sync, push_data=push_data, to_peers=to_peers)
+
+    def _send(item):
+        return client.send_message(body=body(item[1]), deadline=deadline)
+
+    return _collect(bounded_map(_send, enumerate(conv_ids), workers, deadline),
+                    conv_ids, deadline)
+
+
+def send_many(client, bodies, workers=16, deadline=None):
+    '''
+    并发发送多条各不相同的消息。
+
+    :param client:   RealtimeAPI
+    :param bodies:   send_message 的 json_body 列表，可由 message_body 生成
+    :param workers:  最大并发请求数
+    :param deadline: 可选  同 broadcast
+    :return: [SendResult]，target 为 body 中的 conv_id，与 bodies 顺序一致
+    '''
+    bodies = list(bodies)
+    deadline = as_deadline(deadline)
+
+    def _send(item):
+        return client.send_message(json_body=item[1], deadline=deadline)
+
+    results = _collect(bounded_map(_send, enumerate(bodies), workers, deadline),
+                       bodies, deadline)
+    return [result._replace(target=result.target.get('conv_id')) for result in results]
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+'''
+持续跟踪多个对话的新消息。
+
+Follower 按对话轮询 query_message，轮询间隔自适应：拿到新消息的对话回到 min_interval，
+连续没有新消息的对话每次把间隔乘以 backoff，直到 max_interval。所有对话按各自的下次
+轮询时间排队，开始时均匀分散在第一个间隔内，之后每次加上随机抖动，避免请求集中在同一时刻。
+
+每个对话记录已投递的最新消息（时间戳与同一时间戳下的 msg-id），同一条消息只会投递一次；
+一次轮询的新消息超过一页时会继续向前翻页。
+
+    def on_messages(convid, messages):   # 按时间正序
+        ...
+
+    follower = client.follow(conv_ids, on_messages)
+    ...
+    follower.stop()
+'''
+
+import heapq
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .history import iter_pages, MAX_PAGE_SIZE
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class FollowState(object):
+
+    __slots__ = ('convid', 'timestamp', 'msgids', 'interval', 'due', 'polls',
+                 'empty_polls', 'errors', 'messages', 'last_poll', 'last_message', 'lag',
+                 'removed')
+
+    def __init__(self, convid, timestamp, interval, due):
+        self.convid = convid
+        # 已投递的最新时间戳，以及该时间戳下已投递的 msg-id
+        self.timestamp = timestamp
+        self.msgids = set()
+        self.interval = interval
+        self.due = due
+        self.polls = 0
+        self.empty_polls = 0
+        self.errors = 0
+        self.messages = 0
+        self.last_poll = None
+        self.last_message = None
+        self.lag = None
+        self.removed = False
+
+    def as_dict(self, now):
+        return {
+            'interval': self.interval,
+            'polls': self.polls,
+            'empty_polls': self.empty_polls,
+            'errors': self.errors,
+            'messages': self.messages,
+            'high_water_mark': self.timestamp,
+            # 最近一次投递时，最新一条消息从发送到投递经过的秒数
+            'lag': self.lag,
+            # 距离上一次成功轮询的秒数，反映当前最多可能滞后多久
+            'staleness': now - self.last_poll if self.last_poll is not None else None,
+        }
+
+
+class Follower(object):
+
+    def __init__(self, client, conv_ids, callback, since=None, min_interval=1.0,
+                 max_interval=60.0, backoff=2.0, jitter=0.2, page_size=100,
+                 workers=4, on_error=None):
+        '''
+        :param client:       RealtimeAPI
+        :param conv_ids:     要跟踪的对话 id
+        :param callback:     callback(convid, messages)，messages 按时间正序
+        :param since:        可选  投递该时间戳（包含）之后的消息，默认从当前时间开始
+        :param min_interval: 活跃对话的轮询间隔（秒）
+        :param max_interval: 空闲对话的最大轮询间隔（秒）
+        :param backoff:      没有新消息时间隔的放大倍数
+        :param jitter:       间隔的随机抖动比例
+        :param page_size:    每次轮询拉取的条数
+        :param workers:      同时进行的轮询数
+        :param on_error:     可选  on_error(convid, error)，轮询或 callback 失败时调用；
+                             轮询失败的对话按空闲处理，callback 失败的消息不会重新投递；
+                             on_error 抛出的异常被忽略
+        '''
+        self.client = client
+        self.callback = callback
+        self.since = since
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.page_size = min(page_size, MAX_PAGE_SIZE)
+        self.workers = workers
+        self.on_error = on_error
+        self._states = {}
+        self._queue = []
+        self._active = 0
+        self._stopped = False
+        self._condition = threading.Condition()
+        # 标记轮询线程，在 callback / on_error 中调用 stop 时不等待自己所在的线程
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._thread = None
+        self.add(conv_ids)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='realtime-follow')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self, wait=True):
+        '''
+        :param wait: 是否等待正在进行的轮询与 callback 结束；在 callback / on_error 中调用时
+                     不等待，否则会等待调用方自己所在的线程
+        '''
+        if getattr(self._local, 'polling', False):
+            wait = False
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None and wait:
+            self._thread.join()
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def add(self, conv_ids):
+        '''
+        开始跟踪更多对话，第一次轮询均匀分散在 min_interval 内。
+        '''
+        conv_ids = [convid for convid in conv_ids if convid not in self._states]
+        start = time.time()
+        timestamp = self.since if self.since is not None else _now_ms()
+        with self._condition:
+            for index, convid in enumerate(conv_ids):
+                due = start + self.min_interval * index / max(len(conv_ids), 1)
+                state = FollowState(convid, timestamp, self.min_interval, due)
+                self._states[convid] = state
+                heapq.heappush(self._queue, (due, convid))
+            self._condition.notify_all()
+
+    def remove(self, conv_ids):
+        with self._condition:
+            for convid in conv_ids:
+                state = self._states.pop(convid, None)
+                if state is not None:
+                    state.removed = True
+
+    def stats(self):
+        '''
+        :return: {convid: 轮询间隔、轮询次数、投递条数、lag 等}
+        '''
+        now = time.time()
+        with self._condition:
+            return dict((convid, state.as_dict(now)) for convid, state in self._states.items())
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopped:
+                        return
+                    now = time.time()
+                    if self._queue and self._active < self.workers and \
+                            self._queue[0][0] <= now:
+                        break
+                    timeout = None
+                    if self._queue and self._active < self.workers:
+                        timeout = self._queue[0][0] - now
+                    self._condition.wait(timeout)
+                _, convid = heapq.heappop(self._queue)
+                state = self._states.get(convid)
+                if state is None:
+                    continue
+                self._active += 1
+            try:
+                self._executor.submit(self._poll, state)
+            except RuntimeError:
+                return
+
+    def _schedule(self, state, found):
+        if found:
+            state.interval = self.min_interval
+        else:
+            state.interval = min(self.max_interval, state.interval * self.backoff)
+        delay = state.interval
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        state.due = time.time() + delay
+        with self._condition:
+            self._active -= 1
+            if not state.removed and not self._stopped:
+                heapq.heappush(self._queue, (state.due, state.convid))
+            self._condition.notify_all()
+
+    def _fetch_new(self, state):
+        def fetch_page(max_ts, msgid, limit):
+            return self.client.query_message(convid=state.convid, max_ts=max_ts,
+                                             msgid=msgid, limit=limit)
+
+        fresh = []
+        for page in iter_pages(fetch_page, since=state.timestamp, page_size=self.page_size):
+            for message in page:
+                timestamp = message.get('timestamp')
+                if timestamp < state.timestamp or (
+                        timestamp == state.timestamp and message.get('msg-id') in state.msgids):
+                    continue
+                fresh.append(message)
+        fresh.reverse()
+        return fresh
+
+    def _report_error(self, state, error):
+        # on_error 自身抛出的异常不再交给 on_error，以免同一个错误报告两次
+        if self.on_error is not None:
+            try:
+                self.on_error(state.convid, error)
+            except Exception:
+                pass
+
+    def _poll(self, state):
+        self._local.polling = True
+        found = False
+        try:
+            try:
+                messages = self._fetch_new(state)
+            except Exception as e:
+                state.errors += 1
+                self._report_error(state, e)
+                return
+            now = time.time()
+            state.polls += 1
+            state.last_poll = now
+            if not messages:
+                state.empty_polls += 1
+                return
+            found = True
+            self._advance(state, messages)
+            state.messages += len(messages)
+            state.last_message = now
+            state.lag = max(0.0, now - messages[-1].get('timestamp') / 1000.0)
+            try:
+                self.callback(state.convid, messages)
+            except Exception as e:
+                self._report_error(state, e)
+        finally:
+            self._schedule(state, found)
+
+    @staticmethod
+    def _advance(state, messages):
+        newest = messages[-1].get('timestamp')
+        if newest > state.timestamp:
+            state.timestamp = newest
+            state.msgids = set()
+        state.msgids.update(message.get('msg-id') for message in messages
+                            if message.get('timestamp') == newest)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+'''
+聊天记录分页遍历。
+
+历史记录接口按时间倒序返回，每页最多 1000 条，下一页的游标为上一页最后一条消息的
+timestamp 与 msg-id。这里把游标链包装成惰性的生成器，并可在后台线程预取下一页，
+同一时间最多只持有当前页和预取好的一页。
+'''
+
+import threading
+
+from six.moves import queue
+
+
+MAX_PAGE_SIZE = 1000
+
+_DONE = object()
+
+
+def next_cursor(message):
+    '''
+    :param message: 当前页最后一条消息
+    :return: (max_ts, msgid)，作为下一页的查询起点
+    '''
+    return message.get('timestamp'), message.get('msg-id')
+
+
+def iter_pages(fetch_page, until=None, since=None, msgid=None,
+               page_size=MAX_PAGE_SIZE):
+    '''
+    :param fetch_page: fetch_page(max_ts=..., msgid=..., limit=...) 返回一页消息
+    :param until:      可选  起始时间戳（不包含），即第一页的 max_ts，默认当前时间
+    :param since:      可选  截止时间戳（包含），早于它的消息不再返回
+    :param msgid:      可选  起始消息 id，需与 until 一起使用
+    :param page_size:  每页条数，最大 1000
+    :return: 逐页返回消息列表的生成器
+    '''
+    page_size = min(page_size, MAX_PAGE_SIZE)
+    max_ts = until
+    while True:
+        page = fetch_page(max_ts=max_ts, msgid=msgid, limit=page_size)
+        if not page:
+            return
+        exhausted = len(page) < page_size
+        if since is not None and page[-1].get('timestamp') < since:
+            page = [message for message in page
+                    if message.get('timestamp') >= since]
+            exhausted = True
+        if page:
+            yield page
+        if exhausted:
+            return
+        max_ts, msgid = next_cursor(page[-1])
+
+
+def prefetch_pages(pages, depth=1, deadline=None):
+    '''
+    在后台线程中提前取出 pages 的下 depth 页。生成器被关闭或回收时后台线程随之退出。
+
+    :param pages:    页生成器，例如 iter_pages 的返回值
+    :param depth:    预取的页数
+    :param deadline: 可选  Deadline，超时或取消时不再等待后台线程，立即抛出
+    '''
+    buffer = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def _put(item):
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker():
+        try:
+            for page in pages:
+                if not _put((page, None)):
+                    return
+            _put((_DONE, None))
+        except Exception as e:
+            _put((_DONE, e))
+
+    thread = threading.Thread(target=_worker, name='realtime-history-prefetch')
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            page, error = get_with_deadline(buffer, deadline)
+            if page is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield page
+    finally:
+        stopped.set()
+
+
+def get_with_deadline(buffer, deadline):
+    '''
+    从队列中取出一项，等待期间每 0.1 秒检查一次 deadline，超时或取消时抛出。
+    '''
+    if deadline is None:
+        return buffer.get()
+    while True:
+        deadline.check()
+        try:
+            return buffer.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+
+def iter_messages(fetch_page, until=None, since=None, msgid=None,
+                  page_size=MAX_PAGE_SIZE, prefetch=True, deadline=None):
+    '''
+    逐条返回消息，参数同 iter_pages。prefetch 为 True 时在处理当前页的同时后台获取下一页。
+    fetch_page 应把同一个 deadline 传给每一页的请求。
+    '''
+    pages = iter_pages(fetch_page, until=until, since=since, msgid=msgid,
+                       page_size=page_size)
+    if prefetch:
+        pages = prefetch_pages(pages, deadline=deadline)
+    for page in pages:
+        for message in page:
+            yield message
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+'''
+请求埋点与指标。
+
+RealtimeAPI(instrumentation=Instrumentation()) 开启后，每个 bind_method 请求前后调用
+before_request / after_request 钩子，并在 MetricsRegistry 中按端点记录请求数、状态码、
+重试次数、被合并的重复请求数、收发字节数以及建连、首字节、JSON 解析与总耗时。
+默认的 NULL_INSTRUMENTATION 不做任何事，请求路径上只多一次属性判断。
+
+钩子拿到的是 RequestInfo，不包含请求头，不会泄露 master key。
+'''
+
+import threading
+import time
+
+
+PHASES = ('connect', 'ttfb', 'decode', 'total')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestInfo(object):
+
+    __slots__ = ('endpoint', 'method', 'url', 'attempt', 'start', 'status_code',
+                 'bytes_sent', 'bytes_received', 'error', 'timings')
+
+    def __init__(self, endpoint, method, url, attempt=1):
+        self.endpoint = endpoint
+        self.method = method
+        self.url = url
+        self.attempt = attempt
+        self.start = time.time()
+        self.status_code = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.error = None
+        self.timings = {}
+
+    def finish(self):
+        self.timings['total'] = time.time() - self.start
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+
+class MetricsRegistry(object):
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix='realtime'):
+        self.buckets = buckets
+        self.prefix = prefix
+        self.requests = {}
+        self.retries = {}
+        self.deduplicated = {}
+        self.bytes_sent = {}
+        self.bytes_received = {}
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def record(self, info):
+        status = str(info.status_code) if info.status_code is not None else 'error'
+        with self._lock:
+            key = (info.endpoint, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes_sent[info.endpoint] = \
+                self.bytes_sent.get(info.endpoint, 0) + info.bytes_sent
+            self.bytes_received[info.endpoint] = \
+                self.bytes_received.get(info.endpoint, 0) + info.bytes_received
+            for phase, seconds in info.timings.items():
+                histogram = self.timings.get((info.endpoint, phase))
+                if histogram is None:
+                    histogram = self.timings[(info.endpoint, phase)] = Histogram(self.buckets)
+                histogram.observe(seconds)
+
+    def record_retry(self, endpoint):
+        with self._lock:
+            self.retries[endpoint] = self.retries.get(endpoint, 0) + 1
+
+    def record_deduplicated(self, endpoint):
+        with self._lock:
+            self.deduplicated[endpoint] = self.deduplicated.get(endpoint, 0) + 1
+
+    def render_prometheus(self):
+        '''
+        :return: Prometheus text exposition format
+        '''
+        with self._lock:
+            return '\n'.join(self._render()) + '\n'
+
+    def _render(self):
+        prefix = self.prefix
+        yield '# TYPE %s_requests_total counter' % prefix
+        for (endpoint, status), value in sorted(self.requests.items()):
+            yield '%s_requests_total{endpoint="%s",status="%s"} %d' % (
+                prefix, endpoint, status, value)
+        yield '# TYPE %s_retries_total counter' % prefix
+        for endpoint, value in sorted(self.retries.items()):
+            yield '%s_retries_total{endpoint="%s"} %d' % (prefix, endpoint, value)
+        yield '# TYPE %s_deduplicated_total counter' % prefix
+        for endpoint, value in sorted(self.deduplicated.items()):
+            yield '%s_deduplicated_total{endpoint="%s"} %d' % (prefix, endpoint, value)
+        yield '# TYPE %s_bytes_total counter' % prefix
+        for direction, counter in (('sent', self.bytes_sent),
+                                   ('received', self.bytes_received)):
+            for endpoint, value in sorted(counter.items()):
+                yield '%s_bytes_total{endpoint="%s",direction="%s"} %d' % (
+                    prefix, endpoint, direction, value)
+        yield '# TYPE %s_request_duration_seconds histogram' % prefix
+        for (endpoint, phase), histogram in sorted(self.timings.items()):
+            labels = 'endpoint="%s",phase="%s"' % (endpoint, phase)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                yield '%s_request_duration_seconds_bucket{%s,le="%s"} %d' % (
+                    prefix, labels, bound, cumulative)
+            yield '%s_request_duration_seconds_bucket{%s,le="+Inf"} %d' % (
+                prefix, labels, histogram.count)
+            yield '%s_request_duration_seconds_sum{%s} %f' % (prefix, labels, histogram.sum)
+            yield '%s_request_duration_seconds_count{%s} %d' % (
+                prefix, labels, histogram.count)
+
+
+class Instrumentation(object):
+
+    enabled = True
+
+    def __init__(self, metrics=None, before_request=None, after_request=None):
+        '''
+        :param metrics:        可选  MetricsRegistry，默认新建一个
+        :param before_request: 可选  钩子列表，请求发出前以 RequestInfo 调用
+        :param after_request:  可选  钩子列表，请求结束（成功或失败）后以 RequestInfo 调用
+        '''
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.before_request_hooks = list(before_request or [])
+        self.after_request_hooks = list(after_request or [])
+
+    def add_before_request(self, hook):
+        self.before_request_hooks.append(hook)
+        return hook
+
+    def add_after_request(self, hook):
+        self.after_request_hooks.append(hook)
+        return hook
+
+    def before_request(self, info):
+        for hook in self.before_request_hooks:
+            hook(info)
+
+    def after_request(self, info):
+        info.finish()
+        self.metrics.record(info)
+        for hook in self.after_request_hooks:
+            hook(info)
+
+    def record_retry(self, endpoint):
+        self.metrics.record_retry(endpoint)
+
+    def record_deduplicated(self, endpoint):
+        self.metrics.record_deduplicated(endpoint)
+
+    def render_prometheus(self):
+        return self.metrics.render_prometheus()
+
+
+class NullInstrumentation(object):
+
+    enabled = False
+
+    def before_request(self, info):
+        pass
+
+    def after_request(self, info):
+        pass
+
+    def record_retry(self, endpoint):
+        pass
+
+    def record_deduplicated(self, endpoint):
+        pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
+
+
+_timing = threading.local()
+
+
+def _timed_connection(connection_class):
+
+    class TimedConnection(connection_class):
+
+        def connect(self):
+            start = time.time()
+            try:
+                return connection_class.connect(self)
+            finally:
+                add_connect_time(time.time() - start)
+
+    TimedConnection.__name__ = 'Timed' + connection_class.__name__
+    return TimedConnection
+
+
+def add_connect_time(seconds):
+    '''
+    记录当前线程的请求新建连接的耗时，供 transport 在调用线程中报告。
+    '''
+    _timing.connect = (getattr(_timing, 'connect', None) or 0) + seconds
+
+
+def instrument_session(session):
+    '''
+    让 requests.Session 或 HTTP2Transport 在新建连接时记录建连耗时，通过 pop_connect_time 读取。
+    '''
+    if hasattr(session, 'time_connections'):
+        session.time_connections = True
+        return session
+    if not hasattr(session, 'adapters'):
+        # 其他自定义 transport 不记录建连耗时
+        return session
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    pool_classes = {}
+    for scheme, pool_class in (('http', HTTPConnectionPool),
+                               ('https', HTTPSConnectionPool)):
+        pool_classes[scheme] = type('Timed' + pool_class.__name__, (pool_class,), {
+            'ConnectionCls': _timed_connection(pool_class.ConnectionCls)})
+    for adapter in set(session.adapters.values()):
+        adapter.poolmanager.pool_classes_by_scheme = pool_classes
+    return session
+
+
+def pop_connect_time():
+    '''
+    :return: 当前线程上一次请求新建连接的耗时，复用连接时为 None
+    '''
+    seconds = getattr(_timing, 'connect', None)
+    _timing.connect = None
+    return seconds
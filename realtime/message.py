@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+'''
+聊天记录的消息模型。
+
+历史记录接口默认返回 dict 列表（return_json=True）。传 return_json=False 时每条消息转换为
+Message，字段固定、使用 __slots__，同一页内重复出现的对话 id、发送者等字符串只保留一份；
+消息内容 data 保持原始字符串，第一次访问 content 时才解析。
+
+传 compact=True 时整页返回 MessagePage：按列保存各字段，时间戳放在 array 中，
+只在按下标访问时才构造 Message，适合 limit=1000 的大页和长时间持有的结果集。
+
+Message 与 MessagePage 中的消息都支持 message['msg-id'] / message.get('timestamp')，
+可以直接交给 iter_messages 等按 dict 读取字段的代码使用。
+'''
+
+import base64
+from array import array
+
+import six
+
+from .json_import import json
+
+
+# 接口字段名 -> Message 属性名
+FIELDS = (
+    ('msg-id', 'msgid'),
+    ('conv-id', 'convid'),
+    ('from', 'from_peer'),
+    ('timestamp', 'timestamp'),
+    ('data', 'data'),
+    ('ack-at', 'ack_at'),
+    ('read-at', 'read_at'),
+    ('patch-timestamp', 'patch_timestamp'),
+    ('to', 'to'),
+    ('from-ip', 'from_ip'),
+    ('is-conv', 'is_conv'),
+    ('is-room', 'is_room'),
+    ('is-system', 'is_system'),
+    ('bin', 'binary'),
+    ('mention-all', 'mention_all'),
+    ('mention-pids', 'mention_pids'),
+)
+
+ATTRIBUTES = dict(FIELDS)
+
+# 同一页内取值重复度高的字段，转换时去重
+SHARED_FIELDS = ('conv-id', 'from', 'to', 'from-ip')
+
+# array('q') 在 Python 2 中不可用，时间戳为毫秒，'d' 可以精确表示
+TIMESTAMP_TYPECODE = 'q' if six.PY3 else 'd'
+
+_UNSET = object()
+
+
+def _timestamp(value):
+    return None if value is None else int(value)
+
+
+class Message(object):
+
+    __slots__ = tuple(attribute for _, attribute in FIELDS) + ('extra', '_content')
+
+    def __init__(self, msgid=None, convid=None, from_peer=None, timestamp=None, data=None,
+                 ack_at=None, read_at=None, patch_timestamp=None, to=None, from_ip=None,
+                 is_conv=None, is_room=None, is_system=None, binary=False,
+                 mention_all=None, mention_pids=None, extra=None):
+        '''
+        :param msgid:     消息 id
+        :param convid:    对话 id
+        :param from_peer: 发送者 client id
+        :param timestamp: 消息时间戳（毫秒）
+        :param data:      消息内容原文
+        :param binary:    data 是否为 base64 编码的二进制内容
+        :param extra:     可选  其他未识别的字段
+        '''
+        self.msgid = msgid
+        self.convid = convid
+        self.from_peer = from_peer
+        self.timestamp = timestamp
+        self.data = data
+        self.ack_at = ack_at
+        self.read_at = read_at
+        self.patch_timestamp = patch_timestamp
+        self.to = to
+        self.from_ip = from_ip
+        self.is_conv = is_conv
+        self.is_room = is_room
+        self.is_system = is_system
+        self.binary = binary
+        self.mention_all = mention_all
+        self.mention_pids = mention_pids
+        self.extra = extra
+        self._content = _UNSET
+
+    @classmethod
+    def object_from_dictionary(cls, entry, strings=None):
+        '''
+        :param entry:   接口返回的一条消息
+        :param strings: 可选  用于字符串去重的 dict，同一页的消息共用一个
+        :return: Message
+        '''
+        message = cls.__new__(cls)
+        message._content = _UNSET
+        message.extra = None
+        for key, attribute in FIELDS:
+            setattr(message, attribute, entry.get(key))
+        message.timestamp = _timestamp(message.timestamp)
+        message.binary = bool(message.binary)
+        if strings is not None:
+            for key in SHARED_FIELDS:
+                attribute = ATTRIBUTES[key]
+                value = getattr(message, attribute)
+                if value is not None:
+                    setattr(message, attribute, strings.setdefault(value, value))
+        if any(key not in ATTRIBUTES for key in entry):
+            message.extra = dict((key, value) for key, value in entry.items()
+                                 if key not in ATTRIBUTES)
+        return message
+
+    @classmethod
+    def list_from_dictionaries(cls, entries):
+        strings = {}
+        return [cls.object_from_dictionary(entry, strings) for entry in entries]
+
+    @property
+    def content(self):
+        '''
+        解析后的消息内容：二进制消息为 bytes，JSON 格式的消息（如 _lctype 富媒体消息）为
+        dict，其余为原始字符串。只在第一次访问时解析。
+        '''
+        if self._content is _UNSET:
+            self._content = self._decode()
+        return self._content
+
+    def _decode(self):
+        data = self.data
+        if data is None:
+            return None
+        if self.binary:
+            return base64.b64decode(data)
+        if data[:1] in ('{', '['):
+            try:
+                return json.loads(data)
+            except ValueError:
+                pass
+        return data
+
+    @property
+    def message_type(self):
+        '''
+        :return: 富媒体消息的 _lctype，普通消息返回 None
+        '''
+        content = self.content
+        if isinstance(content, dict):
+            return content.get('_lctype')
+        return None
+
+    def get(self, key, default=None):
+        attribute = ATTRIBUTES.get(key)
+        if attribute is None:
+            return (self.extra or {}).get(key, default)
+        value = getattr(self, attribute)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key, _UNSET)
+        if value is _UNSET:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _UNSET) is not _UNSET
+
+    def to_dict(self):
+        '''
+        :return: 与接口返回格式相同的 dict，值为 None 的字段不输出
+        '''
+        entry = {}
+        for key, attribute in FIELDS:
+            value = getattr(self, attribute)
+            if value is not None:
+                entry[key] = value
+        if self.extra:
+            entry.update(self.extra)
+        return entry
+
+    def __eq__(self, other):
+        if not isinstance(other, Message):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '<Message %s %s from %s at %s>' % (
+            self.msgid, self.convid, self.from_peer, self.timestamp)
+
+    @classmethod
+    def page_from_list(cls, entries):
+        '''
+        :return: 按列保存的 MessagePage
+        '''
+        return MessagePage(entries, cls)
+
+
+class MessagePage(object):
+    '''
+    按列保存的一页消息，支持 len、下标、切片与迭代，访问时才构造 Message。
+    '''
+
+    # 取值重复度高的字符串字段，同一页内只保留一份
+    STRING_COLUMNS = ('msg-id', 'conv-id', 'from', 'data', 'to', 'from-ip')
+    TIMESTAMP_COLUMNS = ('timestamp', 'ack-at', 'read-at', 'patch-timestamp')
+    FLAG_COLUMNS = ('is-conv', 'is-room', 'is-system', 'bin', 'mention-all')
+
+    __slots__ = ('message_class', '_strings', '_text', '_times', '_flags', '_rest', '_length')
+
+    def __init__(self, entries=(), message_class=Message):
+        self.message_class = message_class
+        self._strings = {}
+        self._text = dict((key, []) for key in self.STRING_COLUMNS)
+        self._times = dict((key, array(TIMESTAMP_TYPECODE))
+                           for key in self.TIMESTAMP_COLUMNS)
+        # 每条消息一个整数：低位为各标志的值，高位记录该标志是否出现
+        self._flags = array('H')
+        # 其他字段，绝大多数消息没有，只记录出现过的下标
+        self._rest = {}
+        self._length = 0
+        for entry in entries:
+            self.append(entry)
+
+    def append(self, entry):
+        if isinstance(entry, Message):
+            entry = entry.to_dict()
+        strings = self._strings
+        for key, column in self._text.items():
+            value = entry.get(key)
+            if key in SHARED_FIELDS and value is not None:
+                value = strings.setdefault(value, value)
+            column.append(value)
+        for key, column in self._times.items():
+            value = entry.get(key)
+            column.append(-1 if value is None else value)
+        flags = 0
+        for bit, key in enumerate(self.FLAG_COLUMNS):
+            value = entry.get(key)
+            if value is not None:
+                flags |= (1 << (bit + 8)) | (int(bool(value)) << bit)
+        self._flags.append(flags)
+        rest = dict((key, value) for key, value in entry.items() if key not in _COLUMNS)
+        if rest:
+            self._rest[self._length] = rest
+        self._length += 1
+
+    def __len__(self):
+        return self._length
+
+    def __bool__(self):
+        return self._length > 0
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self._message(index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._message(i) for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('MessagePage index out of range')
+        return self._message(index)
+
+    def _entry(self, index):
+        entry = dict(self._rest.get(index) or ())
+        for key, column in self._text.items():
+            value = column[index]
+            if value is not None:
+                entry[key] = value
+        for key, column in self._times.items():
+            value = column[index]
+            if value != -1:
+                entry[key] = int(value)
+        flags = self._flags[index]
+        for bit, key in enumerate(self.FLAG_COLUMNS):
+            if flags & (1 << (bit + 8)):
+                entry[key] = bool(flags & (1 << bit))
+        return entry
+
+    def _message(self, index):
+        return self.message_class.object_from_dictionary(self._entry(index), self._strings)
+
+    @property
+    def timestamps(self):
+        return self._times['timestamp']
+
+    @property
+    def msgids(self):
+        return self._text['msg-id']
+
+    def column(self, key):
+        '''
+        :param key: STRING_COLUMNS 或 TIMESTAMP_COLUMNS 中的字段名
+        :return: 该字段的整列取值，缺失的字符串为 None，缺失的时间戳为 -1
+        '''
+        if key in self._text:
+            return self._text[key]
+        return self._times[key]
+
+    def to_list(self):
+        '''
+        :return: 与接口返回格式相同的 dict 列表
+        '''
+        return [self._entry(index) for index in range(self._length)]
+
+    def __repr__(self):
+        return '<MessagePage %d messages>' % self._length
+
+
+_COLUMNS = frozenset(MessagePage.STRING_COLUMNS + MessagePage.TIMESTAMP_COLUMNS +
+                     MessagePage.FLAG_COLUMNS)
@@ -1,14 +1,55 @@
 #! -*- coding: utf-8 -*-
 
+import re
 import hmac
 import time
+import threading
 from hashlib import sha256
 
+import six
 import requests
-from six.moves.urllib.parse import urlencode
+from requests.adapters import HTTPAdapter
+from six.moves.http_cookiejar import DefaultCookiePolicy
+from six.moves.urllib.parse import urlencode, quote_plus
 
-from .json_import import json
+from .codec import DEFAULT_CODEC, get_codec, gzip_compress
 from .helper import md5_constructor as md5
+from .instrumentation import NULL_INSTRUMENTATION, instrument_session
+
+
+# 不需要转义的查询参数值（绝大多数 id、时间戳、数字都属于此类）
+_safe_text = re.compile(u'^[A-Za-z0-9_.~-]*$')
+_safe_bytes = re.compile(b'^[A-Za-z0-9_.~-]*$')
+
+
+def _quote_query_value(value):
+    if isinstance(value, bytes):
+        if _safe_bytes.match(value):
+            return value if str is bytes else value.decode('ascii')
+    else:
+        if not isinstance(value, six.string_types):
+            value = str(value)
+        if _safe_text.match(value):
+            return str(value)
+    return quote_plus(value)
+
+
+def encode_query(params):
+    '''
+    与 urlencode(params) 结果一致，但跳过无需转义的值，参数都是 id、数字时快得多。
+    '''
+    return '&'.join('%s=%s' % (_quote_query_value(key), _quote_query_value(value))
+                    for key, value in params.items())
+
+
+# 网络层错误，可以安全地判定为请求没有得到服务端响应
+TRANSPORT_ERRORS = (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError)
+
+
+# RealtimeAPI(transport=...) 可选的名称，见 realtime.transport
+TRANSPORTS = ('requests', 'http2', 'h2c')
 
 
 class OAuth2AuthExchangeError(Exception):
@@ -20,6 +61,36 @@ class OAuth2AuthExchangeError(Exception):
         return self.description
 
 
+class _RejectCookies(DefaultCookiePolicy):
+    # 多个应用共享的 session 不能保存响应的 Cookie，否则会随其他应用的请求发出
+
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+
+def build_session(pool_connections=10, pool_maxsize=10, pool_block=False,
+                  accept_cookies=True):
+    '''
+    :param pool_connections: 缓存的连接池个数（每个 host 一个连接池）
+    :param pool_maxsize:     每个 host 最多保持的 keep-alive 连接数
+    :param pool_block:       连接数达到 pool_maxsize 时是否阻塞等待空闲连接
+    :param accept_cookies:   是否保存响应的 Cookie，多个应用共享 session 时应为 False
+    :return: requests.Session
+    '''
+    session = requests.Session()
+    if not accept_cookies:
+        session.cookies.set_policy(_RejectCookies())
+    adapter = HTTPAdapter(pool_connections=pool_connections,
+                          pool_maxsize=pool_maxsize,
+                          pool_block=pool_block)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
 class OAuth2API(object):
 
     host = None
@@ -28,17 +99,122 @@ class OAuth2API(object):
     protocol = "https"
     api_name = "LeanCloud API"
 
+    pool_connections = 10
+    pool_maxsize = 10
+    pool_block = False
+    # 没有超时时一个卡住的连接会让调用线程一直等待
+    connect_timeout = 10
+    read_timeout = 60
+    instrumentation = NULL_INSTRUMENTATION
+    codec = DEFAULT_CODEC
+    compress_threshold = None
+    # 'requests'、'http2'、'h2c' 或 transport 实例，见 realtime.transport
+    transport = 'requests'
+
     def __init__(self,
                  app_id=None,
                  app_key=None,
                  master_key=None,
                  client_ips=None,
-                 access_token=None):
+                 access_token=None,
+                 host=None,
+                 protocol=None,
+                 session=None,
+                 pool_connections=None,
+                 pool_maxsize=None,
+                 pool_block=None,
+                 connect_timeout=None,
+                 read_timeout=None,
+                 instrumentation=None,
+                 codec=None,
+                 compress_threshold=None,
+                 transport=None):
         self.app_id = app_id
         self.app_key = app_key
         self.master_key = master_key
         self.client_ips = client_ips
         self.access_token = access_token
+        # 可指向本地 stub 服务或代理，例如 host='127.0.0.1:8000', protocol='http'
+        if host is not None:
+            self.host = host
+        if protocol is not None:
+            self.protocol = protocol
+        if pool_connections is not None:
+            self.pool_connections = pool_connections
+        if pool_maxsize is not None:
+            self.pool_maxsize = pool_maxsize
+        if pool_block is not None:
+            self.pool_block = pool_block
+        if connect_timeout is not None:
+            self.connect_timeout = connect_timeout
+        if read_timeout is not None:
+            self.read_timeout = read_timeout
+        if instrumentation is not None:
+            self.instrumentation = instrumentation
+        if codec is not None:
+            self.codec = get_codec(codec)
+        if compress_threshold is not None:
+            self.compress_threshold = compress_threshold
+        if transport is not None:
+            if isinstance(transport, six.string_types) and transport not in TRANSPORTS:
+                raise ValueError('Unknown transport %r, expected one of %s'
+                                 % (transport, TRANSPORTS))
+            self.transport = transport
+        # 外部传入的 session 由调用方负责关闭
+        self._session = session
+        self._owns_session = session is None
+        self._session_lock = threading.Lock()
+        self._auth_headers_cache = {}
+
+    @property
+    def base_url(self):
+        # protocol/host/base_path 很少在创建后修改，按三者缓存拼好的前缀
+        key = (self.protocol, self.host, self.base_path)
+        cached = self.__dict__.get('_base_url')
+        if cached is None or cached[0] != key:
+            cached = self._base_url = (key, "%s://%s%s" % key)
+        return cached[1]
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    if self.transport == 'requests':
+                        session = build_session(self.pool_connections,
+                                                self.pool_maxsize,
+                                                self.pool_block)
+                    else:
+                        from .transport import build_transport
+                        session = build_transport(self.transport,
+                                                  self.pool_connections,
+                                                  self.pool_maxsize,
+                                                  self.pool_block)
+                    if self.instrumentation.enabled:
+                        instrument_session(session)
+                    self._session = session
+        return self._session
+
+    @property
+    def timeout(self):
+        if self.connect_timeout is None and self.read_timeout is None:
+            return None
+        return (self.connect_timeout, self.read_timeout)
+
+    def close(self):
+        # 外部传入的 session 由调用方关闭，关闭后的客户端仍使用它，不会另建连接池
+        if not self._owns_session:
+            return
+        with self._session_lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 
 class OAuth2Request(object):
@@ -63,12 +239,10 @@ class OAuth2Request(object):
 
     def _full_url(self, path,
                   include_signed_request=False):
-        return "%s://%s%s%s%s" % (self.api.protocol,
-                                  self.api.host,
-                                  self.api.base_path,
-                                  path,
-                                  self._signed_request(path, {},
-                                                       include_signed_request))
+        return "%s%s%s" % (self.api.base_url,
+                           path,
+                           self._signed_request(path, {},
+                                                include_signed_request))
 
     def _full_url_with_params(self, path, params,
                               include_signed_request=False):
@@ -78,10 +252,21 @@ class OAuth2Request(object):
                                      include_signed_request))
 
     def _full_query_with_params(self, params):
-        params = ("?" + urlencode(params)) if params else ""
+        params = ("?" + encode_query(params)) if params else ""
         return params
 
     def _auth_headers(self, include_secret=False, include_signed=False):
+        if include_signed:
+            return self._build_auth_headers(include_secret, include_signed)
+        # 不带签名的鉴权头只取决于应用的 key，按 key 缓存，每次调用只复制一份
+        cache_key = (include_secret, self.api.app_id, self.api.app_key, self.api.master_key)
+        headers = self.api._auth_headers_cache.get(cache_key)
+        if headers is None:
+            headers = self.api._auth_headers_cache[cache_key] = \
+                self._build_auth_headers(include_secret, include_signed)
+        return dict(headers)
+
+    def _build_auth_headers(self, include_secret=False, include_signed=False):
         headers = {
             'Content-type': 'application/json',
             'X-LC-Id': self.api.app_id,
@@ -89,10 +274,10 @@ class OAuth2Request(object):
         if include_signed:
             timestamp = int(time.time() * 1000)
             if include_secret:
-                signed_str = md5('%s%s' % (timestamp, self.api.master_key)).hexdigest()
+                signed_str = md5(('%s%s' % (timestamp, self.api.master_key)).encode('utf-8')).hexdigest()
                 headers['X-LC-Sign'] = '%s,%s,master' % (signed_str, timestamp)
             else:
-                signed_str = md5('%s%s' % (timestamp, self.api.app_key)).hexdigest()
+                signed_str = md5(('%s%s' % (timestamp, self.api.app_key)).encode('utf-8')).hexdigest()
                 headers['X-LC-Sign'] = '%s,%s' % (signed_str, timestamp)
         else:
             if include_secret:
@@ -102,8 +287,9 @@ class OAuth2Request(object):
         return headers
 
     def _signed_request(self, path, params, include_signed_request):
-        print include_signed_request
         if include_signed_request and self.api.app_key is not None:
+            # 复制一份再加入鉴权参数，调用方的 dict 可能被其他线程或其他应用复用
+            params = dict(params)
             if self.api.access_token:
                 params['access_token'] = self.api.access_token
             elif self.api.app_id:
@@ -115,7 +301,11 @@ class OAuth2Request(object):
 
     def _post_body(self, params):
         json_body = params.pop('json_body', None)
-        return urlencode(params), json_body
+        # body 为已经序列化好的请求体，原样发送
+        body = params.pop('body', None)
+        if body is None:
+            body = urlencode(params) if params else ''
+        return body, json_body
 
     def prepare_and_make_request(self, method, path, params,
                                  include_secret=False, include_signed=False):
@@ -141,17 +331,25 @@ class OAuth2Request(object):
 
         return url, method, body, json_body, headers
 
-    def make_request(self, url, method="GET", body=None, json_body=None, headers=None):
-        headers = headers or {}
-        headers.update({"User-Agent": "%s Python Client" % self.api.api_name})
+    def _request_data(self, body=None, json_body=None, headers=None):
         if json_body:
-            data = json.dumps(json_body)
+            data = self.api.codec.dumps(json_body)
         elif body:
             data = body
         else:
-            data = None
-        print method
-        print url
-        print data
-        print headers
-        return requests.request(method, url, data=data, headers=headers)
+            return None
+        threshold = self.api.compress_threshold
+        if threshold is not None and headers is not None and len(data) >= threshold:
+            if isinstance(data, six.text_type):
+                data = data.encode('utf-8')
+            data = gzip_compress(data)
+            headers['Content-Encoding'] = 'gzip'
+        return data
+
+    def make_request(self, url, method="GET", body=None, json_body=None, headers=None,
+                     timeout=None):
+        headers = headers or {}
+        headers.update({"User-Agent": "%s Python Client" % self.api.api_name})
+        data = self._request_data(body, json_body, headers)
+        return self.api.session.request(method, url, data=data, headers=headers,
+                                        timeout=timeout or self.api.timeout)
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+'''
+客户端限流。
+
+每个 app_id 共享一个 RateLimiter（通过 get_rate_limiter 获取），请求发出前先从令牌桶中
+预约令牌，令牌不足时返回需要等待的时间；同步调用方 sleep，异步调用方 await asyncio.sleep。
+收到 X-RateLimit-* 响应头时按剩余配额收紧令牌桶，收到限流错误（529/430/431/HTTP 429）
+时按比例降低速率并暂停一段时间，之后每次成功请求再逐步恢复（AIMD）。
+
+令牌已经补满、没有暂停且速率已经恢复的限流器与新建的没有区别，注册表只弱引用这样的限流器，
+没有客户端使用后即被回收；仍在限速或降速中的限流器保留到恢复为止，客户端被 ClientPool
+淘汰后重新创建时沿用原来的状态。
+'''
+
+import threading
+import time
+import weakref
+
+
+RATE_LIMIT_CODES = ('529', '430', '431')
+
+RATE_LIMIT_HEADER = 'X-RateLimit-Limit'
+RATE_LIMIT_REMAINING_HEADER = 'X-RateLimit-Remaining'
+RATE_LIMIT_RESET_HEADER = 'X-RateLimit-Reset'
+RETRY_AFTER_HEADER = 'Retry-After'
+
+
+def _to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate, burst=None, clock=time.time):
+        '''
+        :param rate:  每秒补充的令牌数
+        :param burst: 桶容量，默认等于 rate
+        '''
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.tokens = self.burst
+        self.blocked_until = 0
+        self._clock = clock
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = max(now - self._updated, 0)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens=1):
+        '''
+        预约令牌，令牌数允许为负，后来的调用方会排在前面的调用方之后。
+
+        :return: 调用方需要等待的秒数
+        '''
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+            return max(wait, self.blocked_until - now, 0)
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill(self._clock())
+            self.rate = float(rate)
+
+    def limit_tokens(self, tokens):
+        with self._lock:
+            self._refill(self._clock())
+            self.tokens = min(self.tokens, tokens)
+
+    def block(self, seconds):
+        with self._lock:
+            now = self._clock()
+            self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def settled(self):
+        '''
+        :return: 令牌是否已经补满且没有暂停
+        '''
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            return self.tokens >= self.burst and self.blocked_until <= now
+
+
+class RateLimiter(object):
+
+    def __init__(self, rate, burst=None, endpoint_limits=None, min_rate=1.0,
+                 backoff_factor=0.5, recovery=None, low_watermark=0.1,
+                 clock=time.time):
+        '''
+        :param rate:            每秒请求数上限
+        :param burst:           可选  允许的突发请求数，默认等于 rate
+        :param endpoint_limits: 可选  端点级别的限制，{端点名: 每秒请求数}，如 {'send_message': 50}
+        :param min_rate:        可选  自适应降速的下限
+        :param backoff_factor:  可选  每次被限流后速率乘以该系数
+        :param recovery:        可选  每次成功请求后速率的增加量，默认 rate / 100
+        :param low_watermark:   可选  剩余配额低于上限的该比例时按剩余配额收紧令牌
+        '''
+        self.max_rate = float(rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.backoff_factor = backoff_factor
+        self.recovery = recovery if recovery is not None else self.max_rate / 100
+        self.low_watermark = low_watermark
+        self._clock = clock
+        # 由 get_rate_limiter 创建时记录对应的 app_id 与创建参数
+        self.app_id = None
+        self.settings = {}
+        self.bucket = TokenBucket(rate, burst, clock=clock)
+        self.endpoint_buckets = dict(
+            (name, TokenBucket(limit, clock=clock))
+            for name, limit in (endpoint_limits or {}).items())
+        self.throttled = 0
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def reserve(self, endpoint=None):
+        '''
+        :param endpoint: 端点名，如 'send_message'
+        :return: 发出请求前需要等待的秒数
+        '''
+        wait = self.bucket.reserve()
+        endpoint_bucket = self.endpoint_buckets.get(endpoint)
+        if endpoint_bucket is not None:
+            wait = max(wait, endpoint_bucket.reserve())
+        return wait
+
+    def acquire(self, endpoint=None):
+        wait = self.reserve(endpoint)
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_response(self, headers):
+        '''
+        根据 X-RateLimit-* 响应头在配额耗尽前放慢请求，并在请求成功后逐步恢复速率。
+        '''
+        limit = _to_number(headers.get(RATE_LIMIT_HEADER))
+        remaining = _to_number(headers.get(RATE_LIMIT_REMAINING_HEADER))
+        if remaining is not None and limit and remaining <= limit * self.low_watermark:
+            self.bucket.limit_tokens(remaining)
+            if remaining <= 0:
+                reset = _to_number(headers.get(RATE_LIMIT_RESET_HEADER))
+                if reset is not None:
+                    # 既支持剩余秒数也支持 Unix 时间戳
+                    if reset > 1e9:
+                        reset -= self._clock()
+                    self.bucket.block(max(reset, 0))
+                    _pin(self)
+        if self.bucket.rate < self.max_rate:
+            self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.recovery))
+
+    def on_rate_limited(self, headers=None):
+        '''
+        请求被服务端限流：按 backoff_factor 降低速率，并暂停到 Retry-After 指定的时间。
+        '''
+        self.throttled += 1
+        self.bucket.set_rate(max(self.min_rate, self.bucket.rate * self.backoff_factor))
+        retry_after = _to_number((headers or {}).get(RETRY_AFTER_HEADER))
+        self.bucket.block(retry_after if retry_after is not None else 1.0 / self.bucket.rate)
+        _pin(self)
+
+    def settled(self):
+        '''
+        :return: 是否与新建的限流器状态相同：令牌已经补满、没有暂停、速率已经恢复
+        '''
+        buckets = [self.bucket] + list(self.endpoint_buckets.values())
+        return self.bucket.rate >= self.max_rate and \
+            all([bucket.settled() for bucket in buckets])
+
+
+# 仍在限速或降速中的限流器，强引用
+_limiters = {}
+# 所有限流器，包括已经恢复、只被客户端引用的
+_all_limiters = weakref.WeakValueDictionary()
+_limiters_lock = threading.Lock()
+_pruned_at = [0]
+
+PRUNE_INTERVAL = 60
+
+
+def _prune(now):
+    # 已经恢复的限流器改为只由 _all_limiters 弱引用，仍被客户端使用时 get_rate_limiter
+    # 照样返回同一个实例
+    if now - _pruned_at[0] < PRUNE_INTERVAL:
+        return
+    _pruned_at[0] = now
+    for app_id, limiter in list(_limiters.items()):
+        if limiter.settled():
+            del _limiters[app_id]
+
+
+def _pin(limiter):
+    # 暂停或降速后重新强引用，客户端被淘汰后重新创建时仍沿用这些状态
+    if limiter.app_id is None:
+        return
+    with _limiters_lock:
+        if _all_limiters.get(limiter.app_id) is limiter:
+            _limiters[limiter.app_id] = limiter
+
+
+def get_rate_limiter(app_id, rate=None, **kwargs):
+    '''
+    获取 app_id 共享的 RateLimiter，第一次调用时按参数创建。
+    之后的调用传入的参数必须与创建时相同，不传（None）表示沿用原来的设置。
+
+    :param app_id: 应用 id
+    :param rate:   每秒请求数上限，第一次调用时必须提供
+    :return: RateLimiter
+    :raise ValueError: 参数与已有限流器的设置不同
+    '''
+    settings = dict((key, value) for key, value in kwargs.items() if value is not None)
+    if rate is not None:
+        settings['rate'] = rate
+    with _limiters_lock:
+        _prune(time.time())
+        limiter = _all_limiters.get(app_id)
+        if limiter is None:
+            if rate is None:
+                raise ValueError('rate is required to create a rate limiter for %s' % app_id)
+            limiter = RateLimiter(rate, **kwargs)
+            limiter.settings = settings
+            limiter.app_id = app_id
+            _all_limiters[app_id] = limiter
+        else:
+            conflicts = sorted(key for key, value in settings.items()
+                               if limiter.settings.get(key) != value)
+            if conflicts:
+                raise ValueError('Rate limiter for %s already exists with different %s'
+                                 % (app_id, ', '.join(conflicts)))
+        _limiters[app_id] = limiter
+        return limiter
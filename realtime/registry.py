@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+'''
+多应用客户端注册表。
+
+一个进程服务多个 LeanCloud 应用时，用 ClientPool 按 app_id 复用 RealtimeAPI：
+
+    pool = ClientPool(credentials={'app1': {'app_key': ..., 'master_key': ...}, ...},
+                      maxsize=256, idle_timeout=600, rate_limit=100)
+    pool.get('app1').send_message(json_body=...)
+
+    with pool.lease('app1') as client:   # 使用期间不会被淘汰
+        ...
+
+所有应用共享一个 requests.Session，也就是同一组 keep-alive 连接；鉴权头在每个请求上
+单独生成，共享的 session 不保存 Cookie，因此一个应用的请求不会带上其他应用的凭据。
+限流器仍按 app_id 区分（get_rate_limiter），被淘汰后重新创建的客户端沿用原来的限流器。
+
+超过 maxsize 个应用，或某个应用超过 idle_timeout 秒没有被使用时，最久未使用且没有被
+lease 占用的客户端会被关闭并移出注册表，下次 get 时重新创建。
+'''
+
+import collections
+import threading
+import time
+from contextlib import contextmanager
+
+from .client import RealtimeAPI
+from .oauth2 import build_session
+from .instrumentation import instrument_session
+
+
+class _Tenant(object):
+
+    __slots__ = ('client', 'leases', 'last_used')
+
+    def __init__(self, client, now):
+        self.client = client
+        self.leases = 0
+        self.last_used = now
+
+
+class ClientPool(object):
+
+    def __init__(self, credentials, maxsize=256, idle_timeout=None, session=None,
+                 pool_connections=None, pool_maxsize=10, pool_block=False,
+                 client_class=RealtimeAPI, clock=time.time, **client_options):
+        '''
+        :param credentials:      {app_id: RealtimeAPI 的参数 dict}，或 credentials(app_id)
+                                 返回该 dict；dict 至少包含 app_key / master_key，也可以
+                                 包含 host、rate_limit 等该应用单独的参数
+        :param maxsize:          可选  最多保留多少个应用的客户端
+        :param idle_timeout:     可选  超过该秒数未使用的客户端会被淘汰
+        :param session:          可选  共享的 requests.Session，由调用方负责关闭
+        :param pool_connections: 可选  共享 session 缓存的连接池个数，默认等于 maxsize
+        :param pool_maxsize:     可选  共享 session 每个 host 最多保持的连接数
+        :param pool_block:       可选  连接数达到上限时是否阻塞等待
+        :param client_class:     可选  客户端类，默认 RealtimeAPI
+        :param client_options:   可选  所有应用共用的 RealtimeAPI 参数，如 rate_limit、
+                                 retry_policy、instrumentation
+        '''
+        self.credentials = credentials
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.client_class = client_class
+        self.client_options = client_options
+        self._clock = clock
+        self._owns_session = session is None
+        if session is None:
+            # 不同应用的 host 可能不同，每个 host 一个连接池
+            session = build_session(pool_connections or maxsize, pool_maxsize, pool_block,
+                                    accept_cookies=False)
+            instrumentation = client_options.get('instrumentation')
+            if instrumentation is not None and instrumentation.enabled:
+                instrument_session(session)
+        self.session = session
+        self._tenants = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _options(self, app_id):
+        if callable(self.credentials):
+            app_options = self.credentials(app_id)
+        else:
+            app_options = self.credentials[app_id]
+        options = dict(self.client_options)
+        options.update(app_options)
+        options['app_id'] = app_id
+        options['session'] = self.session
+        return options
+
+    def _acquire(self, app_id, lease):
+        now = self._clock()
+        with self._lock:
+            tenant = self._checkout(app_id, now, lease)
+        if tenant is not None:
+            return tenant.client
+        # 查询凭据与创建客户端不持有锁，凭据可能来自数据库等较慢的来源
+        client = self.client_class(**self._options(app_id))
+        evicted = [client]
+        try:
+            with self._lock:
+                tenant = self._checkout(app_id, now, lease)
+                # 其他线程同时创建了同一个应用的客户端时，使用先注册的那个
+                if tenant is None:
+                    self.misses += 1
+                    tenant = self._tenants[app_id] = _Tenant(client, now)
+                    if lease:
+                        tenant.leases += 1
+                    evicted = self._evict(now, keep=app_id)
+        finally:
+            for stale in evicted:
+                stale.close()
+        return tenant.client
+
+    def _checkout(self, app_id, now, lease):
+        if self._closed:
+            raise RuntimeError('ClientPool is closed')
+        tenant = self._tenants.get(app_id)
+        if tenant is None:
+            return None
+        self.hits += 1
+        tenant.last_used = now
+        if lease:
+            tenant.leases += 1
+        # Python 2 的 OrderedDict 没有 move_to_end
+        del self._tenants[app_id]
+        self._tenants[app_id] = tenant
+        return tenant
+
+    def _evict(self, now, keep=None):
+        # 从最久未使用的开始，淘汰超出容量或空闲超时、且没有被 lease 占用的客户端
+        evicted = []
+        excess = len(self._tenants) - self.maxsize
+        for app_id, tenant in list(self._tenants.items()):
+            idle = self.idle_timeout is not None and now - tenant.last_used > self.idle_timeout
+            if excess <= 0 and not idle:
+                break
+            if tenant.leases or app_id == keep:
+                continue
+            del self._tenants[app_id]
+            evicted.append(tenant.client)
+            self.evictions += 1
+            excess -= 1
+        return evicted
+
+    def get(self, app_id):
+        '''
+        :return: app_id 对应的 RealtimeAPI，不存在时按 credentials 创建
+        '''
+        return self._acquire(app_id, False)
+
+    @contextmanager
+    def lease(self, app_id):
+        '''
+        与 get 相同，但在 with 块结束前该客户端不会被淘汰。
+        '''
+        client = self._acquire(app_id, True)
+        try:
+            yield client
+        finally:
+            with self._lock:
+                tenant = self._tenants.get(app_id)
+                if tenant is not None and tenant.client is client:
+                    tenant.leases -= 1
+
+    def evict(self, app_id):
+        '''
+        关闭并移除 app_id 的客户端，例如应用的 key 更换之后。
+        '''
+        with self._lock:
+            tenant = self._tenants.pop(app_id, None)
+        if tenant is not None:
+            tenant.client.close()
+
+    def prune(self):
+        '''
+        立即淘汰空闲超时的客户端，创建新的客户端时也会顺带执行。
+
+        :return: 淘汰的个数
+        '''
+        with self._lock:
+            evicted = self._evict(self._clock())
+        for client in evicted:
+            client.close()
+        return len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._tenants),
+                'leased': sum(1 for tenant in self._tenants.values() if tenant.leases),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def __contains__(self, app_id):
+        with self._lock:
+            return app_id in self._tenants
+
+    def __len__(self):
+        return len(self._tenants)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            tenants = list(self._tenants.values())
+            self._tenants.clear()
+        for tenant in tenants:
+            tenant.client.close()
+        if self._owns_session:
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+'''
+重试、熔断与对冲请求。
+
+- RetryPolicy：带抖动的指数退避。默认只重试幂等端点（GET 查询、DELETE 聊天记录），
+  send_message 等非幂等端点需要通过 unsafe_endpoints 显式开启。
+- CircuitBreaker：每个端点一个，连续失败达到阈值后在 reset_timeout 内直接失败，
+  之后放行一个试探请求，成功则恢复。
+- LatencyTracker / hedged_call：请求耗时超过最近网络耗时的某个分位数后再发出一个相同的请求，
+  主请求失败时改用对冲请求的结果，慢请求失败后不必再从头重试。asyncio 客户端取先返回的结果。
+'''
+
+import collections
+import random
+import threading
+import time
+
+
+class RetryPolicy(object):
+
+    def __init__(self, max_attempts=3, backoff=0.1, max_backoff=5.0,
+                 jitter=True, unsafe_endpoints=()):
+        '''
+        :param max_attempts:     最多尝试次数（包含第一次）
+        :param backoff:          第一次重试前的基础等待秒数，之后每次翻倍
+        :param max_backoff:      单次等待的上限
+        :param jitter:           是否在 [0, 等待时间] 之间随机取值，避免重试风暴
+        :param unsafe_endpoints: 允许重试的非幂等端点名，如 ('send_message',)，重试可能导致重复发送
+        '''
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.unsafe_endpoints = frozenset(unsafe_endpoints)
+
+    def should_retry(self, endpoint, idempotent, attempt):
+        '''
+        :param endpoint:   端点名
+        :param idempotent: 端点是否幂等
+        :param attempt:    已经尝试的次数
+        '''
+        if attempt >= self.max_attempts:
+            return False
+        return idempotent or endpoint in self.unsafe_endpoints
+
+    def backoff_time(self, attempt):
+        delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+class CircuitBreaker(object):
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.time):
+        '''
+        :param failure_threshold: 连续失败多少次后熔断
+        :param reset_timeout:     熔断后多少秒放行一个试探请求
+        '''
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and \
+                    self._clock() - self.opened_at >= self.reset_timeout:
+                # 只放行一个试探请求，结果出来之前其他请求仍然直接失败
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self._clock()
+
+    def record_cancelled(self):
+        '''
+        请求被取消、结果未知。试探请求被取消时恢复为熔断状态，下一个请求立即作为新的试探请求。
+        '''
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+
+class LatencyTracker(object):
+
+    def __init__(self, size=200, min_samples=20):
+        '''
+        :param size:        保留最近多少次请求的耗时
+        :param min_samples: 样本数少于该值时不给出分位数
+        '''
+        self.min_samples = min_samples
+        self._samples = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent):
+        '''
+        :return: 最近耗时的 percent 分位数，样本不足时返回 None
+        '''
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = sorted(self._samples)
+        index = min(len(samples) - 1, int(len(samples) * percent / 100.0))
+        return samples[index]
+
+
+_SKIPPED = object()
+
+
+def hedged_call(executor, func, delay):
+    '''
+    在调用方线程中执行 func，delay 秒后仍未返回时向 executor 提交一次相同的调用。
+    executor 只用于对冲请求，并发的主请求不会在其中排队。
+
+    同步请求发出后无法中途放弃，func 成功时直接返回其结果；失败时如果对冲请求已经发出，
+    等待并返回对冲请求的结果，两次都失败时抛出 func 的异常。
+
+    :param executor: concurrent.futures.Executor
+    :param func:     无参数的可调用对象，主请求与对冲请求并发执行，不能共享可变状态
+    :param delay:    发出对冲请求前等待的秒数
+    '''
+    finished = threading.Event()
+    fire_at = [time.time() + delay]
+
+    def _hedge():
+        # executor 繁忙时对冲请求可能晚于 delay 才开始，此时主请求已经返回则不再发出
+        while time.time() < fire_at[0]:
+            if finished.wait(fire_at[0] - time.time()):
+                return _SKIPPED
+        if finished.is_set():
+            return _SKIPPED
+        return func()
+
+    hedge = executor.submit(_hedge)
+    # submit 可能需要新建线程，从主请求真正开始时计时
+    fire_at[0] = time.time() + delay
+    try:
+        return func()
+    except Exception:
+        finished.set()
+        # 尚未开始执行的对冲任务直接取消，已经发出的对冲请求等待其结果
+        if not hedge.cancel() and hedge.exception() is None and hedge.result() is not _SKIPPED:
+            return hedge.result()
+        raise
+    finally:
+        finished.set()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+'''
+合并相同的并发读请求（single flight）。
+
+RealtimeAPI(single_flight=True) 开启后，标记了 single_flight 的 GET 端点（聊天记录查询与
+对话查询）在同一时刻只会为相同的请求发出一次 HTTP 请求：请求按应用、鉴权方式、端点、
+路径与参数（与参数顺序、int/str 写法无关）匹配，后到的调用方等待先到的请求完成，共享同一个
+响应。同一个 SingleFlight 可以交给多个应用的客户端（如 ClientPool）共用，不同应用的请求不会合并。
+每个调用方各自解析响应体，拿到互不影响的对象，return_json、compact 也可以不同；
+请求失败时所有调用方收到同一个异常。请求完成后立即移除，不会缓存结果。
+
+线程与 asyncio 都适用：线程等待 threading.Event，协程等待同一个 Task（调用方被取消
+不会影响其他调用方）。stats() 按端点返回实际发出的请求数与被合并的调用数。
+'''
+
+import threading
+
+
+class _Call(object):
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+
+    def __init__(self, instrumentation=None):
+        '''
+        :param instrumentation: 可选  Instrumentation，被合并的调用计入 deduplicated 指标
+        '''
+        self.instrumentation = instrumentation
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._deduplicated = {}
+
+    def _count(self, endpoint, shared):
+        counter = self._deduplicated if shared else self._requests
+        counter[endpoint] = counter.get(endpoint, 0) + 1
+
+    def _record_shared(self, endpoint):
+        if self.instrumentation is not None:
+            self.instrumentation.record_deduplicated(endpoint)
+
+    def do(self, endpoint, key, func):
+        '''
+        :param endpoint: 端点名，用于统计
+        :param key:      请求的标识，相同的并发请求只执行一次 func
+        :param func:     func()，发出请求
+        :return: (func 的返回值, 是否为共享的结果)
+        '''
+        key = (endpoint, key)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._count(endpoint, not leader)
+        if not leader:
+            self._record_shared(endpoint)
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = func()
+        except BaseException as e:
+            # 包括 KeyboardInterrupt 等，否则等待的调用方会拿到 None
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+    def task(self, endpoint, key, factory):
+        '''
+        asyncio 版本的 do，调用方 await asyncio.shield(task) 得到结果。
+
+        :param factory: factory()，返回发出请求的协程
+        :return: (asyncio.Task, 是否为共享的 Task)
+        '''
+        import asyncio
+
+        # 不同事件循环的 Task 不能互相等待，按事件循环区分
+        key = (endpoint, key, id(asyncio.get_event_loop()))
+        with self._lock:
+            task = self._tasks.get(key)
+            leader = task is None
+            if leader:
+                task = self._tasks[key] = asyncio.ensure_future(factory())
+                task.add_done_callback(lambda _: self._task_done(key, task))
+            self._count(endpoint, not leader)
+        if not leader:
+            self._record_shared(endpoint)
+        return task, not leader
+
+    def _task_done(self, key, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+        # 所有调用方都被取消时，避免 Task exception was never retrieved 警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        '''
+        :return: {端点名: {'requests': 实际发出的请求数, 'deduplicated': 被合并的调用数}}
+        '''
+        with self._lock:
+            return dict((endpoint, {'requests': self._requests.get(endpoint, 0),
+                                    'deduplicated': self._deduplicated.get(endpoint, 0)})
+                        for endpoint in set(self._requests) | set(self._deduplicated))
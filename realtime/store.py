@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+'''
+聊天记录的本地 SQLite 镜像。
+
+HistoryMirror 把聊天记录保存在带索引的 SQLite 数据库中，重复查询同一段历史时只需要一次
+本地索引查找，不再请求服务端：
+
+    mirror = HistoryMirror(client, 'history.db')
+    mirror.sync(convid)                        # 只拉取上次同步之后的新消息
+    mirror.query_message(convid, limit=20)     # 与 client.query_message 返回格式相同
+
+每个同步范围（某个对话、某个发送者或整个应用）记录已同步到的最新消息，作为下一次同步的
+起点。同步中途失败时不更新该记录，下次从最新消息重新拉取，已保存的消息按主键去重。
+'''
+
+import sqlite3
+import threading
+
+from .history import iter_pages, MAX_PAGE_SIZE
+from .json_import import json
+from .message import Message
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS messages (
+    convid    TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    msgid     TEXT NOT NULL,
+    from_peer TEXT,
+    raw       TEXT NOT NULL,
+    PRIMARY KEY (convid, timestamp, msgid)
+);
+CREATE INDEX IF NOT EXISTS messages_from ON messages (from_peer, timestamp, msgid);
+CREATE INDEX IF NOT EXISTS messages_time ON messages (timestamp, msgid);
+CREATE TABLE IF NOT EXISTS sync_state (
+    scope     TEXT PRIMARY KEY,
+    timestamp INTEGER NOT NULL,
+    msgid     TEXT
+);
+'''
+
+ALL_SCOPE = '*'
+
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class HistoryMirror(object):
+
+    def __init__(self, client, path=':memory:', page_size=MAX_PAGE_SIZE):
+        '''
+        :param client:    RealtimeAPI
+        :param path:      SQLite 数据库文件路径，默认只保存在内存中
+        :param page_size: 同步时每页拉取的条数
+        '''
+        self.client = client
+        self.path = path
+        self.page_size = page_size
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # 同步
+
+    def sync(self, convid, since=None):
+        '''
+        拉取对话中上次同步之后的新消息。
+
+        :param convid: 对话 id
+        :param since:  可选  第一次同步时最早拉取到的时间戳，默认拉取全部历史
+        :return: 新保存的消息条数
+        '''
+        def fetch_page(max_ts, msgid, limit):
+            return self.client.query_message(convid=convid, max_ts=max_ts,
+                                             msgid=msgid, limit=limit)
+        return self._sync(convid, fetch_page, since)
+
+    def sync_from(self, from_peer, since=None):
+        '''
+        拉取某个用户在上次同步之后发送的新消息，参数同 sync。
+        '''
+        def fetch_page(max_ts, msgid, limit):
+            return self.client.query_message_by_from(**{'from': from_peer, 'max_ts': max_ts,
+                                                        'msgid': msgid, 'limit': limit})
+        return self._sync('from:' + from_peer, fetch_page, since)
+
+    def sync_all(self, since=None):
+        '''
+        拉取整个应用在上次同步之后的新消息，参数同 sync。
+        '''
+        return self._sync(ALL_SCOPE, self.client.query_all_message, since)
+
+    def _sync(self, scope, fetch_page, since):
+        state = self.sync_state(scope)
+        if state is not None:
+            # since 包含边界，上次同步的最后一条会被再次拉取，插入时按主键忽略
+            since = state[0]
+        newest = None
+        saved = 0
+        for page in iter_pages(fetch_page, since=since, page_size=self.page_size):
+            if newest is None:
+                newest = (page[0].get('timestamp'), page[0].get('msg-id'))
+            saved += self._save(page)
+        if newest is not None:
+            with self._lock:
+                with self._db:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO sync_state (scope, timestamp, msgid) '
+                        'VALUES (?, ?, ?)', (scope, newest[0], newest[1]))
+        return saved
+
+    def _save(self, messages):
+        rows = [(message.get('conv-id'), message.get('timestamp'), message.get('msg-id'),
+                 message.get('from'), _text(json.dumps(message)))
+                for message in messages]
+        with self._lock:
+            with self._db:
+                before = self._db.total_changes
+                self._db.executemany(
+                    'INSERT OR IGNORE INTO messages '
+                    '(convid, timestamp, msgid, from_peer, raw) VALUES (?, ?, ?, ?, ?)', rows)
+                return self._db.total_changes - before
+
+    def save(self, messages):
+        '''
+        保存已经拿到的消息，例如 export 或 follow 得到的消息。
+
+        :return: 新保存的条数
+        '''
+        return self._save([message.to_dict() if isinstance(message, Message) else message
+                           for message in messages])
+
+    def sync_state(self, scope):
+        '''
+        :return: 同步范围已同步到的 (timestamp, msgid)，从未同步过时为 None
+        '''
+        with self._lock:
+            row = self._db.execute('SELECT timestamp, msgid FROM sync_state WHERE scope = ?',
+                                   (scope,)).fetchone()
+        return tuple(row) if row else None
+
+    # 查询
+
+    def query(self, convid=None, from_peer=None, since=None, max_ts=None, msgid=None,
+              limit=20, reversed=False, return_json=True):
+        '''
+        :param convid:      可选  对话 id
+        :param from_peer:   可选  发送者 client id
+        :param since:       可选  最早的时间戳（包含）
+        :param max_ts:      可选  查询起点，默认返回早于它（不包含）的消息；reversed 时返回晚于它的消息
+        :param msgid:       可选  与 max_ts 一起作为查询起点
+        :param limit:       可选  返回条数，None 表示不限
+        :param reversed:    可选  按时间正序返回
+        :param return_json: 可选  为 False 时返回 Message 列表
+        :return: 与历史记录接口格式相同的消息列表
+        '''
+        clauses = []
+        args = []
+        if convid is not None:
+            clauses.append('convid = ?')
+            args.append(convid)
+        if from_peer is not None:
+            clauses.append('from_peer = ?')
+            args.append(from_peer)
+        if since is not None:
+            clauses.append('timestamp >= ?')
+            args.append(since)
+        if max_ts is not None:
+            op = '>' if reversed else '<'
+            if msgid is None:
+                clauses.append('timestamp %s ?' % op)
+                args.append(max_ts)
+            else:
+                clauses.append('(timestamp %s ? OR (timestamp = ? AND msgid %s ?))' % (op, op))
+                args.extend([max_ts, max_ts, msgid])
+        order = 'ASC' if reversed else 'DESC'
+        sql = 'SELECT raw FROM messages'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY timestamp %s, msgid %s' % (order, order)
+        if limit is not None:
+            sql += ' LIMIT ?'
+            args.append(int(limit))
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        messages = [json.loads(row[0]) for row in rows]
+        if return_json:
+            return messages
+        return Message.list_from_dictionaries(messages)
+
+    def query_message(self, convid, max_ts=None, msgid=None, limit=20, reversed=False,
+                      return_json=True):
+        return self.query(convid=convid, max_ts=max_ts, msgid=msgid, limit=limit,
+                          reversed=reversed, return_json=return_json)
+
+    def query_message_by_from(self, from_peer, max_ts=None, msgid=None, limit=20,
+                              return_json=True):
+        return self.query(from_peer=from_peer, max_ts=max_ts, msgid=msgid, limit=limit,
+                          return_json=return_json)
+
+    def query_all_message(self, max_ts=None, msgid=None, limit=20, return_json=True):
+        return self.query(max_ts=max_ts, msgid=msgid, limit=limit, return_json=return_json)
+
+    def count(self, convid=None):
+        with self._lock:
+            if convid is None:
+                row = self._db.execute('SELECT COUNT(*) FROM messages').fetchone()
+            else:
+                row = self._db.execute('SELECT COUNT(*) FROM messages WHERE convid = ?',
+                                       (convid,)).fetchone()
+        return row[0]
+
+    def conversations(self):
+        '''
+        :return: 镜像中已有消息的对话 id
+        '''
+        with self._lock:
+            rows = self._db.execute('SELECT DISTINCT convid FROM messages').fetchall()
+        return [row[0] for row in rows]
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+'''
+HTTP 传输层。
+
+OAuth2Request.make_request 通过 api.session.request(method, url, data=..., headers=..., timeout=...)
+发出请求，session 可以是任何实现了 request 与 close 的对象，返回值需要有 status_code、
+headers、content、elapsed 与 request.body。RealtimeAPI(transport=...) 选择客户端创建的 session：
+
+    'requests'  默认，requests.Session。HTTP/1.1 每个连接同一时间只能有一个请求，
+                并发多少请求就需要多少连接
+    'http2'     HTTP2Transport，HTTPS 下通过 ALPN 协商 HTTP/2，多个并发请求复用少量连接，
+                服务端不支持时退回 HTTP/1.1
+    'h2c'       HTTP2Transport(prior_knowledge=True)，不经协商直接使用明文 HTTP/2，
+                用于 http:// 的本地 stub 或内网代理
+
+也可以传入 HTTP2Transport 实例指定参数，客户端关闭时一并关闭。HTTP2Transport 基于
+httpx 与 h2（pip install py-realtime-sdk[http2]），仅支持 Python 3。网络错误转换为
+requests 的对应异常，重试、熔断与截止时间的处理与默认 transport 相同。
+
+连接池参数与 requests 的对应关系：pool_maxsize 为保持的 keep-alive 连接数；pool_block=True
+时同时也是连接数上限，请求等待空闲连接，为 False 时超出的请求新建连接，用完后关闭。
+所有 host 共用一个连接池，pool_connections 不起作用。开启 instrumentation 时同样记录
+新建连接（TCP 与 TLS 握手）的耗时。
+
+    client = RealtimeAPI(app_id=..., app_key=..., master_key=..., transport='http2',
+                         pool_maxsize=4)
+'''
+
+import collections
+import threading
+import time
+
+import requests
+from six.moves.http_cookiejar import CookieJar
+
+from .instrumentation import add_connect_time
+from .oauth2 import build_session, _RejectCookies, TRANSPORTS
+
+# httpcore 新建连接时依次触发的 trace 事件
+_CONNECT_STARTED = 'connection.connect_tcp.started'
+_CONNECT_COMPLETE = ('connection.connect_tcp.complete', 'connection.start_tls.complete')
+
+SentRequest = collections.namedtuple('SentRequest', ['method', 'url', 'body'])
+
+
+class Response(object):
+    '''
+    与 requests.Response 中客户端用到的部分一致。
+    '''
+
+    __slots__ = ('status_code', 'headers', 'content', 'elapsed', 'request', 'http_version')
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content = response.content
+        self.elapsed = response.elapsed
+        self.http_version = response.http_version
+        request = response.request
+        self.request = SentRequest(request.method, str(request.url), request.content)
+
+
+class HTTP2Transport(object):
+    '''
+    请求在后台线程的事件循环中由 httpx.AsyncClient 发出，调用线程等待结果。httpx 的同步
+    HTTP/2 连接在多个线程间共享时没有对流的分配加锁，并发较高时同一个流 id 会被重复使用。
+    '''
+
+    # instrument_session 设为 True 后记录新建连接的耗时
+    time_connections = False
+
+    def __init__(self, max_connections=10, prior_knowledge=False, accept_cookies=True,
+                 verify=True, max_keepalive_connections=None):
+        '''
+        :param max_connections: 可选  最多建立的连接数，None 表示不限，每个 HTTP/2 连接可同时
+                                      承载多个请求（由服务端的 MAX_CONCURRENT_STREAMS 决定，
+                                      通常为 100）
+        :param prior_knowledge: 可选  不经协商直接使用 HTTP/2，用于 http:// 地址
+        :param accept_cookies:  可选  是否保存响应的 Cookie，多个应用共享时应为 False
+        :param verify:          可选  是否校验服务端证书
+        :param max_keepalive_connections: 可选  保持的空闲连接数，默认等于 max_connections
+        '''
+        try:
+            import httpx
+            import h2  # noqa: F401
+        except ImportError:
+            raise ImportError('HTTP2Transport requires httpx and h2: '
+                              'pip install py-realtime-sdk[http2]')
+        import asyncio
+
+        self._httpx = httpx
+        self._asyncio = asyncio
+        options = {}
+        if not accept_cookies:
+            options['cookies'] = CookieJar(policy=_RejectCookies())
+        self.client = httpx.AsyncClient(
+            http1=not prior_knowledge, http2=True, verify=verify,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections or max_connections),
+            **options)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        name='realtime-http2')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _timeout(self, timeout):
+        # requests 的超时是 None、秒数或 (connect, read)
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return self._httpx.Timeout(connect=connect, read=read, write=read, pool=connect)
+        return self._httpx.Timeout(timeout)
+
+    def _run(self, coroutine):
+        return self._asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def request(self, method, url, data=None, headers=None, timeout=None):
+        httpx = self._httpx
+        extensions = None
+        timing = {}
+        if self.time_connections:
+            async def trace(event, info):
+                if event == _CONNECT_STARTED:
+                    timing['start'] = time.time()
+                elif event in _CONNECT_COMPLETE and 'start' in timing:
+                    timing['connect'] = time.time() - timing['start']
+
+            extensions = {'trace': trace}
+        try:
+            response = self._run(self.client.request(method, url, content=data,
+                                                     headers=headers,
+                                                     timeout=self._timeout(timeout),
+                                                     extensions=extensions))
+        except httpx.ConnectTimeout as e:
+            raise requests.exceptions.ConnectTimeout(str(e))
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.ReadTimeout(str(e))
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+        finally:
+            # 在调用线程中记录，与 requests.Session 一样通过 pop_connect_time 读取
+            if 'connect' in timing:
+                add_connect_time(timing['connect'])
+        return Response(response)
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        self._run(self.client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def build_transport(transport, pool_connections=10, pool_maxsize=10, pool_block=False,
+                    accept_cookies=True):
+    '''
+    :param transport: TRANSPORTS 中的名称，或已经创建好的 transport（原样返回）
+    :return: requests.Session 或 HTTP2Transport。HTTP2Transport 保持 pool_maxsize 个连接，
+             pool_block=True 时连接数不超过 pool_maxsize
+    '''
+    if transport == 'requests':
+        return build_session(pool_connections, pool_maxsize, pool_block,
+                             accept_cookies=accept_cookies)
+    if transport in ('http2', 'h2c'):
+        return HTTP2Transport(max_connections=pool_maxsize if pool_block else None,
+                              max_keepalive_connections=pool_maxsize,
+                              prior_knowledge=transport == 'h2c',
+                              accept_cookies=accept_cookies)
+    if hasattr(transport, 'request'):
+        return transport
+    raise ValueError('Unknown transport %r, expected one of %s' % (transport, TRANSPORTS))
@@ -5,7 +5,14 @@ setup(name="py-realtime-sdk",
       version="0.1.0",
       description="LeanCloud Realtime Message Python SDK",
       license="BSD",
-      install_requires=["ujson", "requests", "six", "chardet"],
+      install_requires=["ujson", "requests", "six", "chardet",
+                        "futures; python_version < '3'"],
+      extras_require={
+          "async": ["aiohttp>=3.3"],
+          "columnar": ["numpy"],
+          "arrow": ["numpy", "pyarrow"],
+          "http2": ["httpx[http2]"],
+      },
       author="gusibi",
       author_email="cacique1103@gmail.com",
       url="https://github.com/gusibi/py-realtime-sdk",
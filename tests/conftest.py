@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from stub_server import StubServer, StubConfig  # noqa: E402
+
+
+def client_options(server, app_id='stub-app-id'):
+    '''
+    :return: 连接到 stub 服务的 RealtimeAPI 参数
+    '''
+    return dict(app_id=app_id, app_key='%s-key' % app_id, master_key='%s-master' % app_id,
+                host=server.host, protocol='http')
+
+
+@pytest.fixture
+def stub_config():
+    return StubConfig()
+
+
+@pytest.fixture
+def stub(stub_config):
+    with StubServer(config=stub_config) as server:
+        yield server
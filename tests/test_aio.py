@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from realtime.aio import AsyncRealtimeAPI, AsyncConversation, SYNC_ONLY_METHODS  # noqa: E402
+from realtime.bind import RealtimeTimeoutError  # noqa: E402
+from realtime.retry import CircuitBreaker  # noqa: E402
+
+from conftest import client_options, StubConfig  # noqa: E402
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_endpoints(stub):
+    async def main():
+        async with AsyncRealtimeAPI(**client_options(stub)) as client:
+            conversation = await AsyncConversation.init(client, convid='c1')
+            messages = await conversation.query_message(limit=5)
+            sent = await conversation.send('alice', 'hello')
+            await conversation.add_members(['bob'])
+            return conversation, messages, sent
+
+    conversation, messages, sent = run(main())
+    assert conversation.metadata['name'] == 'stub'
+    assert [message['conv-id'] for message in messages] == ['c1'] * 5
+    assert sent == {}
+    assert stub.requests == {
+        'GET /1.1/classes/_Conversation/c1': 1,
+        'GET /1.1/rtm/messages/history': 1,
+        'POST /1.1/rtm/messages': 1,
+        'PUT /1.1/classes/_Conversation/c1': 1,
+    }
+
+
+def test_sync_only_methods_raise(stub):
+    async def main():
+        async with AsyncRealtimeAPI(**client_options(stub)) as client:
+            for name in SYNC_ONLY_METHODS:
+                with pytest.raises(TypeError):
+                    getattr(client, name)(['c1'])
+            conversation = AsyncConversation(client, 'c1')
+            with pytest.raises(TypeError):
+                conversation.iter_messages()
+            with pytest.raises(TypeError):
+                conversation.iter_message_batches()
+            with pytest.raises(TypeError):
+                conversation.backfill_messages(since=0)
+
+    run(main())
+    assert stub.requests == {}
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=1.0)])
+def test_cancelled_probe_reopens_circuit(stub):
+    async def main():
+        async with AsyncRealtimeAPI(circuit_breaker={'reset_timeout': 0},
+                                    **client_options(stub)) as client:
+            breaker = client.circuit_breaker('query_message')
+            breaker.state = CircuitBreaker.OPEN
+            task = asyncio.ensure_future(client.query_message(convid='c1'))
+            await asyncio.sleep(0.2)
+            assert breaker.state == CircuitBreaker.HALF_OPEN
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return breaker
+
+    breaker = run(main())
+    assert breaker.state == CircuitBreaker.OPEN
+    # 下一个请求作为新的试探请求放行
+    assert breaker.allow()
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(audit=True)])
+def test_broadcast_and_send_many(stub):
+    conv_ids = ['c%d' % index for index in range(20)]
+
+    async def main():
+        async with AsyncRealtimeAPI(**client_options(stub)) as client:
+            broadcast = await client.broadcast(conv_ids, 'sys', 'hello', workers=4)
+            bodies = [{'conv_id': 'x%d' % index, 'from_peer': 'sys', 'message': 'hi'}
+                      for index in range(5)]
+            sent = await client.send_many(bodies, workers=2)
+            return broadcast, sent
+
+    broadcast, sent = run(main())
+    assert [result.target for result in broadcast] == conv_ids
+    assert all(result.ok and result.result == {} for result in broadcast)
+    assert [result.target for result in sent] == ['x%d' % index for index in range(5)]
+    assert all(result.ok for result in sent)
+    assert stub.requests == {'POST /1.1/rtm/messages': 25}
+    received = sorted(json.loads(entry['body'])['conv_id'] for entry in stub.audit)
+    assert received == sorted(conv_ids + ['x%d' % index for index in range(5)])
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.3)])
+def test_broadcast_deadline(stub):
+    async def main():
+        async with AsyncRealtimeAPI(**client_options(stub)) as client:
+            return await client.broadcast(['c%d' % index for index in range(6)], 'sys', 'hi',
+                                          workers=2, deadline=0.5)
+
+    results = run(main())
+    assert [result.ok for result in results] == [True, True] + [False] * 4
+    assert all(isinstance(result.error, RealtimeTimeoutError) for result in results[2:])
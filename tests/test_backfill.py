@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from realtime.backfill import Backfill, split_range
+from realtime.bind import RealtimeAPIError
+from realtime.client import Conversation, RealtimeAPI
+
+from conftest import client_options, StubConfig
+from stub_server import HISTORY_START, HISTORY_STEP
+
+HISTORY = 'GET /1.1/rtm/messages/history'
+
+
+def timestamp(index):
+    # stub 中第 index 条消息的时间戳
+    return HISTORY_START + (1000000 - index) * HISTORY_STEP
+
+
+def msgids(messages):
+    return [message['msg-id'] for message in messages]
+
+
+def test_split_range():
+    assert split_range(0, 100, 4) == [(75, 100), (50, 75), (25, 50), (0, 25)]
+    assert split_range(0, 10, 3) == [(7, 10), (3, 7), (0, 3)]
+    # 时间片个数不超过毫秒数
+    assert split_range(0, 2, 8) == [(1, 2), (0, 1)]
+
+
+def test_matches_sequential_order(stub):
+    client = RealtimeAPI(**client_options(stub))
+    conversation = Conversation(client, 'c1')
+    # 边界不落在消息的时间戳上，时间片的边界也不整齐
+    since, until = timestamp(1999) - 3, timestamp(0) + 7
+    sequential = list(conversation.iter_messages(since=since, until=until, page_size=100))
+    backfill = conversation.backfill_messages(since, until, workers=4, shards=7,
+                                              page_size=100)
+    messages = list(backfill)
+    client.close()
+    assert len(sequential) == 2000
+    assert msgids(messages) == msgids(sequential)
+    stats = backfill.stats()
+    assert len(stats['shards']) == 7
+    assert sum(shard['messages'] for shard in stats['shards']) == 2000
+    assert stats['duplicates'] == 0
+
+
+def test_inclusive_boundaries_are_deduplicated(stub):
+    client = RealtimeAPI(**client_options(stub))
+
+    def fetch_page(max_ts, msgid, limit):
+        # 服务端把 max_ts 当作包含的边界：每页的第一条是上一页的最后一条
+        return client.query_message(convid='c1', max_ts=max_ts + 1, limit=limit)
+
+    since, until = timestamp(299), timestamp(0) + 1
+    backfill = Backfill(fetch_page, since, until, workers=2, shards=3, page_size=50)
+    messages = list(backfill)
+    client.close()
+    assert msgids(messages) == ['c1-%d' % index for index in range(300)]
+    assert backfill.duplicates > 0
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.05)])
+def test_shards_are_fetched_in_parallel(stub):
+    client = RealtimeAPI(pool_maxsize=8, **client_options(stub))
+    conversation = Conversation(client, 'c1')
+    since, until = timestamp(999), timestamp(0) + 1
+    start = time.time()
+    sequential = list(conversation.iter_messages(since=since, until=until, page_size=100,
+                                                 prefetch=False))
+    sequential_time = time.time() - start
+    start = time.time()
+    parallel = list(conversation.backfill_messages(since, until, workers=8, page_size=100))
+    parallel_time = time.time() - start
+    client.close()
+    assert msgids(parallel) == msgids(sequential)
+    assert parallel_time < sequential_time / 2
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.02)])
+def test_closing_early_stops_workers(stub):
+    client = RealtimeAPI(**client_options(stub))
+    backfill = Conversation(client, 'c1').backfill_messages(
+        timestamp(4999), timestamp(0) + 1, workers=2, shards=50, page_size=20,
+        buffer_pages=1)
+    messages = iter(backfill)
+    assert next(messages)['msg-id'] == 'c1-0'
+    messages.close()
+    time.sleep(0.3)
+    requests = stub.requests[HISTORY]
+    time.sleep(0.3)
+    client.close()
+    # 只有少数几个时间片开始翻页，关闭后不再发出请求
+    assert stub.requests[HISTORY] == requests
+    assert requests < 20
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(error_rate=1.0)])
+def test_errors_are_raised(stub):
+    client = RealtimeAPI(**client_options(stub))
+    backfill = Conversation(client, 'c1').backfill_messages(timestamp(99), timestamp(0) + 1,
+                                                            workers=2)
+    with pytest.raises(RealtimeAPIError):
+        list(backfill)
+    client.close()
+
+
+def test_empty_range(stub):
+    client = RealtimeAPI(**client_options(stub))
+    assert list(Conversation(client, 'c1').backfill_messages(100, 100)) == []
+    client.close()
+    assert stub.requests == {}
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from realtime.bind import RealtimeAPIError
+from realtime.cache import ConversationCache, MISSING
+from realtime.client import Conversation, RealtimeAPI
+
+from conftest import client_options
+
+CONVERSATION = 'GET /1.1/classes/_Conversation/c1'
+
+
+class Clock(object):
+
+    def __init__(self, now=1500000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction():
+    cache = ConversationCache(maxsize=2, clock=Clock())
+    cache.set('a', {'m': []})
+    cache.set('b', {'m': []})
+    assert cache.get('a') is not None
+    cache.set('c', {'m': []})
+    # b 最久未使用，被淘汰
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_ttl_and_negative_ttl():
+    clock = Clock()
+    cache = ConversationCache(ttl=10, negative_ttl=2, clock=clock)
+    cache.set('a', {'m': ['x']})
+    cache.set_missing('gone')
+    assert cache.get('gone') is MISSING
+    clock.now += 3
+    assert cache.get('gone') is None
+    assert cache.get('a') == {'m': ['x']}
+    clock.now += 8
+    assert cache.get('a') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['negative_hits'], stats['misses'],
+            stats['expirations']) == (1, 1, 2, 2)
+
+
+def test_negative_entries_disabled_by_default():
+    cache = ConversationCache(clock=Clock())
+    cache.set_missing('gone')
+    assert cache.get('gone') is None
+    assert len(cache) == 0
+
+
+def test_update_members():
+    cache = ConversationCache(clock=Clock())
+    cache.set('a', {'m': ['x', 'y']})
+    cache.update_members('a', add=['y', 'z'])
+    cache.update_members('a', remove=['x'])
+    cache.update_members('unknown', add=['z'])
+    assert cache.get('a') == {'m': ['y', 'z']}
+    assert cache.get('unknown') is None
+
+
+def test_init_hits_cache(stub):
+    client = RealtimeAPI(conversation_cache=True, **client_options(stub))
+    first = Conversation.init(client, convid='c1')
+    second = Conversation.init(client, convid='c1')
+    client.close()
+    assert first.metadata == second.metadata
+    assert second.metadata['m'] == ['a', 'b']
+    assert stub.requests == {CONVERSATION: 1}
+    assert client.conversation_cache.stats()['hits'] == 1
+
+
+def test_init_expires_after_ttl(stub):
+    clock = Clock()
+    client = RealtimeAPI(conversation_cache={'ttl': 10, 'clock': clock},
+                         **client_options(stub))
+    Conversation.init(client, convid='c1')
+    clock.now += 5
+    Conversation.init(client, convid='c1')
+    clock.now += 10
+    Conversation.init(client, convid='c1')
+    client.close()
+    assert stub.requests == {CONVERSATION: 2}
+
+
+def test_missing_conversation_is_cached(stub):
+    client = RealtimeAPI(conversation_cache={'negative_ttl': 30}, **client_options(stub))
+    for _ in range(3):
+        with pytest.raises(RealtimeAPIError) as info:
+            Conversation.init(client, convid='missing1')
+        assert str(info.value.status_code) == '101'
+    client.close()
+    assert stub.requests == {'GET /1.1/classes/_Conversation/missing1': 1}
+    assert client.conversation_cache.stats()['negative_hits'] == 2
+
+
+def test_member_changes_update_cache(stub):
+    client = RealtimeAPI(conversation_cache=True, **client_options(stub))
+    conversation = Conversation.init(client, convid='c1')
+    conversation.add_members(['c'])
+    conversation.remove_members(['a'])
+    assert Conversation.init(client, convid='c1').metadata['m'] == ['b', 'c']
+    client.close()
+    assert stub.requests == {CONVERSATION: 1, 'PUT /1.1/classes/_Conversation/c1': 2}
+
+
+def test_created_conversation_is_cached(stub):
+    client = RealtimeAPI(conversation_cache=True, **client_options(stub))
+    created = Conversation.init(client, name='new', m=['a'])
+    loaded = Conversation.init(client, convid=created.convid)
+    client.close()
+    assert loaded.metadata['name'] == 'new'
+    assert stub.requests == {'POST /1.1/classes/_Conversation': 1}
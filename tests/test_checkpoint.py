@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from realtime.checkpoint import Checkpoint
+
+
+def line_count(path):
+    with open(path, 'rb') as f:
+        return len(f.read().splitlines())
+
+
+def test_truncated_last_line(tmpdir):
+    path = str(tmpdir.join('job.ckpt'))
+    with Checkpoint(path) as checkpoint:
+        checkpoint.mark_done('a')
+        checkpoint.update('b', max_ts=10)
+    # 进程在写最后一行时中断
+    with open(path, 'ab') as f:
+        f.write(b'{"key": "c", "do')
+
+    with Checkpoint(path) as checkpoint:
+        assert sorted(checkpoint.keys()) == ['a', 'b']
+        checkpoint.mark_done('d')
+
+    checkpoint = Checkpoint(path)
+    assert checkpoint.is_done('a')
+    assert checkpoint.get('b') == {'max_ts': 10}
+    assert checkpoint.is_done('d')
+    assert checkpoint.get('c') is None
+
+
+def test_compacts_repeated_updates(tmpdir):
+    path = str(tmpdir.join('export.ckpt'))
+    with Checkpoint(path, compact_lines=10) as checkpoint:
+        for index in range(100):
+            checkpoint.update('c%d' % (index % 3), max_ts=index, offset=index * 10)
+    assert line_count(path) < 13
+
+    checkpoint = Checkpoint(path)
+    assert checkpoint.get('c0') == {'max_ts': 99, 'offset': 990}
+    assert checkpoint.get('c2') == {'max_ts': 98, 'offset': 980}
+
+
+def test_compacts_done_keys(tmpdir):
+    path = str(tmpdir.join('bulk.ckpt'))
+    keys = ['conv:msg%d:1' % index for index in range(5000)]
+    with Checkpoint(path, compact_lines=100) as checkpoint:
+        for key in keys:
+            checkpoint.mark_done(key)
+    assert line_count(path) < 2500
+
+    checkpoint = Checkpoint(path)
+    assert all(checkpoint.is_done(key) for key in keys)
+    assert len(checkpoint.keys()) == len(keys)
+
+
+def test_records_without_key_are_skipped(tmpdir):
+    path = str(tmpdir.join('job.ckpt'))
+    with Checkpoint(path) as checkpoint:
+        checkpoint.mark_done('a')
+    with open(path, 'ab') as f:
+        f.write(b'{"done": true}\n[1, 2]\n"text"\n{"keys": "b", "done": true}\n')
+    with Checkpoint(path) as checkpoint:
+        assert checkpoint.keys() == ['a']
+        checkpoint.mark_done('b')
+
+    checkpoint = Checkpoint(path)
+    assert sorted(checkpoint.keys()) == ['a', 'b']
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+
+import pytest
+
+from realtime.bind import RealtimeAPIError
+from realtime.client import Conversation, RealtimeAPI
+
+from conftest import client_options, StubConfig
+
+UPDATED = {'updatedAt': '2017-04-01T00:00:00.000Z'}
+
+
+def run_threads(target, args_list):
+    threads = [threading.Thread(target=target, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def member_updates(server):
+    # convid -> [(op, sorted objects)]，按请求到达的顺序
+    updates = {}
+    for entry in server.audit:
+        if entry['method'] != 'PUT':
+            continue
+        body = json.loads(entry['body'].decode('utf-8'))['m']
+        convid = entry['path'].rsplit('/', 1)[-1]
+        updates.setdefault(convid, []).append((body['__op'], sorted(body['objects'])))
+    return updates
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(audit=True)])
+def test_concurrent_adds_are_merged(stub):
+    client = RealtimeAPI(coalesce_members={'window': 5}, **client_options(stub))
+    conversation = Conversation(client, 'c1')
+    futures = []
+    run_threads(lambda index: futures.append(conversation.add_members(['u%02d' % index])),
+                [(index,) for index in range(30)])
+    assert client.flush_members(timeout=5)
+    client.close()
+    assert all(future.result() == UPDATED for future in futures)
+    assert member_updates(stub) == {'c1': [('AddUnique', ['u%02d' % index
+                                                         for index in range(30)])]}
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(audit=True)])
+def test_last_operation_wins(stub):
+    client = RealtimeAPI(coalesce_members={'window': 5}, **client_options(stub))
+    c1 = Conversation(client, 'c1')
+    c2 = Conversation(client, 'c2')
+    futures = [c1.add_members(['x', 'y']), c1.remove_members(['x', 'z']),
+               c1.add_members(['z']), c2.remove_members(['x'])]
+    assert client.flush_members(timeout=5)
+    client.close()
+    assert [future.result() for future in futures] == [UPDATED] * 4
+    assert member_updates(stub) == {
+        'c1': [('AddUnique', ['y', 'z']), ('Remove', ['x'])],
+        'c2': [('Remove', ['x'])],
+    }
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(audit=True)])
+def test_max_batch_sends_without_flush(stub):
+    client = RealtimeAPI(coalesce_members={'window': 60, 'max_batch': 10},
+                         **client_options(stub))
+    future = Conversation(client, 'c1').add_members(['u%02d' % index for index in range(25)])
+    # 缓冲达到 max_batch 时不等 window 立即发送，按 max_batch 分成多个请求
+    assert future.result(timeout=5) == UPDATED
+    client.close()
+    updates = member_updates(stub)['c1']
+    assert [len(objects) for _, objects in updates] == [10, 10, 5]
+    assert sorted(sum([objects for _, objects in updates], [])) == \
+        ['u%02d' % index for index in range(25)]
+
+
+def test_close_sends_pending_changes(stub):
+    client = RealtimeAPI(coalesce_members={'window': 60}, **client_options(stub))
+    future = Conversation(client, 'c1').add_members(['a'])
+    assert not future.done()
+    client.close()
+    assert future.result(timeout=0) == UPDATED
+    assert stub.requests == {'PUT /1.1/classes/_Conversation/c1': 1}
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(error_rate=1.0)])
+def test_request_error_is_set_on_futures(stub):
+    client = RealtimeAPI(coalesce_members={'window': 5}, **client_options(stub))
+    conversation = Conversation(client, 'c1')
+    futures = [conversation.add_members(['a']), conversation.add_members(['b', 'c'])]
+    client.flush_members(timeout=5)
+    client.close()
+    for future in futures:
+        assert isinstance(future.exception(timeout=0), RealtimeAPIError)
+    assert client.member_coalescer.requests == 1
+
+
+def test_deadline_bypasses_coalescer(stub):
+    client = RealtimeAPI(coalesce_members={'window': 60}, **client_options(stub))
+    assert Conversation(client, 'c1').add_members(['a'], deadline=5) == UPDATED
+    assert stub.requests == {'PUT /1.1/classes/_Conversation/c1': 1}
+    client.close()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import json
+import zlib
+
+import pytest
+
+from realtime.client import RealtimeAPI
+from realtime.codec import DEFAULT_CODEC, get_codec, gzip_compress
+
+from conftest import client_options, StubConfig
+
+CODECS = ['default', 'json', 'ujson', 'orjson', 'auto']
+
+PAYLOAD = {'from_peer': 'sys', 'conv_id': 'c1', 'transient': False,
+           'message': json.dumps({'_lctype': -1, '_lctext': u'你好，世界'}),
+           'list': [1, 2.5, None, True], 'nested': {'m': ['a', 'b']}}
+
+
+def load_codec(name):
+    if name in ('ujson', 'orjson'):
+        pytest.importorskip(name)
+    return get_codec(name)
+
+
+@pytest.mark.parametrize('name', CODECS)
+def test_round_trip(name):
+    codec = load_codec(name)
+    data = codec.dumps(PAYLOAD)
+    assert isinstance(data, bytes)
+    assert codec.loads(data) == PAYLOAD
+    assert json.loads(data.decode('utf-8')) == PAYLOAD
+
+
+def test_get_codec():
+    assert get_codec(None) is DEFAULT_CODEC
+    assert get_codec('default') is DEFAULT_CODEC
+    assert get_codec(DEFAULT_CODEC) is DEFAULT_CODEC
+    with pytest.raises(ValueError):
+        get_codec('yaml')
+
+
+def test_gzip_compress():
+    data = b'x' * 10000
+    compressed = gzip_compress(data)
+    assert len(compressed) < 100
+    assert zlib.decompress(compressed, 16 + zlib.MAX_WBITS) == data
+
+
+@pytest.mark.parametrize('name', CODECS)
+def test_query_message_with_codec(stub, name):
+    load_codec(name)
+    client = RealtimeAPI(codec=name, **client_options(stub))
+    default = RealtimeAPI(**client_options(stub))
+    assert client.query_message(convid='c1', limit=50) == \
+        default.query_message(convid='c1', limit=50)
+    client.close()
+    default.close()
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(gzip=True)])
+def test_gzip_response(stub):
+    client = RealtimeAPI(**client_options(stub))
+    messages = client.query_message(convid='c1', limit=100)
+    client.close()
+    assert [message['msg-id'] for message in messages] == ['c1-%d' % index
+                                                          for index in range(100)]
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(audit=True)])
+def test_gzip_request_body(stub):
+    client = RealtimeAPI(compress_threshold=1024, **client_options(stub))
+    small = {'from_peer': 'sys', 'conv_id': 'c1', 'message': 'hello'}
+    large = dict(small, message='hello ' * 1000)
+    client.send_message(json_body=small)
+    sent = stub.bytes_received
+    client.send_message(json_body=large)
+    compressed = stub.bytes_received - sent
+    client.close()
+    # 小于阈值的请求体原样发送，大的请求体 gzip 压缩后发送；stub 记录的是解压后的内容
+    assert sent == len(json.dumps(small, separators=(',', ':')))
+    assert compressed < 200
+    assert [json.loads(entry['body'].decode('utf-8')) for entry in stub.audit] == \
+        [small, large]
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import collections
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from realtime import analytics  # noqa: E402
+from realtime.client import Conversation, RealtimeAPI  # noqa: E402
+from realtime.columnar import ColumnBatch, concat_batches, write_parquet  # noqa: E402
+from realtime.message import MessagePage  # noqa: E402
+
+from conftest import client_options  # noqa: E402
+from stub_server import HISTORY_START, HISTORY_STEP  # noqa: E402
+
+HOUR = analytics.HOUR_MS
+
+
+def timestamp(index):
+    # stub 中第 index 条消息的时间戳
+    return HISTORY_START + (1000000 - index) * HISTORY_STEP
+
+
+def message(convid, sender, ts, data='hi'):
+    return {'conv-id': convid, 'from': sender, 'timestamp': ts,
+            'msg-id': '%s-%s-%d' % (convid, sender, ts), 'data': data}
+
+
+def test_batches_match_messages(stub):
+    client = RealtimeAPI(**client_options(stub))
+    conversation = Conversation(client, 'c1')
+    since = timestamp(249)
+    messages = list(conversation.iter_messages(since=since, page_size=100))
+    batches = list(conversation.iter_message_batches(since=since, page_size=100,
+                                                     batch_size=120))
+    client.close()
+    # 按整页累积，达到 batch_size 后输出
+    assert [len(batch) for batch in batches] == [200, 50]
+    batch = concat_batches(batches)
+    assert list(batch.msgid) == [item['msg-id'] for item in messages]
+    assert list(batch.timestamp) == [item['timestamp'] for item in messages]
+    assert batch.convids == ['c1']
+    assert [batch.senders[code] for code in batch.sender] == \
+        [item['from'] for item in messages]
+    assert set(batch.length) == {64}
+
+
+def test_message_page_and_dicts_build_same_batch():
+    entries = [message('c%d' % (index % 3), 'u%d' % (index % 5), 1000 - index, 'x' * index)
+               for index in range(20)]
+    from_dicts = ColumnBatch.from_messages(entries)
+    from_page = ColumnBatch.from_messages(MessagePage(entries))
+    for name in ('timestamp', 'conv', 'sender', 'msgid', 'length'):
+        assert list(getattr(from_dicts, name)) == list(getattr(from_page, name))
+    records = from_page.to_structured()
+    assert list(records['convid']) == [entry['conv-id'] for entry in entries]
+    assert list(records['from']) == [entry['from'] for entry in entries]
+    assert list(records['length']) == list(range(20))
+
+
+def test_counts_match_python(stub):
+    client = RealtimeAPI(**client_options(stub))
+    since = timestamp(999)
+    messages = list(client.iter_all_messages(since=since, page_size=500))
+    batch = concat_batches(client.iter_all_message_batches(since=since, page_size=500,
+                                                           batch_size=300))
+    client.close()
+    senders = collections.Counter(item['from'] for item in messages)
+    assert analytics.counts_by_sender(batch) == dict(senders)
+    assert list(analytics.counts_by_sender(batch).values()) == \
+        sorted(senders.values(), reverse=True)
+    assert analytics.bytes_by_sender(batch) == \
+        dict((sender, count * 64) for sender, count in senders.items())
+    assert analytics.counts_by_conversation(batch) == {'all': 1000}
+    hours = collections.Counter((item['timestamp'] + 8 * HOUR) % analytics.DAY_MS // HOUR
+                                for item in messages)
+    assert list(analytics.hourly_activity(batch, utc_offset=8)) == \
+        [hours.get(hour, 0) for hour in range(24)]
+
+
+def test_activity_series():
+    batch = ColumnBatch.from_messages([message('c1', 'a', HOUR * 5 + 1),
+                                       message('c1', 'a', HOUR * 5 + 2),
+                                       message('c1', 'b', HOUR * 7)])
+    starts, counts = analytics.activity_series(batch)
+    assert list(starts) == [HOUR * 5, HOUR * 7]
+    assert list(counts) == [2, 1]
+
+
+def test_response_gaps():
+    # 批次中的消息按时间倒序，同一对话中发送者切换时才算一次回复
+    entries = [message('c1', 'a', 100), message('c2', 'x', 90), message('c1', 'b', 70),
+               message('c1', 'b', 60), message('c2', 'x', 50), message('c1', 'a', 10),
+               message('c3', 'z', 5)]
+    gaps = analytics.response_gaps(ColumnBatch.from_messages(entries))
+    assert sorted(gaps) == ['c1']
+    assert list(gaps['c1']) == [50, 30]
+    summary = analytics.response_gap_summary(entries)
+    assert summary == {'c1': {'replies': 2, 'p50': 40.0, 'p90': 48.0}}
+    assert analytics.response_gaps([]) == {}
+
+
+def test_concat_renumbers_dictionaries():
+    first = ColumnBatch.from_messages([message('c1', 'a', 3), message('c2', 'b', 2)])
+    second = ColumnBatch.from_messages([message('c2', 'c', 1), message('c1', 'a', 0)])
+    batch = concat_batches([first, second])
+    assert [batch.convids[code] for code in batch.conv] == ['c1', 'c2', 'c2', 'c1']
+    assert [batch.senders[code] for code in batch.sender] == ['a', 'b', 'c', 'a']
+    assert len(concat_batches([])) == 0
+
+
+def test_write_parquet(tmpdir):
+    pq = pytest.importorskip('pyarrow.parquet')
+    batches = [ColumnBatch.from_messages([message('c1', 'a', 3), message('c2', 'b', 2)]),
+               ColumnBatch.from_messages([message('c3', 'a', 1)])]
+    path = str(tmpdir.join('history.parquet'))
+    assert write_parquet(batches, path) == 3
+    table = pq.read_table(path)
+    assert table.column('convid').to_pylist() == ['c1', 'c2', 'c3']
+    assert table.column('timestamp').to_pylist() == [3, 2, 1]
+    assert pq.ParquetFile(path).num_row_groups == 2
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from realtime.bind import RealtimeAPIError
+from realtime.client import Conversation, RealtimeAPI
+
+from conftest import ROOT, client_options, StubConfig
+
+
+def run_threads(target, args_list):
+    threads = [threading.Thread(target=target, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(audit=True)])
+def test_get_conversation(stub):
+    client = RealtimeAPI(**client_options(stub))
+    conversation = client.get_conversation(convid='c1')
+    client.close()
+    assert conversation['objectId'] == 'c1'
+    assert conversation['m'] == ['a', 'b']
+    # 与其他端点共用鉴权头
+    entry, = stub.audit
+    assert (entry['method'], entry['path']) == ('GET', '/1.1/classes/_Conversation/c1')
+    assert entry['app_id'] == 'stub-app-id'
+    assert entry['key'] or entry['sign']
+
+
+def test_missing_conversation(stub):
+    client = RealtimeAPI(**client_options(stub))
+    with pytest.raises(RealtimeAPIError) as info:
+        client.get_conversation(convid='missing1')
+    with pytest.raises(RealtimeAPIError):
+        Conversation.init(client, convid='missing1')
+    client.close()
+    assert info.value.status_code == 101
+    assert info.value.http_status == 404
+
+
+def test_init_loads_metadata(stub):
+    client = RealtimeAPI(**client_options(stub))
+    conversation = Conversation.init(client, convid='c1')
+    client.close()
+    assert conversation.convid == 'c1'
+    assert conversation.metadata == {'objectId': 'c1', 'name': 'stub', 'm': ['a', 'b'],
+                                     'c': 'a', 'mu': [],
+                                     'createdAt': '2017-04-01T00:00:00.000Z'}
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.2)])
+def test_concurrent_lookups_share_request(stub):
+    client = RealtimeAPI(single_flight=True, **client_options(stub))
+    results = []
+    run_threads(lambda: results.append(client.get_conversation(convid='c1')),
+                [()] * 10)
+    client.close()
+    assert len(results) == 10
+    assert all(result == results[0] for result in results)
+    assert stub.requests == {'GET /1.1/classes/_Conversation/c1': 1}
+
+
+def test_import_is_lazy():
+    # 在新的解释器中导入，不加载 leancloud 与按需使用的模块
+    modules = ('leancloud', 'concurrent.futures', 'realtime.follow', 'realtime.bulk',
+               'realtime.coalesce')
+    code = ('import sys; import realtime.client; '
+            'print(",".join(m for m in %r if m in sys.modules))' % (modules,))
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT)
+    assert output.strip() == b''
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from realtime.bind import RealtimeCancelledError, RealtimeTimeoutError
+from realtime.client import Conversation, RealtimeAPI
+from realtime.deadline import CancelToken, Deadline, as_deadline
+from realtime.retry import RetryPolicy
+
+from conftest import client_options, StubConfig
+
+
+def test_deadline_budget():
+    deadline = Deadline(10)
+    assert 9 < deadline.remaining() <= 10
+    assert deadline.request_timeout(3, 30) == (3, pytest.approx(10, abs=0.1))
+    assert deadline.child(60).expires_at == deadline.expires_at
+    assert deadline.child(1).remaining() <= 1
+    assert Deadline().remaining() is None
+    assert Deadline().request_timeout() is None
+    # 等待时间超过剩余时间时不等待，直接超时
+    start = time.time()
+    with pytest.raises(RealtimeTimeoutError):
+        Deadline(0.5).sleep(1)
+    assert time.time() - start < 0.1
+
+
+def test_cancel_token():
+    token = CancelToken()
+    calls = []
+    deadline = as_deadline(token)
+    assert deadline.token is token and deadline.remaining() is None
+    token.add_callback(lambda: calls.append('first'))
+    token.cancel('stopped by user')
+    token.cancel('again')
+    token.add_callback(lambda: calls.append('late'))
+    assert calls == ['first', 'late']
+    with pytest.raises(RealtimeCancelledError) as info:
+        deadline.check()
+    assert 'stopped by user' in str(info.value)
+    assert as_deadline(None) is None
+    assert as_deadline(deadline) is deadline
+    assert as_deadline(2).remaining() <= 2
+
+
+def test_cancel_interrupts_sleep():
+    token = CancelToken()
+    threading.Timer(0.1, token.cancel).start()
+    start = time.time()
+    with pytest.raises(RealtimeCancelledError):
+        Deadline(5, token).sleep(2)
+    assert time.time() - start < 0.5
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.5)])
+def test_request_timeout_follows_deadline(stub):
+    client = RealtimeAPI(**client_options(stub))
+    start = time.time()
+    with pytest.raises(RealtimeTimeoutError):
+        client.query_message(convid='c1', deadline=0.1)
+    elapsed = time.time() - start
+    client.close()
+    assert elapsed < 0.4
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(error_rate=1.0)])
+def test_retry_stops_at_deadline(stub):
+    client = RealtimeAPI(retry_policy=RetryPolicy(max_attempts=5, backoff=1, jitter=False),
+                         **client_options(stub))
+    start = time.time()
+    with pytest.raises(RealtimeTimeoutError):
+        client.query_message(convid='c1', deadline=0.5)
+    elapsed = time.time() - start
+    client.close()
+    # 第一次重试要等 1 秒，超过剩余时间，不再等待
+    assert elapsed < 0.4
+    assert stub.requests == {'GET /1.1/rtm/messages/history': 1}
+
+
+def test_cancelled_token_sends_nothing(stub):
+    client = RealtimeAPI(**client_options(stub))
+    token = CancelToken()
+    token.cancel()
+    with pytest.raises(RealtimeCancelledError):
+        client.send_message(json_body={'from_peer': 'sys', 'conv_id': 'c1', 'message': 'hi'},
+                            deadline=token)
+    with pytest.raises(RealtimeCancelledError):
+        Conversation.init(client, convid='c1', deadline=token)
+    client.close()
+    assert stub.requests == {}
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.05)])
+def test_pages_share_deadline(stub):
+    client = RealtimeAPI(**client_options(stub))
+    messages = []
+    start = time.time()
+    with pytest.raises(RealtimeTimeoutError):
+        for message in Conversation(client, 'c1').iter_messages(page_size=10, deadline=0.3):
+            messages.append(message)
+    elapsed = time.time() - start
+    client.close()
+    # 截止时间对所有页共享，超时前已经取到的消息照常返回
+    assert 0 < len(messages) < 100
+    assert [message['msg-id'] for message in messages] == \
+        ['c1-%d' % index for index in range(len(messages))]
+    assert elapsed < 0.6
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.05)])
+def test_cancel_stops_iteration(stub):
+    client = RealtimeAPI(**client_options(stub))
+    token = CancelToken()
+    messages = []
+    with pytest.raises(RealtimeCancelledError):
+        for message in Conversation(client, 'c1').iter_messages(page_size=10,
+                                                                deadline=token):
+            messages.append(message)
+            if len(messages) == 25:
+                token.cancel()
+    time.sleep(0.2)
+    requests = stub.requests['GET /1.1/rtm/messages/history']
+    time.sleep(0.2)
+    client.close()
+    # 已经取到的当前页照常返回，取下一页时抛出
+    assert len(messages) == 30
+    assert stub.requests['GET /1.1/rtm/messages/history'] == requests
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.3)])
+def test_broadcast_returns_completed_part(stub):
+    client = RealtimeAPI(**client_options(stub))
+    start = time.time()
+    results = client.broadcast(['c%d' % index for index in range(6)], 'sys', 'hi',
+                               workers=2, deadline=0.5)
+    elapsed = time.time() - start
+    client.close()
+    assert [result.ok for result in results] == [True, True] + [False] * 4
+    assert all(isinstance(result.error, RealtimeTimeoutError) for result in results[2:])
+    assert elapsed < 0.8
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.05)])
+def test_backfill_deadline(stub):
+    client = RealtimeAPI(**client_options(stub))
+    since = 1490000000000
+    backfill = Conversation(client, 'c1').backfill_messages(since, workers=2, page_size=10,
+                                                            deadline=0.3)
+    start = time.time()
+    with pytest.raises(RealtimeTimeoutError):
+        list(backfill)
+    client.close()
+    assert time.time() - start < 0.7
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+import pytest
+
+from realtime.bind import RealtimeAPIError
+from realtime.client import RealtimeAPI
+from realtime.dispatch import Spool
+from realtime.fanout import message_body
+from realtime.retry import RetryPolicy
+
+from conftest import client_options, StubConfig
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.01, audit=True)])
+def test_enqueue_send_delivers(stub, tmpdir):
+    spool = str(tmpdir.join('send.spool'))
+    client = RealtimeAPI(send_queue={'workers': 4, 'spool': spool}, **client_options(stub))
+    futures = [client.enqueue_send(message_body('sys', 'hello %d' % index, conv_id='c1'))
+               for index in range(50)]
+    assert client.flush_sends(timeout=10)
+    assert [future.result() for future in futures] == [{}] * 50
+    stats = client.send_dispatcher.stats()
+    assert stats['delivered'] == 50
+    assert stats['spooled'] == 0
+    client.close()
+    assert stub.requests == {'POST /1.1/rtm/messages': 50}
+
+
+def test_async_client_rejects_enqueue_send(stub):
+    pytest.importorskip('aiohttp')
+    from realtime.aio import AsyncRealtimeAPI
+
+    client = AsyncRealtimeAPI(**client_options(stub))
+    with pytest.raises(TypeError):
+        client.enqueue_send(message_body('sys', 'hello', conv_id='c1'))
+    assert client.send_dispatcher is None
+    assert stub.requests == {}
+
+
+def test_spool_compacts_with_messages_in_flight(tmpdir):
+    path = str(tmpdir.join('send.spool'))
+    spool = Spool(path, compact_size=4096)
+    # 一直没有确认的消息，模拟持续有消息在发送
+    stuck = spool.append({'conv_id': 'c0', 'message': 'stuck'})
+    for index in range(2000):
+        spool.ack(spool.append({'conv_id': 'c1', 'message': 'm%d' % index}))
+        assert os.path.getsize(path) < 2 * 4096
+    pending = spool.append({'conv_id': 'c2', 'message': 'pending'})
+    spool.close()
+
+    reopened = Spool(path)
+    assert [spool_id for spool_id, _ in reopened.recovered] == [stuck, pending]
+    reopened.close()
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(error_rate=1.0)])
+def test_retries_are_not_multiplied(stub):
+    client_policy = RetryPolicy(max_attempts=3, backoff=0, unsafe_endpoints=('send_message',))
+    queue_policy = RetryPolicy(max_attempts=2, backoff=0, unsafe_endpoints=('send_message',))
+    client = RealtimeAPI(retry_policy=client_policy,
+                         send_queue={'workers': 1, 'retry_policy': queue_policy},
+                         **client_options(stub))
+    future = client.enqueue_send(message_body('sys', 'hello', conv_id='c1'))
+    with pytest.raises(RealtimeAPIError):
+        future.result(timeout=10)
+    client.close()
+    assert stub.requests == {'POST /1.1/rtm/messages': 2}
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=2.0)])
+def test_close_timeout_is_shared_by_workers(stub):
+    client = RealtimeAPI(send_queue={'workers': 8}, **client_options(stub))
+    futures = [client.enqueue_send(message_body('sys', 'hello', conv_id='c%d' % index))
+               for index in range(8)]
+    start = time.time()
+    assert not client.send_dispatcher.close(timeout=0.3)
+    # 8 个线程都在等待响应，总共只等待 timeout 秒，而不是每个线程各等 timeout 秒
+    assert time.time() - start < 1.0
+    assert not any(future.done() for future in futures)
+    client.close()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from realtime.client import RealtimeAPI
+from realtime.export import export
+
+from conftest import ROOT, client_options, StubConfig
+
+CONVIDS = ['c1', 'c2', 'c3']
+
+# 写完 3 页后，第 4 页只写出一半就退出进程，模拟写入途中崩溃
+CRASH = '''
+import os, sys
+sys.path.insert(0, %(root)r)
+from realtime import export as module
+from realtime.client import RealtimeAPI
+
+write = module.Output.write
+pages = []
+
+def crashing_write(self, data):
+    if len(pages) == 3:
+        if self._compress is not None:
+            data = self._compress(data)
+        self.stream.write(data[:len(data) // 2])
+        self.stream.flush()
+        os._exit(1)
+    pages.append(data)
+    return write(self, data)
+
+module.Output.write = crashing_write
+client = RealtimeAPI(**%(options)r)
+module.export(client, %(output)r, convids=%(convids)r, compression=%(compression)r,
+              checkpoint=%(checkpoint)r, workers=2, page_size=100)
+'''
+
+
+def read_output(path, compression):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if compression == 'gzip':
+        data = gzip.GzipFile(fileobj=io.BytesIO(data)).read()
+    elif compression == 'zstd':
+        import zstandard
+        data = zstandard.ZstdDecompressor().stream_reader(
+            io.BytesIO(data), read_across_frames=True).read()
+    return [json.loads(line) for line in data.decode('utf-8').splitlines()]
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(history_size=250)])
+@pytest.mark.parametrize('compression', [None, 'gzip', 'zstd'])
+def test_resume_after_crash(stub, tmpdir, compression):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    output = str(tmpdir.join('history.ndjson'))
+    checkpoint = str(tmpdir.join('export.ckpt'))
+    options = client_options(stub)
+    script = CRASH % dict(root=ROOT, options=options, output=output, convids=CONVIDS,
+                          compression=compression, checkpoint=checkpoint)
+    assert subprocess.call([sys.executable, '-c', script]) == 1
+    assert os.path.getsize(output) > 0
+
+    with RealtimeAPI(**options) as client:
+        stats = export(client, output, convids=CONVIDS, compression=compression,
+                       checkpoint=checkpoint, workers=2, page_size=100)
+    assert stats['failed'] == {}
+    assert stats['conversations'] == len(CONVIDS)
+
+    messages = read_output(output, compression)
+    msgids = [message['msg-id'] for message in messages]
+    assert len(msgids) == len(set(msgids))
+    assert sorted(msgids) == sorted('%s-%d' % (convid, index)
+                                    for convid in CONVIDS for index in range(250))
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(history_size=100)])
+def test_missing_output_is_rejected(stub, tmpdir):
+    output = str(tmpdir.join('history.ndjson'))
+    checkpoint = str(tmpdir.join('export.ckpt'))
+    with RealtimeAPI(**client_options(stub)) as client:
+        export(client, output, convids=['c1'], checkpoint=checkpoint, page_size=20)
+        os.remove(output)
+        with open(output, 'wb'):
+            pass
+        with pytest.raises(ValueError):
+            export(client, output, convids=['c2'], checkpoint=checkpoint)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from realtime.client import RealtimeAPI
+
+from conftest import client_options, StubConfig
+from stub_server import HISTORY_START, HISTORY_STEP
+
+# stub 中第 0 条（最新）消息的时间戳，第 i 条早 i * HISTORY_STEP 毫秒
+NEWEST = HISTORY_START + 1000000 * HISTORY_STEP
+
+
+def wait_for(condition, timeout=5.0):
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            raise AssertionError('condition not met in %s seconds' % timeout)
+        time.sleep(0.01)
+
+
+def test_high_water_mark(stub):
+    client = RealtimeAPI(**client_options(stub))
+    delivered = []
+    since = NEWEST - 24 * HISTORY_STEP
+    follower = client.follow(['c1', 'c2'], lambda convid, messages: delivered.append(
+        (convid, messages)), since=since, min_interval=0.02, max_interval=0.05, page_size=10)
+    wait_for(lambda: all(state['polls'] >= 4 for state in follower.stats().values()))
+    follower.stop()
+    client.close()
+
+    for convid in ('c1', 'c2'):
+        batches = [messages for target, messages in delivered if target == convid]
+        # 25 条消息跨 3 页，一次轮询全部取回，按时间正序投递；之后的轮询没有新消息
+        assert len(batches) == 1
+        assert [message['msg-id'] for message in batches[0]] == \
+            ['%s-%d' % (convid, index) for index in range(24, -1, -1)]
+        stats = follower.stats()[convid]
+        assert stats['high_water_mark'] == NEWEST
+        assert stats['messages'] == 25
+        assert stats['empty_polls'] == stats['polls'] - 1
+
+
+def test_adaptive_interval(stub):
+    client = RealtimeAPI(**client_options(stub))
+    since = NEWEST - 4 * HISTORY_STEP
+    follower = client.follow(['c1'], lambda convid, messages: None, since=since,
+                             min_interval=0.02, max_interval=0.1, backoff=2, jitter=0)
+    intervals = []
+
+    def record():
+        state = follower.stats()['c1']
+        if state['polls'] > len(intervals):
+            intervals.append(state['interval'])
+        return len(intervals) >= 6
+
+    wait_for(record)
+    follower.stop()
+    client.close()
+    # 第一次轮询拿到新消息，间隔保持 min_interval，之后每次空轮询翻倍直到 max_interval
+    assert intervals[:5] == [0.02, 0.04, 0.08, 0.1, 0.1]
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(error_rate=1.0)])
+def test_failing_on_error_is_called_once(stub):
+    client = RealtimeAPI(**client_options(stub))
+    errors = []
+
+    def on_error(convid, error):
+        errors.append(error)
+        raise ValueError('on_error failed')
+
+    follower = client.follow(['c1'], lambda convid, messages: None, min_interval=0.02,
+                             max_interval=0.02, on_error=on_error)
+    wait_for(lambda: follower.stats()['c1']['errors'] >= 3)
+    follower.stop()
+    client.close()
+    assert len(errors) == follower.stats()['c1']['errors']
+
+
+def test_stop_from_callback(stub):
+    client = RealtimeAPI(**client_options(stub))
+    stopped = threading.Event()
+    holder = []
+
+    def callback(convid, messages):
+        holder[0].stop()
+        stopped.set()
+
+    holder.append(client.follow(['c1'], callback, since=NEWEST, min_interval=0.02))
+    assert stopped.wait(5)
+    holder[0].stop()
+    client.close()
+    assert holder[0].stats()['c1']['polls'] == 1
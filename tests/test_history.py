@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from realtime.client import Conversation, RealtimeAPI
+
+from conftest import client_options, StubConfig
+from stub_server import HISTORY_START, HISTORY_STEP
+
+# stub 中第 0 条（最新）消息的时间戳，第 i 条早 i * HISTORY_STEP 毫秒
+NEWEST = HISTORY_START + 1000000 * HISTORY_STEP
+
+HISTORY = 'GET /1.1/rtm/messages/history'
+
+
+def prefetch_threads():
+    return [thread for thread in threading.enumerate()
+            if thread.name == 'realtime-history-prefetch']
+
+
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_pages_until_since(stub, prefetch):
+    client = RealtimeAPI(**client_options(stub))
+    since = NEWEST - 24 * HISTORY_STEP
+    messages = list(Conversation(client, 'c1').iter_messages(
+        since=since, page_size=10, prefetch=prefetch))
+    client.close()
+    # 25 条消息跨 3 页，按时间倒序返回，第 3 页中早于 since 的消息被丢弃
+    assert [message['msg-id'] for message in messages] == \
+        ['c1-%d' % index for index in range(25)]
+    assert stub.requests == {HISTORY: 3}
+
+
+def test_pages_from_until(stub):
+    client = RealtimeAPI(**client_options(stub))
+    until = NEWEST - 5 * HISTORY_STEP
+    since = NEWEST - 14 * HISTORY_STEP
+    messages = list(Conversation(client, 'c1').iter_messages(
+        since=since, until=until, page_size=4))
+    client.close()
+    # until 不包含，since 包含
+    assert [message['msg-id'] for message in messages] == \
+        ['c1-%d' % index for index in range(6, 15)]
+    assert stub.requests == {HISTORY: 3}
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(history_size=25)])
+def test_short_last_page_ends_iteration(stub):
+    client = RealtimeAPI(**client_options(stub))
+    messages = list(Conversation(client, 'c1').iter_messages(page_size=10))
+    client.close()
+    assert len(messages) == 25
+    assert stub.requests == {HISTORY: 3}
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.1)])
+def test_prefetch_overlaps_processing(stub):
+    client = RealtimeAPI(**client_options(stub))
+    since = NEWEST - 49 * HISTORY_STEP
+    conversation = Conversation(client, 'c1')
+
+    def consume(prefetch):
+        start = time.time()
+        for index, message in enumerate(conversation.iter_messages(
+                since=since, page_size=10, prefetch=prefetch)):
+            # 每页处理 0.1 秒
+            if index % 10 == 9:
+                time.sleep(0.1)
+        return time.time() - start
+
+    sequential = consume(False)
+    prefetched = consume(True)
+    client.close()
+    # 5 页：依次请求约 1 秒，预取时请求与处理重叠，约 0.6 秒
+    assert sequential > 0.9
+    assert prefetched < sequential - 0.25
+
+
+def test_closing_generator_stops_prefetch(stub):
+    client = RealtimeAPI(**client_options(stub))
+    messages = Conversation(client, 'c1').iter_messages(page_size=10)
+    assert next(messages)['msg-id'] == 'c1-0'
+    messages.close()
+    end = time.time() + 2
+    while prefetch_threads() and time.time() < end:
+        time.sleep(0.01)
+    client.close()
+    assert prefetch_threads() == []
+    # 当前页、队列中的一页和后台线程正在放入队列的一页
+    assert stub.requests[HISTORY] <= 3
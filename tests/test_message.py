@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import base64
+import json
+
+import pytest
+
+from realtime.client import Conversation, RealtimeAPI
+from realtime.message import Message, MessagePage
+
+from conftest import client_options
+from stub_server import HISTORY_START, HISTORY_STEP
+
+ENTRY = {
+    'msg-id': 'm1',
+    'conv-id': 'c1',
+    'from': 'alice',
+    'timestamp': 1490950859958,
+    'data': json.dumps({'_lctype': -1, '_lctext': 'hello'}),
+    'to': 'c1',
+    'is-conv': True,
+    'is-room': False,
+    'bin': False,
+    'custom': 'kept',
+}
+
+
+def test_message_reads_like_dict():
+    message = Message.object_from_dictionary(ENTRY)
+    assert message['msg-id'] == 'm1'
+    assert message.get('timestamp') == 1490950859958
+    assert message.get('read-at', 0) == 0
+    assert message['custom'] == 'kept'
+    assert 'custom' in message and 'read-at' not in message
+    with pytest.raises(KeyError):
+        message['read-at']
+    assert message.to_dict() == ENTRY
+    assert not hasattr(message, '__dict__')
+
+
+def test_content_is_decoded_once():
+    message = Message.object_from_dictionary(ENTRY)
+    assert message.message_type == -1
+    assert message.content is message.content
+    binary = Message(data=base64.b64encode(b'\x00\x01').decode('ascii'), binary=True)
+    assert binary.content == b'\x00\x01'
+    assert Message(data='{not json').content == '{not json'
+
+
+def test_shared_strings_within_page():
+    entries = [dict(ENTRY, **{'msg-id': 'm%d' % index, 'conv-id': ''.join(['c', '1'])})
+               for index in range(3)]
+    messages = Message.list_from_dictionaries(entries)
+    assert messages[0].convid is messages[2].convid
+
+
+def test_page_round_trip():
+    entries = [dict(ENTRY, **{'msg-id': 'm%d' % index, 'timestamp': 1000 - index})
+               for index in range(5)]
+    entries[1].pop('custom')
+    entries[2]['bin'] = True
+    page = MessagePage(entries)
+    assert len(page) == 5 and page
+    assert not MessagePage()
+    assert page.to_list() == entries
+    assert list(page.timestamps) == [1000, 999, 998, 997, 996]
+    assert page.msgids == ['m0', 'm1', 'm2', 'm3', 'm4']
+    assert page[-1]['msg-id'] == 'm4'
+    assert [message['msg-id'] for message in page[1:3]] == ['m1', 'm2']
+    assert [message.binary for message in page] == [False, False, True, False, False]
+    assert page[0] == Message.object_from_dictionary(entries[0])
+    with pytest.raises(IndexError):
+        page[5]
+
+
+def test_query_message_models(stub):
+    client = RealtimeAPI(**client_options(stub))
+    conversation = Conversation(client, 'c1')
+    entries = conversation.query_message(limit=10)
+    messages = conversation.query_message(limit=10, return_json=False)
+    page = conversation.query_message(limit=10, compact=True)
+    client.close()
+    assert all(isinstance(message, Message) for message in messages)
+    assert isinstance(page, MessagePage)
+    assert [message.to_dict() for message in messages] == entries
+    assert page.to_list() == entries
+
+
+def test_iter_messages_compact(stub):
+    client = RealtimeAPI(**client_options(stub))
+    conversation = Conversation(client, 'c1')
+    since = HISTORY_START + (1000000 - 249) * HISTORY_STEP
+    plain = list(conversation.iter_messages(since=since, page_size=100))
+    compact = list(conversation.iter_messages(since=since, page_size=100, compact=True))
+    client.close()
+    assert len(plain) == 250
+    assert [message.to_dict() for message in compact] == plain
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import gc
+
+import pytest
+
+from realtime import ratelimit
+from realtime.bind import RealtimeRateLimitError
+from realtime.client import RealtimeAPI
+from realtime.ratelimit import RateLimiter, TokenBucket, get_rate_limiter
+
+from conftest import client_options, StubConfig
+
+
+class Clock(object):
+
+    def __init__(self, now=1500000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refill():
+    clock = Clock()
+    bucket = TokenBucket(10, burst=5, clock=clock)
+    assert [bucket.reserve() for _ in range(5)] == [0] * 5
+    # 令牌用完后按顺序排队，每个请求比前一个多等 1 / rate 秒
+    assert bucket.reserve() == pytest.approx(0.1)
+    assert bucket.reserve() == pytest.approx(0.2)
+    clock.now += 0.2
+    assert bucket.reserve() == pytest.approx(0.1)
+    # 补充的令牌不超过桶容量
+    clock.now += 60
+    assert bucket.settled()
+    assert [bucket.reserve() for _ in range(5)] == [0] * 5
+    assert bucket.reserve() > 0
+
+
+def test_endpoint_limit():
+    clock = Clock()
+    limiter = RateLimiter(100, endpoint_limits={'send_message': 2}, clock=clock)
+    assert [limiter.reserve('send_message') for _ in range(2)] == [0, 0]
+    assert limiter.reserve('send_message') == pytest.approx(0.5)
+    assert limiter.reserve('query_message') == 0
+
+
+def test_rate_limited_backoff_and_recovery():
+    clock = Clock()
+    limiter = RateLimiter(100, min_rate=10, recovery=20, clock=clock)
+    limiter.on_rate_limited({'Retry-After': '2'})
+    assert limiter.rate == 50
+    assert limiter.throttled == 1
+    # Retry-After 之内的请求都要等到暂停结束
+    assert limiter.reserve() == pytest.approx(2)
+    limiter.on_rate_limited()
+    limiter.on_rate_limited()
+    limiter.on_rate_limited()
+    assert limiter.rate == 10
+    clock.now += 10
+    for expected in (30, 50, 70, 90, 100, 100):
+        limiter.on_response({})
+        assert limiter.rate == expected
+    clock.now += 10
+    assert limiter.settled()
+
+
+def test_reset_header_uses_clock():
+    clock = Clock()
+    limiter = RateLimiter(100, clock=clock)
+    headers = {'X-RateLimit-Limit': '100', 'X-RateLimit-Remaining': '0',
+               'X-RateLimit-Reset': str(clock.now + 3)}
+    limiter.on_response(headers)
+    assert limiter.reserve() == pytest.approx(3)
+    headers['X-RateLimit-Reset'] = '5'
+    limiter.on_response(headers)
+    assert limiter.reserve() == pytest.approx(5)
+
+
+def test_low_remaining_quota_limits_tokens():
+    limiter = RateLimiter(100, clock=Clock())
+    limiter.on_response({'X-RateLimit-Limit': '100', 'X-RateLimit-Remaining': '2'})
+    assert [limiter.reserve() for _ in range(2)] == [0, 0]
+    assert limiter.reserve() > 0
+
+
+def test_conflicting_settings_are_rejected():
+    limiter = get_rate_limiter('conflict-app', 50, endpoint_limits={'send_message': 5})
+    assert get_rate_limiter('conflict-app') is limiter
+    assert get_rate_limiter('conflict-app', 50) is limiter
+    assert get_rate_limiter('conflict-app', 50.0, endpoint_limits={'send_message': 5}) \
+        is limiter
+    with pytest.raises(ValueError):
+        get_rate_limiter('conflict-app', 60)
+    with pytest.raises(ValueError):
+        get_rate_limiter('conflict-app', 50, endpoint_limits={'send_message': 6})
+    with pytest.raises(ValueError):
+        get_rate_limiter('unknown-app')
+
+
+def test_settled_limiters_are_pruned(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'PRUNE_INTERVAL', 0)
+    in_use = get_rate_limiter('prune-in-use', 10)
+    throttled = get_rate_limiter('prune-throttled', 10)
+    throttled.on_rate_limited({'Retry-After': '60'})
+    del throttled
+    get_rate_limiter('prune-idle', 10)
+    get_rate_limiter('prune-trigger', 10)
+    gc.collect()
+    assert 'prune-idle' not in ratelimit._limiters
+    assert 'prune-idle' not in ratelimit._all_limiters
+    # 仍被客户端使用的限流器只改为弱引用，再次获取时还是同一个实例
+    assert 'prune-in-use' not in ratelimit._limiters
+    assert get_rate_limiter('prune-in-use') is in_use
+    # 仍在暂停中的限流器保留，没有客户端引用也不会丢失状态
+    assert get_rate_limiter('prune-throttled').throttled == 1
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(rate_limit=10)])
+def test_server_rate_limit_backs_off(stub):
+    # 客户端限速高于 stub 的配额，超出配额的请求收到 429，之后降速并按 Retry-After 暂停
+    client = RealtimeAPI(rate_limiter=RateLimiter(100), **client_options(stub))
+    with pytest.raises(RealtimeRateLimitError):
+        for _ in range(40):
+            client.query_message(convid='c1', limit=1)
+    client.close()
+    limiter = client.rate_limiter
+    assert limiter.throttled == 1
+    assert limiter.rate == 50
+    # stub 返回 Retry-After: 1
+    assert limiter.reserve() > 0.5
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from realtime.ratelimit import get_rate_limiter
+from realtime.registry import ClientPool
+
+from conftest import StubConfig
+from stress_registry import app_credentials, audit_request, worker
+
+
+def run_threads(target, args_list):
+    threads = [threading.Thread(target=target, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.001, audit=True)])
+def test_tenants_stay_isolated(stub):
+    # benchmarks/stress_registry.py 的缩小版：应用数多于 maxsize，客户端不断被淘汰、重建
+    apps = ['iso%02d' % index for index in range(24)]
+    errors, counter = [], []
+    pool = ClientPool(app_credentials, maxsize=6, pool_maxsize=8, host=stub.host,
+                      protocol='http', rate_limit=1000)
+    run_threads(worker, [(pool, apps, 50, seed, errors, counter) for seed in range(8)])
+    stats = pool.stats()
+    limiters = [get_rate_limiter(app_id) for app_id in apps]
+    for app_id, limiter in zip(apps, limiters):
+        # 重建的客户端沿用该应用原来的限流器
+        assert pool.get(app_id).rate_limiter is limiter
+    pool.close()
+
+    problems = list(errors)
+    for entry in stub.audit:
+        problems.extend(audit_request(entry))
+    assert problems == []
+    assert len(counter) == len(stub.audit) == 8 * 50
+    assert len(set(id(limiter) for limiter in limiters)) == len(apps)
+    assert stats['evictions'] > 0
+    assert stats['size'] == stats['misses'] - stats['evictions']
+
+
+def test_rate_limit_per_app(stub):
+    # maxsize=1，两个应用的客户端交替淘汰；每个应用各自限速，互不占用配额
+    rate, calls = 20, 40
+    pool = ClientPool(app_credentials, maxsize=1, pool_maxsize=8, host=stub.host,
+                      protocol='http', rate_limit=rate)
+
+    def send(app_id, count):
+        for _ in range(count):
+            pool.get(app_id).send_message(json_body={'from_peer': 'sys', 'message': app_id,
+                                                     'conv_id': app_id + 'x0'})
+
+    start = time.time()
+    run_threads(send, [(app_id, calls // 4) for app_id in ('rate-a', 'rate-b')
+                       for _ in range(4)])
+    elapsed = time.time() - start
+    stats = pool.stats()
+    pool.close()
+
+    assert stub.requests == {'POST /1.1/rtm/messages': 2 * calls}
+    assert stats['evictions'] > 0
+    # 每个应用先用掉 rate 个突发令牌，其余按 rate 每秒发出
+    assert elapsed >= (calls - rate) / float(rate) * 0.9
+    # 两个应用共用一个限流器时需要 (2 * calls - rate) / rate 秒
+    assert elapsed < (2 * calls - rate) / float(rate) * 0.9
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from realtime.client import RealtimeAPI
+from realtime.retry import hedged_call
+
+from conftest import client_options, StubConfig
+
+
+def run_threads(target, args_list):
+    threads = [threading.Thread(target=target, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class Calls(object):
+    # 按调用顺序依次执行 actions 中的函数，记录执行的线程
+
+    def __init__(self, *actions):
+        self.actions = list(actions)
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            action = self.actions.pop(0)
+            self.threads.append(threading.current_thread())
+        return action()
+
+
+def sleep_then(seconds, value=None, error=None):
+    def _action():
+        time.sleep(seconds)
+        if error is not None:
+            raise error
+        return value
+    return _action
+
+
+def test_fast_primary_runs_on_caller_thread():
+    executor = ThreadPoolExecutor(max_workers=2)
+    calls = Calls(sleep_then(0, 'primary'))
+    assert hedged_call(executor, calls, 0.2) == 'primary'
+    time.sleep(0.3)
+    executor.shutdown()
+    assert calls.threads == [threading.current_thread()]
+
+
+def test_hedge_result_used_when_primary_fails():
+    executor = ThreadPoolExecutor(max_workers=2)
+    calls = Calls(sleep_then(0.3, error=ValueError('primary')), sleep_then(0.05, 'hedge'))
+    assert hedged_call(executor, calls, 0.1) == 'hedge'
+    executor.shutdown()
+    assert len(calls.threads) == 2
+
+
+def test_primary_error_when_both_fail():
+    executor = ThreadPoolExecutor(max_workers=2)
+    calls = Calls(sleep_then(0.2, error=ValueError('primary')),
+                  sleep_then(0, error=KeyError('hedge')))
+    with pytest.raises(ValueError):
+        hedged_call(executor, calls, 0.05)
+    executor.shutdown()
+
+
+def test_no_hedge_after_early_failure():
+    executor = ThreadPoolExecutor(max_workers=2)
+    calls = Calls(sleep_then(0, error=ValueError('primary')), sleep_then(0, 'hedge'))
+    with pytest.raises(ValueError):
+        hedged_call(executor, calls, 0.1)
+    time.sleep(0.2)
+    executor.shutdown()
+    assert len(calls.threads) == 1
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.2)])
+def test_concurrent_hedged_reads_do_not_queue(stub):
+    # 对冲线程池只有 4 个线程，主请求在调用方线程中执行，不会在线程池中排队
+    client = RealtimeAPI(hedge_percentile=95, pool_maxsize=2, **client_options(stub))
+    tracker = client.latency_tracker('query_message')
+    for _ in range(tracker.min_samples):
+        tracker.add(0.5)
+    start = time.time()
+    run_threads(lambda index: client.query_message(convid='c%d' % index, limit=5),
+                [(index,) for index in range(30)])
+    elapsed = time.time() - start
+    client.close()
+    assert stub.requests == {'GET /1.1/rtm/messages/history': 30}
+    assert elapsed < 0.45
+    # 只记录网络耗时，不包括在调用方排队的时间
+    assert max(list(tracker._samples)[tracker.min_samples:]) < 0.45
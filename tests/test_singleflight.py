@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from realtime.client import RealtimeAPI
+from realtime.registry import ClientPool
+from realtime.singleflight import SingleFlight
+
+from conftest import client_options, StubConfig
+from stress_registry import app_credentials
+
+
+def run_threads(target, args_list):
+    threads = [threading.Thread(target=target, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.3)])
+def test_concurrent_queries_are_coalesced(stub):
+    client = RealtimeAPI(single_flight=True, **client_options(stub))
+    results = []
+    run_threads(lambda: results.append(client.query_message(convid='c1', limit=5)),
+                [()] * 8)
+    client.close()
+    assert stub.requests == {'GET /1.1/rtm/messages/history': 1}
+    assert len(results) == 8
+    assert all(result == results[0] for result in results)
+    assert client.single_flight.stats()['query_message'] == {'requests': 1,
+                                                             'deduplicated': 7}
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.3)])
+def test_parameter_spellings_are_coalesced(stub):
+    # limit=5 与 limit='5'、u'c1' 与 'c1' 发出的是同一个请求
+    client = RealtimeAPI(single_flight=True, **client_options(stub))
+    run_threads(lambda limit: client.query_message(convid='c1', limit=limit),
+                [(5,), ('5',), (u'5',), (5,)])
+    client.close()
+    assert stub.requests == {'GET /1.1/rtm/messages/history': 1}
+    assert client.single_flight.stats()['query_message'] == {'requests': 1,
+                                                             'deduplicated': 3}
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.3, audit=True)])
+def test_shared_flight_is_per_app(stub):
+    flight = SingleFlight()
+    pool = ClientPool(app_credentials, host=stub.host, protocol='http', single_flight=flight)
+    results = {}
+
+    def query(app_id):
+        results.setdefault(app_id, []).append(
+            pool.get(app_id).query_message(convid='c1', limit=5))
+
+    run_threads(query, [('app1',), ('app2',)] * 4)
+    pool.close()
+    assert sorted(entry['app_id'] for entry in stub.audit) == ['app1', 'app2']
+    assert flight.stats()['query_message'] == {'requests': 2, 'deduplicated': 6}
+
+
+def test_leader_base_exception_reaches_waiters():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    class Interrupted(BaseException):
+        pass
+
+    def leader():
+        def func():
+            started.set()
+            release.wait()
+            raise Interrupted()
+        try:
+            flight.do('query_message', 'key', func)
+        except Interrupted as e:
+            errors.append(e)
+
+    def waiter():
+        try:
+            flight.do('query_message', 'key', lambda: ('content', 'raw'))
+        except Interrupted as e:
+            errors.append(e)
+
+    leader_thread = threading.Thread(target=leader)
+    leader_thread.start()
+    started.wait()
+    waiters = [threading.Thread(target=waiter) for _ in range(3)]
+    for thread in waiters:
+        thread.start()
+    while flight.stats()['query_message']['deduplicated'] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader_thread] + waiters:
+        thread.join()
+    assert len(errors) == 4
+    assert all(error is errors[0] for error in errors)
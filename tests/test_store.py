@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from realtime.client import RealtimeAPI
+from realtime.store import HistoryMirror
+
+from conftest import client_options, StubConfig
+from stub_server import HISTORY_START, HISTORY_STEP
+
+HISTORY = 'GET /1.1/rtm/messages/history'
+
+
+def timestamp(index):
+    # stub 中第 index 条消息的时间戳
+    return HISTORY_START + (1000000 - index) * HISTORY_STEP
+
+
+class Present(object):
+    # 把 stub 的历史截止到 newest 条之前，模拟之后才产生的新消息
+
+    def __init__(self, client, newest):
+        self.client = client
+        self.newest = newest
+
+    def query_message(self, max_ts=None, **kwargs):
+        if max_ts is None:
+            max_ts = timestamp(self.newest - 1)
+        return self.client.query_message(max_ts=max_ts, **kwargs)
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(history_size=120)])
+def test_sync_is_incremental(stub):
+    client = RealtimeAPI(**client_options(stub))
+    present = Present(client, newest=30)
+    mirror = HistoryMirror(present, page_size=50)
+    assert mirror.sync('c1') == 90
+    assert stub.requests == {HISTORY: 2}
+    assert mirror.sync_state('c1') == (timestamp(30), 'c1-30')
+
+    # 没有新消息：只取一页，上次同步的最后一条被忽略
+    assert mirror.sync('c1') == 0
+    assert stub.requests == {HISTORY: 3}
+
+    present.newest = 0
+    assert mirror.sync('c1') == 30
+    assert stub.requests == {HISTORY: 4}
+    assert mirror.sync_state('c1') == (timestamp(0), 'c1-0')
+    client.close()
+    assert mirror.count('c1') == 120
+
+
+def test_since_bounds_first_sync(stub):
+    client = RealtimeAPI(**client_options(stub))
+    mirror = HistoryMirror(client, page_size=100)
+    assert mirror.sync('c1', since=timestamp(249)) == 250
+    client.close()
+    assert stub.requests == {HISTORY: 3}
+
+
+def test_queries_match_server(stub):
+    client = RealtimeAPI(**client_options(stub))
+    mirror = HistoryMirror(client)
+    for convid in ('c1', 'c2'):
+        mirror.sync(convid, since=timestamp(99))
+    server = client.query_message(convid='c1', limit=20)
+    cursor = server[-1]
+    next_page = client.query_message(convid='c1', max_ts=cursor['timestamp'],
+                                     msgid=cursor['msg-id'], limit=20)
+    client.close()
+    requests = stub.requests[HISTORY]
+    assert mirror.query_message('c1', limit=20) == server
+    assert mirror.query_message('c1', max_ts=cursor['timestamp'], msgid=cursor['msg-id'],
+                                limit=20) == next_page
+    assert stub.requests[HISTORY] == requests
+    assert sorted(mirror.conversations()) == ['c1', 'c2']
+    assert mirror.count() == 200
+    reversed_page = mirror.query_message('c1', max_ts=timestamp(10), limit=3, reversed=True)
+    assert [message['msg-id'] for message in reversed_page] == ['c1-9', 'c1-8', 'c1-7']
+    assert [message.msgid for message in mirror.query(from_peer='user0', convid='c2',
+                                                      return_json=False)] == \
+        ['c2-%d' % index for index in range(0, 100, 17)]
+
+
+def test_failed_sync_is_retried(stub):
+    client = RealtimeAPI(**client_options(stub))
+    calls = []
+
+    class Failing(object):
+        def query_message(self, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 2:
+                raise IOError('connection reset')
+            return client.query_message(**kwargs)
+
+    mirror = HistoryMirror(Failing(), page_size=10)
+    with pytest.raises(IOError):
+        mirror.sync('c1', since=timestamp(29))
+    # 中途失败时不记录同步状态，已保存的第一页在重试时按主键去重
+    assert mirror.sync_state('c1') is None
+    assert mirror.count('c1') == 10
+    assert mirror.sync('c1', since=timestamp(29)) == 20
+    client.close()
+    assert mirror.count('c1') == 30
+    assert mirror.sync_state('c1') == (timestamp(0), 'c1-0')
+
+
+def test_state_survives_reopen(stub, tmpdir):
+    path = str(tmpdir.join('history.db'))
+    client = RealtimeAPI(**client_options(stub))
+    with HistoryMirror(client, path, page_size=100) as mirror:
+        mirror.sync_all(since=timestamp(49))
+        mirror.sync_from('bob', since=timestamp(9))
+    with HistoryMirror(client, path, page_size=100) as mirror:
+        assert mirror.sync_state('*') == (timestamp(0), 'all-0')
+        assert mirror.sync_state('from:bob') == (timestamp(0), 'all-0')
+        assert mirror.count() == 50
+        assert mirror.sync_all() == 0
+    client.close()
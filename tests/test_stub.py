@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from realtime.bind import RealtimeAPIError, RealtimeClientError, RealtimeRateLimitError
+from realtime.client import RealtimeAPI
+
+import run
+from conftest import client_options, StubConfig
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(error_rate=1.0)])
+def test_injected_errors(stub):
+    client = RealtimeAPI(**client_options(stub))
+    with pytest.raises(RealtimeAPIError) as info:
+        client.query_message(convid='c1', limit=1)
+    client.close()
+    assert info.value.status_code == 1
+    assert info.value.http_status == 500
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(garbage_rate=1.0)])
+def test_injected_garbage(stub):
+    client = RealtimeAPI(**client_options(stub))
+    with pytest.raises(RealtimeClientError) as info:
+        client.query_message(convid='c1', limit=1)
+    client.close()
+    assert info.value.status_code == 502
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(rate_limit=5)])
+def test_rate_limit_window(stub):
+    client = RealtimeAPI(**client_options(stub))
+    allowed = limited = 0
+    for _ in range(20):
+        try:
+            client.query_message(convid='c1', limit=1)
+            allowed += 1
+        except RealtimeRateLimitError as e:
+            assert e.http_status == 429
+            limited += 1
+    client.close()
+    # 固定的 1 秒窗口，20 个请求最多跨过一次窗口边界
+    assert 5 <= allowed <= 10
+    assert allowed + limited == 20
+    assert client.x_ratelimit == '5'
+    assert stub.requests == {'GET /1.1/rtm/messages/history': 20}
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.1)])
+def test_injected_latency(stub):
+    client = RealtimeAPI(**client_options(stub))
+    start = time.time()
+    client.send_message(json_body={'from_peer': 'sys', 'conv_id': 'c1', 'message': 'hello'})
+    elapsed = time.time() - start
+    client.close()
+    assert 0.1 <= elapsed < 0.5
+
+
+def test_suite_counts_errors():
+    results = run.run_suite(['query_message', 'send_message'], [1, 4], 40,
+                            StubConfig(error_rate=0.5))
+    assert [(result['endpoint'], result['concurrency']) for result in results] == \
+        [('query_message', 1), ('send_message', 1), ('query_message', 4), ('send_message', 4)]
+    for result in results:
+        assert 0 < result['errors'] < result['calls']
+        assert result['calls_per_sec'] > 0
+        assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
+
+
+def test_regressions_against_baseline():
+    baseline = [{'endpoint': 'query_message', 'concurrency': 8,
+                 'calls_per_sec': 1000.0, 'p99_ms': 10.0}]
+    slower = [{'endpoint': 'query_message', 'concurrency': 8,
+               'calls_per_sec': 850.0, 'p99_ms': 10.5}]
+    tail = [{'endpoint': 'query_message', 'concurrency': 8,
+             'calls_per_sec': 1000.0, 'p99_ms': 12.0}]
+    assert run.regressions(slower, baseline, 10) == ['query_message@8']
+    assert run.regressions(tail, baseline, 10) == ['query_message@8']
+    assert run.regressions(baseline, baseline, 10) == []
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+pytest.importorskip('httpx')
+pytest.importorskip('h2')
+
+from realtime.client import RealtimeAPI  # noqa: E402
+from realtime.instrumentation import Instrumentation  # noqa: E402
+from realtime.transport import HTTP2Transport  # noqa: E402
+
+from conftest import client_options, StubConfig  # noqa: E402
+
+
+def run_threads(target, args_list):
+    threads = [threading.Thread(target=target, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.1, audit=True)])
+def test_h2c_multiplexes_requests(stub):
+    client = RealtimeAPI(transport='h2c', pool_maxsize=2, pool_block=True,
+                         **client_options(stub))
+    results = []
+    run_threads(lambda index: results.append(
+        client.query_message(convid='c%d' % index, limit=3)), [(index,) for index in range(20)])
+    sent = client.send_message(json_body={'from_peer': 'sys', 'conv_id': 'c1',
+                                          'message': 'hello'})
+    assert isinstance(client.session, HTTP2Transport)
+    client.close()
+    assert sent == {}
+    assert sorted(result[0]['conv-id'] for result in results) == \
+        sorted('c%d' % index for index in range(20))
+    assert stub.requests == {'GET /1.1/rtm/messages/history': 20,
+                             'POST /1.1/rtm/messages': 1}
+    assert stub.connections <= 2
+    assert all(entry['key'] == 'stub-app-id-master,master' for entry in stub.audit
+               if entry['method'] == 'GET')
+
+
+@pytest.mark.parametrize('stub_config', [StubConfig(latency=0.2)])
+@pytest.mark.parametrize('pool_block, connections', [(True, 2), (False, 8)])
+def test_pool_block(stub, pool_block, connections):
+    # 'http2' 对 http:// 地址使用 HTTP/1.1，每个连接同一时间只有一个请求
+    client = RealtimeAPI(transport='http2', pool_maxsize=2, pool_block=pool_block,
+                         **client_options(stub))
+    run_threads(lambda index: client.query_message(convid='c%d' % index, limit=1),
+                [(index,) for index in range(8)])
+    client.close()
+    assert stub.requests == {'GET /1.1/rtm/messages/history': 8}
+    assert stub.connections == connections
+
+
+def test_connect_timing(stub):
+    timings = []
+    instrumentation = Instrumentation(after_request=[lambda info: timings.append(
+        dict(info.timings))])
+    client = RealtimeAPI(transport='h2c', instrumentation=instrumentation,
+                         **client_options(stub))
+    client.query_message(convid='c1', limit=1)
+    client.query_message(convid='c1', limit=1)
+    client.close()
+    # 第一个请求新建连接，第二个复用
+    assert timings[0]['connect'] > 0
+    assert 'connect' not in timings[1]
+    assert all(timing['ttfb'] > 0 for timing in timings)